@@ -0,0 +1,116 @@
+import re
+from typing import Dict, List, Type
+
+# 常见英文停用词 (只对拉丁文字生效)
+ENGLISH_STOP_WORDS = frozenset("""
+a an and are as at be but by for from has have he her his i if in into is it its
+me my no not of on or our she so than that the their them then there these they
+this to was we were what when where which who will with you your
+""".split())
+
+# 单独出现时没有检索价值的中文虚词
+CJK_STOP_CHARS = frozenset("的了是在和与及或也而就都把被之其这那个")
+
+# CJK 统一表意文字 (含扩展 A) 和兼容区
+_CJK_RANGES = "㐀-䶿一-鿿豈-﫿"
+_TOKEN_RE = re.compile(f"([{_CJK_RANGES}]+)|([0-9A-Za-zÀ-ɏ]+(?:['_][0-9A-Za-z]+)*)")
+
+
+class Analyzer:
+    """
+    分词器基类。关键字索引在建索引和查询时使用同一个 Analyzer，
+    name 会写入索引元数据，换分词器时索引需要重建。
+    """
+
+    name = "base"
+
+    def tokenize(self, text: str) -> List[str]:
+        raise NotImplementedError
+
+    def __call__(self, text: str) -> List[str]:
+        return self.tokenize(text)
+
+
+class WhitespaceAnalyzer(Analyzer):
+    """
+    按空白切分，等价于 BM25Retriever 的默认预处理。
+    对中文来说一整句往往就是一个 token，仅作兼容和基准对照。
+    """
+
+    name = "whitespace"
+
+    def tokenize(self, text: str) -> List[str]:
+        return text.split()
+
+
+def _latin_tokens(word: str, stop_words=ENGLISH_STOP_WORDS) -> List[str]:
+    word = word.lower()
+    return [] if word in stop_words else [word]
+
+
+class CJKBigramAnalyzer(Analyzer):
+    """
+    CJK 文本切成字符 bigram (单字片段保留单字)，拉丁文字转小写并去停用词。
+    不依赖词典，适合中英混合语料。
+    """
+
+    name = "cjk_bigram"
+
+    def tokenize(self, text: str) -> List[str]:
+        tokens = []
+        for cjk, latin in _TOKEN_RE.findall(text):
+            if cjk:
+                if len(cjk) == 1:
+                    if cjk not in CJK_STOP_CHARS:
+                        tokens.append(cjk)
+                else:
+                    tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+            else:
+                tokens.extend(_latin_tokens(latin))
+        return tokens
+
+
+class JiebaAnalyzer(Analyzer):
+    """
+    基于 jieba 词典分词 (搜索引擎模式)。jieba 为可选依赖: pip install jieba
+    """
+
+    name = "jieba"
+
+    def __init__(self):
+        try:
+            import jieba
+        except ImportError as e:
+            raise ImportError("使用 jieba 分词需要先安装: pip install jieba") from e
+        self._jieba = jieba
+
+    def tokenize(self, text: str) -> List[str]:
+        tokens = []
+        for word in self._jieba.cut_for_search(text):
+            word = word.strip()
+            if not word:
+                continue
+            if _TOKEN_RE.fullmatch(word) is None:
+                # 标点、符号等
+                continue
+            if word[0].isascii():
+                tokens.extend(_latin_tokens(word))
+            elif word not in CJK_STOP_CHARS:
+                tokens.append(word)
+        return tokens
+
+
+ANALYZERS: Dict[str, Type[Analyzer]] = {
+    WhitespaceAnalyzer.name: WhitespaceAnalyzer,
+    CJKBigramAnalyzer.name: CJKBigramAnalyzer,
+    JiebaAnalyzer.name: JiebaAnalyzer,
+}
+
+
+def get_analyzer(name: str) -> Analyzer:
+    """
+    按名称创建分词器: "whitespace" / "cjk_bigram" / "jieba"
+    """
+    if name not in ANALYZERS:
+        raise ValueError(f"未知的分词器: {name}，可选: {', '.join(ANALYZERS)}")
+    return ANALYZERS[name]()
@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """
+    语义答案缓存: 对相同或近似的问题直接返回之前的回答，省掉检索和 LLM 调用。
+
+    - 先按 scope 精确匹配 (检索模式、k、模型、知识库版本等)，再在同一 scope 内
+      按问题 embedding 的余弦相似度查找，相似度 >= threshold 视为命中
+    - 知识库版本是 scope 的一部分，入库 / 删除 / 清空后旧条目自然失效
+    - 条目超过 ttl_seconds 过期；总数超过 max_entries 时按 LRU 淘汰
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600.0, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self._lock = threading.Lock()
+        # entry_id -> entry，按最近使用排序 (末尾最新)
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        # scope -> [entry_id]，查找时只与同 scope 的条目比较
+        self._by_scope: Dict[Hashable, List[int]] = {}
+        self._next_id = 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm else v
+
+    def lookup(self, scope: Hashable, query_vector) -> Optional[Dict[str, Any]]:
+        """
+        返回命中的条目 (含 answer / source_documents / mode / similarity / seconds_saved)，未命中返回 None
+        """
+        if not self.max_entries:
+            return None
+        query = self._normalize(query_vector)
+        now = time.time()
+        with self._lock:
+            ids = self._by_scope.get(scope, [])
+            expired = [i for i in ids if now - self._entries[i]["created_at"] > self.ttl_seconds]
+            for entry_id in expired:
+                self._remove(entry_id)
+            ids = self._by_scope.get(scope, [])
+            if ids:
+                matrix = np.stack([self._entries[i]["vector"] for i in ids])
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_id = ids[best]
+                    entry = self._entries[entry_id]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    self.seconds_saved += entry["cost_seconds"]
+                    return {
+                        "answer": entry["answer"],
+                        "source_documents": list(entry["source_documents"]),
+                        "mode": entry["mode"],
+                        "similarity": float(scores[best]),
+                        "seconds_saved": entry["cost_seconds"],
+                    }
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        scope: Hashable,
+        query_vector,
+        answer: str,
+        source_documents: List,
+        mode: str,
+        cost_seconds: float
+    ):
+        """
+        cost_seconds: 生成这个回答花费的时间 (检索 + LLM)，命中时计入节省的延迟
+        """
+        if not self.max_entries:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "scope": scope,
+                "vector": self._normalize(query_vector),
+                "answer": answer,
+                "source_documents": list(source_documents),
+                "mode": mode,
+                "cost_seconds": cost_seconds,
+                "created_at": time.time(),
+            }
+            self._by_scope.setdefault(scope, []).append(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_id: int):
+        # 调用方需持有 self._lock
+        entry = self._entries.pop(entry_id)
+        ids = self._by_scope[entry["scope"]]
+        ids.remove(entry_id)
+        if not ids:
+            del self._by_scope[entry["scope"]]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_scope.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "seconds_saved": self.seconds_saved,
+            "entries": len(self),
+            "max_entries": self.max_entries,
+        }
+
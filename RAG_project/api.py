@@ -0,0 +1,397 @@
+"""
+无界面的异步 HTTP API，与 Streamlit 应用共用同一个 RAGManager 引擎。
+
+    uvicorn api:create_app --factory --port 8000
+    # 或: python api.py --port 8000 --db-dir ./chroma_db
+
+接口:
+    GET    /health
+    GET    /documents                    已入库文档列表
+    DELETE /documents?source=...         删除文档
+    POST   /ingest                       提交后台入库任务 (服务器本地路径)，返回 202 + job
+    GET    /jobs, /jobs/{job_id}         入库任务状态
+    POST   /retrieve                     只检索，不调用 LLM
+    (/retrieve、/chat、/chat/batch 都接受 "filters": {"sources", "file_types", "pages", "ingested_after", "ingested_before"})
+
+多知识库 (create_app(knowledge_bases=KnowledgeBaseManager(...))，或设置 RAG_KB_ROOT / --kb-root):
+    GET    /kbs                          知识库列表
+    POST   /kbs                          新建知识库 {"name": ...}
+    DELETE /kbs/{name}                   删除知识库
+    POST   /kbs/{name}/clear             清空知识库
+    其余接口用 "kb" (请求体字段，GET / DELETE 为查询参数) 指定知识库，默认 "default"
+    POST   /chat                         对话；"stream": true 时返回 SSE (sources / token / done 事件)
+    POST   /chat/batch                   批量对话，结果与 queries 顺序一致
+
+引擎方法都是同步且可能占用 CPU (embedding)，一律放到独立线程池执行，事件循环不被阻塞；
+检索与对话请求受 max_concurrency 限制，排队超过 queue_timeout 秒返回 503。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Tuple
+
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from langchain_core.documents import Document
+from pydantic import BaseModel, ConfigDict, Field
+
+from jobs import IngestionJobManager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_QUEUE_TIMEOUT = 30.0
+
+
+class KnowledgeBaseRequest(BaseModel):
+    name: str
+
+
+class IngestRequest(BaseModel):
+    paths: List[str]
+    kb: Optional[str] = None
+    chunk_size: int = 500
+    chunk_overlap: int = 50
+    split_method: str = "recursive"
+    workers: Optional[int] = None
+    embed_batch_size: int = 256
+
+
+class SearchFilters(BaseModel):
+    """
+    检索过滤条件，含义见 search_filters；未知字段返回 422
+    """
+    model_config = ConfigDict(extra="forbid")
+
+    sources: Optional[List[str]] = None
+    file_types: Optional[List[str]] = None
+    pages: Optional[Tuple[Optional[int], Optional[int]]] = None
+    ingested_after: Optional[float] = None
+    ingested_before: Optional[float] = None
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return self.model_dump(exclude_none=True) or None
+
+
+class RetrieveRequest(BaseModel):
+    query: str
+    kb: Optional[str] = None
+    search_type: Literal["Vector", "BM25", "Hybrid"] = "Vector"
+    k: int = Field(3, ge=1)
+    fetch_k: Optional[int] = None
+    weights: List[float] = Field(default_factory=lambda: [0.5, 0.5])
+    filters: Optional[SearchFilters] = None
+
+
+class ChatRequest(BaseModel):
+    query: str
+    kb: Optional[str] = None
+    api_key: str = ""
+    base_url: str = ""
+    model_name: str = "glm-4-flash"
+    search_type: Literal["Vector", "BM25", "Hybrid"] = "Vector"
+    k: int = Field(3, ge=1)
+    fetch_k: Optional[int] = None
+    weights: List[float] = Field(default_factory=lambda: [0.5, 0.5])
+    filters: Optional[SearchFilters] = None
+    use_cache: bool = True
+    stream: bool = False
+
+
+class ChatBatchRequest(BaseModel):
+    queries: List[str]
+    kb: Optional[str] = None
+    api_key: str = ""
+    base_url: str = ""
+    model_name: str = "glm-4-flash"
+    search_type: Literal["Vector", "BM25", "Hybrid"] = "Vector"
+    k: int = Field(3, ge=1)
+    fetch_k: Optional[int] = None
+    weights: List[float] = Field(default_factory=lambda: [0.5, 0.5])
+    filters: Optional[SearchFilters] = None
+    use_cache: bool = True
+    max_concurrency: int = Field(4, ge=1)
+
+
+def _filters(request) -> Optional[Dict[str, Any]]:
+    return request.filters.to_dict() if request.filters is not None else None
+
+
+def serialize_doc(doc: Document) -> Dict[str, Any]:
+    return {"content": doc.page_content, "metadata": doc.metadata}
+
+
+def _serialize_event(event: Dict[str, Any]) -> Dict[str, Any]:
+    if "source_documents" in event:
+        event = {**event, "source_documents": [serialize_doc(d) for d in event["source_documents"]]}
+    return event
+
+
+def create_app(
+    rag=None,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    queue_timeout: float = DEFAULT_QUEUE_TIMEOUT,
+    job_manager: Optional[IngestionJobManager] = None,
+    knowledge_bases=None
+) -> FastAPI:
+    """
+    Args:
+        rag: RAGManager 实例；rag 与 knowledge_bases 都为 None 时，设置了 RAG_KB_ROOT 环境变量
+             则在该目录下创建 KnowledgeBaseManager，否则按 RAG_DB_DIR (默认 ./chroma_db) 创建 RAGManager
+        max_concurrency: 同时执行的检索 / 对话请求数上限 (也是工作线程数)
+        queue_timeout: 请求等待执行槽位的最长时间，超时返回 503
+        knowledge_bases: KnowledgeBaseManager，多知识库模式，请求中的 "kb" 选择知识库
+    """
+    if rag is None and knowledge_bases is None:
+        from rag_engine import RAGManager, env_options
+        if os.environ.get("RAG_KB_ROOT"):
+            from knowledge_bases import KnowledgeBaseManager
+            knowledge_bases = KnowledgeBaseManager(os.environ["RAG_KB_ROOT"], **env_options())
+        else:
+            rag = RAGManager(os.environ.get("RAG_DB_DIR", "./chroma_db"), **env_options())
+    if knowledge_bases is not None:
+        from knowledge_bases import DEFAULT_KB
+        knowledge_bases.create(DEFAULT_KB)
+    metrics = knowledge_bases.metrics if knowledge_bases is not None else rag.metrics
+    own_jobs = job_manager is None
+    jobs = job_manager or IngestionJobManager(knowledge_bases if knowledge_bases is not None else rag)
+    executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="rag-api")
+    # 信号量在首个请求时于事件循环内创建
+    state: Dict[str, asyncio.Semaphore] = {}
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        yield
+        if own_jobs:
+            jobs.shutdown(wait=False)
+        executor.shutdown(wait=False)
+
+    app = FastAPI(title="VisRAG API", lifespan=lifespan)
+    app.state.rag = rag
+    app.state.knowledge_bases = knowledge_bases
+    app.state.jobs = jobs
+
+    async def run(fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, lambda: fn(*args, **kwargs))
+
+    @asynccontextmanager
+    async def slot():
+        semaphore = state.get("semaphore")
+        if semaphore is None:
+            semaphore = state["semaphore"] = asyncio.Semaphore(max_concurrency)
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=queue_timeout)
+        except asyncio.TimeoutError:
+            metrics.inc("rag_api_rejected_total")
+            raise HTTPException(status_code=503, detail="too many concurrent requests", headers={"Retry-After": "1"})
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    def kb_name(kb: Optional[str]) -> Optional[str]:
+        if knowledge_bases is None:
+            if kb is not None:
+                raise HTTPException(status_code=404, detail="multiple knowledge bases are not enabled")
+            return None
+        return kb or DEFAULT_KB
+
+    async def rag_for(kb: Optional[str]):
+        name = kb_name(kb)
+        if name is None:
+            return rag
+        try:
+            # 可能要关闭最久未用的知识库 (等待其写锁)，放到工作线程中
+            return await run(knowledge_bases.get, name)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"knowledge base not found: {name}")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    def require_kbs():
+        if knowledge_bases is None:
+            raise HTTPException(status_code=404, detail="multiple knowledge bases are not enabled")
+        return knowledge_bases
+
+    @app.get("/kbs")
+    async def list_kbs():
+        return await run(require_kbs().list)
+
+    @app.post("/kbs", status_code=201)
+    async def create_kb(request: KnowledgeBaseRequest):
+        kbs = require_kbs()
+        try:
+            await run(kbs.create, request.name)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"name": request.name}
+
+    @app.delete("/kbs/{name}")
+    async def delete_kb(name: str):
+        kbs = require_kbs()
+        if jobs.active(kb=name):
+            raise HTTPException(status_code=409, detail="ingestion job in progress")
+        try:
+            await run(kbs.delete, name)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"knowledge base not found: {name}")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"deleted": name}
+
+    @app.post("/kbs/{name}/clear")
+    async def clear_kb(name: str):
+        require_kbs()
+        if jobs.active(kb=name):
+            raise HTTPException(status_code=409, detail="ingestion job in progress")
+        target = await rag_for(name)
+        await run(target.clear_database)
+        return {"cleared": name}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "jobs_active": jobs.active()}
+
+    @app.get("/documents")
+    async def list_documents(kb: Optional[str] = None):
+        target = await rag_for(kb)
+        return await run(target.get_all_documents_metadata)
+
+    @app.delete("/documents")
+    async def delete_document(source: str = Query(...), kb: Optional[str] = None):
+        target = await rag_for(kb)
+        if jobs.active(kb=kb_name(kb)):
+            raise HTTPException(status_code=409, detail="ingestion job in progress")
+        await run(target.delete_document, source)
+        return {"deleted": source}
+
+    @app.post("/ingest", status_code=202)
+    async def ingest(request: IngestRequest):
+        missing = [p for p in request.paths if not os.path.exists(p)]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"paths not found: {missing}")
+        await rag_for(request.kb)
+        params = request.model_dump()
+        params["kb"] = kb_name(params["kb"])
+        if params["kb"] is None:
+            del params["kb"]
+        job_id = jobs.submit(
+            params.pop("paths"), params.pop("chunk_size"), params.pop("chunk_overlap"), **params
+        )
+        return jobs.get(job_id)
+
+    @app.get("/jobs")
+    async def list_jobs():
+        return jobs.list()
+
+    @app.get("/jobs/{job_id}")
+    async def get_job(job_id: str):
+        job = jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="job not found")
+        return job
+
+    @app.post("/retrieve")
+    async def retrieve(request: RetrieveRequest):
+        target = await rag_for(request.kb)
+        async with slot():
+            docs = await run(
+                target.retrieve, request.query, search_type=request.search_type,
+                k=request.k, fetch_k=request.fetch_k, weights=request.weights, filters=_filters(request)
+            )
+        return {"documents": [serialize_doc(d) for d in docs]}
+
+    @app.post("/chat")
+    async def chat(request: ChatRequest):
+        kwargs = dict(
+            api_key=request.api_key, base_url=request.base_url, model_name=request.model_name,
+            search_type=request.search_type, k=request.k, fetch_k=request.fetch_k,
+            hybrid_weights=request.weights, use_cache=request.use_cache, filters=_filters(request)
+        )
+        target = await rag_for(request.kb)
+        if request.stream:
+            return await _chat_stream(target, request.query, kwargs)
+        async with slot():
+            result = await run(target.chat, request.query, **kwargs)
+        if "error" in result:
+            return JSONResponse(status_code=400, content={"detail": result["error"]})
+        return _serialize_event(result)
+
+    @app.post("/chat/batch")
+    async def chat_batch(request: ChatBatchRequest):
+        # 整批只占一个槽位，批内 LLM 并发由 max_concurrency 控制
+        target = await rag_for(request.kb)
+        async with slot():
+            result = await run(
+                target.chat_batch, request.queries, api_key=request.api_key, base_url=request.base_url,
+                model_name=request.model_name, search_type=request.search_type, k=request.k,
+                fetch_k=request.fetch_k, hybrid_weights=request.weights, use_cache=request.use_cache,
+                max_concurrency=request.max_concurrency, filters=_filters(request)
+            )
+        return {"results": [_serialize_event(r) for r in result["results"]], "stats": result["stats"]}
+
+    async def _chat_stream(target, query: str, kwargs: Dict[str, Any]) -> StreamingResponse:
+        # 先拿到槽位再开始响应，这样排队超时仍能返回 503 而不是一个空的事件流
+        cm = slot()
+        await cm.__aenter__()
+
+        async def events() -> AsyncIterator[bytes]:
+            gen = target.chat_stream(query, **kwargs)
+            try:
+                while True:
+                    # 同步生成器的每一步 (检索、等待下一个 token) 都在工作线程中执行
+                    event = await run(next, gen, None)
+                    if event is None:
+                        break
+                    data = json.dumps(_serialize_event(event), ensure_ascii=False, default=str)
+                    yield f"event: {event['type']}\ndata: {data}\n\n".encode("utf-8")
+            except Exception as e:
+                logger.exception("chat stream failed")
+                yield f"event: error\ndata: {json.dumps({'error': repr(e)}, ensure_ascii=False)}\n\n".encode("utf-8")
+            finally:
+                # 客户端断开时关闭生成器，进而关闭底层 LLM 流式请求
+                await run(gen.close)
+                await cm.__aexit__(None, None, None)
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--db-dir", default=os.environ.get("RAG_DB_DIR", "./chroma_db"))
+    parser.add_argument("--kb-root", default=os.environ.get("RAG_KB_ROOT"),
+                        help="多知识库模式: 每个知识库是该目录下的一个子目录")
+    parser.add_argument("--max-open-kbs", type=int, default=4, help="同时打开的知识库数上限 (LRU)")
+    parser.add_argument("--vector-backend", default=os.environ.get("RAG_VECTOR_BACKEND", "chroma"))
+    parser.add_argument("--embedding-backend", default=os.environ.get("RAG_EMBEDDING_BACKEND", "torch"),
+                        help="embedding 推理后端: torch / onnx / onnx-int8")
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY)
+    parser.add_argument("--queue-timeout", type=float, default=DEFAULT_QUEUE_TIMEOUT)
+    args = parser.parse_args()
+
+    import uvicorn
+    from rag_engine import RAGManager, env_options
+
+    logging.basicConfig(level=os.environ.get("RAG_LOG_LEVEL", "WARNING").upper())
+    options = {**env_options(), "vector_backend": args.vector_backend}
+    options["embedding_options"] = {**options["embedding_options"], "backend": args.embedding_backend}
+    if args.kb_root:
+        from knowledge_bases import KnowledgeBaseManager
+        kbs = KnowledgeBaseManager(args.kb_root, max_open=args.max_open_kbs, **options)
+        app = create_app(None, args.max_concurrency, args.queue_timeout, knowledge_bases=kbs)
+    else:
+        app = create_app(RAGManager(args.db_dir, **options), args.max_concurrency, args.queue_timeout)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,19 @@
 import streamlit as st
 import pandas as pd
+import logging
 import os
-from rag_engine import RAGManager
+from rag_engine import env_options
+from knowledge_bases import DEFAULT_KB, KnowledgeBaseManager
+from jobs import IngestionJobManager
+from metrics import serve_metrics
 from utils import save_uploaded_file
 
+# 日志级别通过 RAG_LOG_LEVEL 控制 (DEBUG / INFO / WARNING ...)，默认只输出警告
+logging.basicConfig(
+    level=os.environ.get("RAG_LOG_LEVEL", "WARNING").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+
 import sys
 # --- 页面配置 ---
 st.set_page_config(
@@ -168,20 +178,93 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# --- 初始化 Session State ---
-if "rag" not in st.session_state:
-    st.session_state.rag = RAGManager()
+# --- 共享 RAG 引擎 ---
+# 整个进程只创建一个 KnowledgeBaseManager (一个 Embedding 模型)，所有浏览器会话共用；
+# 每个知识库是 RAG_KB_ROOT (默认 ./knowledge_bases) 下的一个子目录，不活跃的知识库按 LRU 关闭。
+# 并发安全由各 RAGManager 内部的读写锁保证
+@st.cache_resource
+def get_knowledge_bases() -> KnowledgeBaseManager:
+    # 向量库后端、近似重复检测等由环境变量配置，见 rag_engine.env_options
+    kbs = KnowledgeBaseManager(
+        os.environ.get("RAG_KB_ROOT", "./knowledge_bases"),
+        max_open=int(os.environ.get("RAG_MAX_OPEN_KBS", "4")),
+        **env_options()
+    )
+    # 页面先渲染出来，embedding 模型和默认知识库在后台加载
+    kbs.warm_up(DEFAULT_KB)
+    return kbs
+
+@st.cache_resource
+def get_job_manager() -> IngestionJobManager:
+    # 与 KnowledgeBaseManager 一样跨会话、跨 rerun 共享，页面刷新不会丢失正在进行的任务
+    return IngestionJobManager(get_knowledge_bases())
+
+@st.cache_resource
+def start_metrics_endpoint():
+    # 设置 RAG_METRICS_PORT 时在该端口提供 Prometheus 格式的 /metrics
+    port = os.environ.get("RAG_METRICS_PORT")
+    return serve_metrics(get_knowledge_bases().metrics, port=int(port)) if port else None
+
+kbs = get_knowledge_bases()
+jobs = get_job_manager()
+start_metrics_endpoint()
+
+PREVIEW_PAGE_SIZES = [20, 50, 100, 200]
+HISTORY_PAGE_SIZE = 20
+
+def compact_sources(docs):
+    # 对话历史只保存 chunk id 和来源，内容在展开时按 id 从索引读取；没有 id 的结果保留一段摘要
+    return [
+        {"id": doc.id, "source": doc.metadata.get("source", "unknown"),
+         **({} if doc.id else {"preview": doc.page_content[:200]})}
+        for doc in docs
+    ]
 
+# --- 初始化 Session State (仅保存每个会话自己的对话历史和预览) ---
+# 会话中不保存 Document 对象: 预览只记录最近一次入库的文件列表，按页从索引读取；
+# 历史消息只记录检索结果的 chunk id，会话内存和每次 rerun 的耗时不随入库量和对话长度增长
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-if "latest_chunks" not in st.session_state:
-    st.session_state.latest_chunks = []
+if "history_limit" not in st.session_state:
+    st.session_state.history_limit = HISTORY_PAGE_SIZE
+
+if "preview_sources" not in st.session_state:
+    st.session_state.preview_sources = []
+
+# 本会话提交的入库任务 id，以及已处理过结果的任务
+if "job_ids" not in st.session_state:
+    st.session_state.job_ids = []
+    st.session_state.finished_jobs = set()
+
+if "kb_name" not in st.session_state or not kbs.exists(st.session_state.kb_name):
+    st.session_state.kb_name = DEFAULT_KB
 
 # --- 侧边栏 ---
 with st.sidebar:
     st.title("⚙️ 配置面板")
-    
+
+    st.header("0. 知识库")
+    kb_names = kbs.names()
+    kb_name = st.selectbox("当前知识库", kb_names, index=kb_names.index(st.session_state.kb_name))
+    if kb_name != st.session_state.kb_name:
+        # 切换知识库: 预览和检索范围都属于原知识库
+        st.session_state.kb_name = kb_name
+        st.session_state.preview_sources = []
+        st.session_state.pop("chat_scope_sources", None)
+    with st.popover("➕ 新建知识库"):
+        new_kb = st.text_input("名称 (字母、数字、_ - .)", key="new_kb_name")
+        if st.button("创建", disabled=not new_kb):
+            try:
+                kbs.create(new_kb)
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                st.session_state.kb_name = new_kb
+                st.session_state.preview_sources = []
+                st.rerun()
+    rag = kbs.get(kb_name)
+
     st.header("1. 文档上传")
     uploaded_files = st.file_uploader(
         "选择文档 (PDF, TXT, MD)", 
@@ -204,23 +287,53 @@ with st.sidebar:
         if not uploaded_files:
             st.warning("请先上传文件！")
         else:
-            with st.spinner("正在处理文档..."):
-                all_new_chunks = []
-                temp_dir = "temp_uploads"
-                for uploaded_file in uploaded_files:
-                    # 保存文件
-                    file_path = save_uploaded_file(uploaded_file, temp_dir)
-                    # 处理 (传入切分方式)
-                    chunks = st.session_state.rag.process_file(
-                        file_path, 
-                        chunk_size, 
-                        chunk_overlap,
-                        split_method=split_method
+            temp_dir = "temp_uploads"
+            file_paths = [save_uploaded_file(f, temp_dir) for f in uploaded_files]
+            # 后台执行，页面不会被阻塞；入库期间对话继续使用现有索引
+            job_id = jobs.submit(file_paths, chunk_size, chunk_overlap, split_method=split_method, kb=kb_name)
+            st.session_state.job_ids.append(job_id)
+
+    @st.fragment(run_every=1.0)
+    def render_jobs():
+        my_jobs = [j for j in (jobs.get(i) for i in st.session_state.job_ids) if j]
+        if not my_jobs:
+            return
+        st.caption("入库任务")
+        finished_now = False
+        for job in reversed(my_jobs):
+            stats = job["stats"]
+            if job["state"] in ("queued", "running"):
+                text = "排队中..." if job["state"] == "queued" else (
+                    "正在提交..." if stats.get("stage") == "committing" else
+                    f"{stats.get('files_done', 0)}/{stats.get('files_total', len(job['paths']))} 个文件，"
+                    f"已处理 {stats.get('chunks_staged', 0)} 个 Chunks"
+                )
+                st.progress(job["progress"], text=f"{job['id']}: {text}")
+            elif job["state"] == "done":
+                st.success(
+                    f"{job['id']}: 成功处理 {stats['files_done']} 个文件，共 {stats['chunks_total']} 个 Chunks "
+                    f"(新增 {stats['new']} · 未变化 {stats['unchanged']} · 移除 {stats['removed']} · "
+                    f"{stats['chunks_per_sec']:.1f} chunks/s · 约节省 {stats['seconds_saved']:.1f}s embedding)"
+                )
+                if stats.get("near_duplicates"):
+                    st.caption(
+                        f"🔁 发现 {stats['near_duplicates']} 个近似重复 Chunk，"
+                        f"跳过 {stats['near_duplicates_skipped']} 个 (节省 {stats['near_duplicate_chars_saved']} 字符)"
                     )
-                    all_new_chunks.extend(chunks)
-                
-                st.session_state.latest_chunks = all_new_chunks
-                st.success(f"成功处理 {len(uploaded_files)} 个文件，共生成 {len(all_new_chunks)} 个 Chunks！")
+                for error in stats["errors"]:
+                    st.error(f"处理失败: {error}")
+            else:
+                st.error(f"{job['id']}: 入库失败 {job['error']}")
+            if job["state"] in ("done", "failed") and job["id"] not in st.session_state.finished_jobs:
+                st.session_state.finished_jobs.add(job["id"])
+                if job["state"] == "done" and job["kb"] == st.session_state.kb_name:
+                    st.session_state.preview_sources = list(job["paths"])
+                finished_now = True
+        if finished_now:
+            # 刷新整个页面，更新知识库文件列表和 Chunk 预览
+            st.rerun()
+
+    render_jobs()
     
     st.header("3. LLM 设置 (默认智谱 AI)")
     
@@ -235,17 +348,24 @@ with st.sidebar:
     st.divider()
     
     st.header("⚠️ 危险操作")
-    if st.button("🗑️ 清空所有知识库", type="secondary"):
-        st.session_state.rag.clear_database()
-        st.session_state.latest_chunks = []
+    kb_busy = jobs.active(kb=kb_name)
+    if st.button(f"🗑️ 清空知识库「{kb_name}」", type="secondary", disabled=kb_busy,
+                 help="有入库任务进行中时不可清空"):
+        rag.clear_database()
+        st.session_state.preview_sources = []
         # 强制刷新以更新界面状态
         st.success("知识库已清空！")
         st.rerun()
+    if kb_name != DEFAULT_KB and st.button(f"❌ 删除知识库「{kb_name}」", type="secondary", disabled=kb_busy):
+        kbs.delete(kb_name)
+        st.session_state.kb_name = DEFAULT_KB
+        st.session_state.preview_sources = []
+        st.rerun()
 
 # --- 主界面 ---
 st.title("📚 VisRAG - 可视化 RAG 调试平台")
 
-tab1, tab2 = st.tabs(["📖 知识库管理 & 预览", "🤖 RAG 对话测试"])
+tab1, tab2, tab3 = st.tabs(["📖 知识库管理 & 预览", "🤖 RAG 对话测试", "📈 性能诊断"])
 
 # === Tab 1: 知识库管理 ===
 with tab1:
@@ -260,7 +380,7 @@ with tab1:
         """, unsafe_allow_html=True)
         
         # 获取当前数据库状态
-        file_stats = st.session_state.rag.get_all_documents_metadata()
+        file_stats = rag.get_all_documents_metadata()
         
         if not file_stats:
             st.info("📭 当前知识库为空。请在侧边栏上传文档并点击构建。")
@@ -284,7 +404,7 @@ with tab1:
                         st.caption(f"{file_data['count']} chunks")
                     with col3:
                         if st.button("🗑️", key=f"del_{file_data['source']}", help="删除此文件"):
-                            st.session_state.rag.delete_document(file_data['source'])
+                            rag.delete_document(file_data['source'])
                             st.toast(f"已删除 {os.path.basename(file_data['source'])}")
                             st.rerun()
     
@@ -295,28 +415,40 @@ with tab1:
         </div>
         """, unsafe_allow_html=True)
         
-        if st.session_state.latest_chunks:
-            # 转换为 DataFrame 用于展示
-            data = []
-            for i, chunk in enumerate(st.session_state.latest_chunks):
-                data.append({
-                    "ID": i,
-                    "来源": os.path.basename(chunk.metadata.get("source", "Unknown")),
-                    "字符数": len(chunk.page_content),
-                    "内容预览": chunk.page_content[:100] + "..." if len(chunk.page_content) > 100 else chunk.page_content
-                })
+        preview_sources = st.session_state.preview_sources
+        total = rag.count_document_chunks(preview_sources) if preview_sources else 0
+        if total:
+            # 分页: 每次 rerun 只读取当前页的摘要 (id / 来源 / 字符数 / 前 100 字)
+            col_size, col_page = st.columns([1, 2])
+            page_size = col_size.selectbox("每页", PREVIEW_PAGE_SIZES, index=1)
+            pages = (total + page_size - 1) // page_size
+            page = col_page.number_input(
+                f"页码 (共 {pages} 页 · {total} 个 Chunks)", min_value=1, max_value=pages, value=1, step=1,
+                key=f"preview_page_{page_size}_{total}"
+            )
+            offset = (page - 1) * page_size
+            rows = rag.preview_document_chunks(preview_sources, offset=offset, limit=page_size)
             
-            df = pd.DataFrame(data)
+            df = pd.DataFrame([{
+                "ID": offset + i,
+                "来源": os.path.basename(row["source"] or "Unknown"),
+                "字符数": row["chars"],
+                "内容预览": row["preview"] + "..." if row["chars"] > len(row["preview"]) else row["preview"]
+            } for i, row in enumerate(rows)])
             st.dataframe(df, use_container_width=True, height=300)
             
-            # 详情查看
+            # 详情查看: 只按 id 读取选中的一个 chunk
             st.markdown("---")
-            selected_id = st.number_input("🔢 输入 Chunk ID 查看完整内容", min_value=0, max_value=len(data)-1, value=0, step=1)
-            if 0 <= selected_id < len(data):
-                with st.expander(f"📝 Chunk {selected_id} 完整内容", expanded=True):
-                    st.markdown(f"<div class='chunk-preview'>{st.session_state.latest_chunks[selected_id].page_content}</div>", unsafe_allow_html=True)
-                with st.expander("🏷️ 元数据"):
-                    st.json(st.session_state.latest_chunks[selected_id].metadata)
+            if rows:
+                selected_id = st.number_input(
+                    "🔢 输入 Chunk ID 查看完整内容", min_value=offset, max_value=offset + len(rows) - 1,
+                    value=offset, step=1, key=f"preview_chunk_{offset}_{len(rows)}"
+                )
+                for chunk in rag.get_chunks([rows[selected_id - offset]["id"]]):
+                    with st.expander(f"📝 Chunk {selected_id} 完整内容", expanded=True):
+                        st.markdown(f"<div class='chunk-preview'>{chunk.page_content}</div>", unsafe_allow_html=True)
+                    with st.expander("🏷️ 元数据"):
+                        st.json(chunk.metadata)
         else:
             st.info("💡 构建知识库后，这里将显示切分后的 Chunk 预览。")
             st.markdown("""
@@ -340,17 +472,45 @@ with tab2:
         )
         # 直接使用选择的值
         real_search_type = search_type
+
+        # 限定检索范围: 向量库和关键字索引都在打分前按 source 过滤
+        all_sources = [d["source"] for d in rag.get_all_documents_metadata()]
+        # 已删除的文档从选择中去掉
+        st.session_state.chat_scope_sources = [
+            s for s in st.session_state.get("chat_scope_sources", []) if s in all_sources
+        ]
+        scope_sources = st.multiselect(
+            "检索范围 (不选则检索全部文档)",
+            all_sources,
+            format_func=os.path.basename,
+            key="chat_scope_sources"
+        )
+        chat_filters = {"sources": scope_sources} if scope_sources else None
             
     with col_chat:
-        # 显示历史消息
-        for msg in st.session_state.messages:
+        # 显示历史消息: 只渲染最近 history_limit 条，更早的按需加载
+        messages = st.session_state.messages
+        start = max(0, len(messages) - st.session_state.history_limit)
+        if start and st.button(f"⬆️ 显示更早的消息 (还有 {start} 条)"):
+            st.session_state.history_limit += HISTORY_PAGE_SIZE
+            st.rerun()
+        for idx in range(start, len(messages)):
+            msg = messages[idx]
             with st.chat_message(msg["role"]):
                 st.markdown(msg["content"])
-                if "source_documents" in msg:
-                    with st.expander("🔍 检索到的上下文 (历史记录)"):
-                        for doc in msg["source_documents"]:
-                            st.markdown(f"**来源**: `{os.path.basename(doc.metadata.get('source', 'unknown'))}`")
-                            st.markdown(f"```\n{doc.page_content[:200]}...\n```")
+                if msg.get("sources") and st.toggle("🔍 检索到的上下文 (历史记录)", key=f"history_ctx_{idx}"):
+                    # 打开时才按 id 读取 chunk 内容 (已删除的 chunk 不再显示)
+                    # chunk 属于提问时所在的知识库 (已删除的知识库不再显示内容)
+                    msg_kb = msg.get("kb", kb_name)
+                    msg_rag = kbs.get(msg_kb) if kbs.exists(msg_kb) else None
+                    docs = {
+                        doc.id: doc
+                        for doc in (msg_rag.get_chunks([s["id"] for s in msg["sources"] if s["id"]]) if msg_rag else [])
+                    }
+                    for ref in msg["sources"]:
+                        content = docs[ref["id"]].page_content if ref["id"] in docs else ref.get("preview", "(已从知识库删除)")
+                        st.markdown(f"**来源**: `{os.path.basename(ref['source'])}`")
+                        st.markdown(f"```\n{content[:200]}...\n```")
 
         # 输入框
         if prompt := st.chat_input("请输入你的问题..."):
@@ -367,18 +527,22 @@ with tab2:
                 st.error("请在侧边栏填写 API Key，或设置 ZHIPU_API_KEY 环境变量！")
             else:
                 with st.chat_message("assistant"):
-                    with st.spinner("正在思考..."):
-                        try:
-                            result = st.session_state.rag.chat(
-                                query=prompt,
-                                api_key=api_key, # 传入原始输入即可，rag_engine 内部会再次 fallback
-                                base_url=base_url,
-                                model_name=model_name,
-                                search_type=real_search_type
-                            )
-                            
-                            answer = result.get("answer")
-                            source_docs = result.get("source_documents", [])
+                    # 流式调用: 先拿到检索结果，再逐 token 渲染回答
+                    events = rag.chat_stream(
+                        query=prompt,
+                        api_key=api_key, # 传入原始输入即可，rag_engine 内部会再次 fallback
+                        base_url=base_url,
+                        model_name=model_name,
+                        search_type=real_search_type,
+                        filters=chat_filters
+                    )
+                    try:
+                        with st.spinner("正在检索..."):
+                            first = next(events)
+                        if first["type"] == "error":
+                            st.error(first["error"])
+                        else:
+                            source_docs = first["source_documents"]
                             
                             # 展示检索到的上下文
                             with st.expander("🔍 检索到的上下文", expanded=True):
@@ -388,17 +552,76 @@ with tab2:
                                     st.markdown(f"**DOC {i+1}** - `{os.path.basename(doc.metadata.get('source', 'unknown'))}`")
                                     st.markdown(f"```\n{doc.page_content}...\n```")
                             
-                            # 展示回答
-                            st.markdown(answer)
+                            # 逐 token 展示回答
+                            done = {}
+                            def token_stream():
+                                for event in events:
+                                    if event["type"] == "token":
+                                        yield event["content"]
+                                    elif event["type"] == "done":
+                                        done.update(event)
+                            
+                            answer = st.write_stream(token_stream())
+                            if done.get("timings", {}).get("cache_hit"):
+                                cache_stats = rag.answer_cache_stats()
+                                st.caption(
+                                    f"⚡ 命中答案缓存，节省约 {done['timings']['seconds_saved']:.1f}s "
+                                    f"(命中率 {cache_stats['hit_rate']:.0%})"
+                                )
+                            elif done.get("timings", {}).get("context_tokens_saved"):
+                                st.caption(
+                                    f"✂️ 上下文约 {done['timings']['context_tokens']} tokens，"
+                                    f"压缩节省约 {done['timings']['context_tokens_saved']} tokens"
+                                )
                             
                             # 保存历史
                             st.session_state.messages.append({
                                 "role": "assistant", 
                                 "content": answer,
-                                "source_documents": source_docs
+                                "sources": compact_sources(source_docs),
+                                "kb": kb_name
                             })
-                            
-                        except Exception as e:
-                            st.error("执行出错，详细日志请查看终端。")
-                            st.exception(e)
+                        
+                    except Exception as e:
+                        st.error("执行出错，详细日志请查看终端。")
+                        st.exception(e)
+                    finally:
+                        # 用户离开页面 / 触发 rerun 时 Streamlit 会中断脚本，
+                        # 这里关闭生成器以取消仍在进行的 LLM 流式请求
+                        events.close()
+
+# === Tab 3: 性能诊断 ===
+with tab3:
+    st.caption("各阶段耗时分布 (秒)，统计范围为本进程启动以来；设置 RAG_METRICS_PORT 可供 Prometheus 抓取 /metrics")
+    summary = rag.metrics.summary()
+    if summary:
+        df = pd.DataFrame(summary)
+        st.dataframe(df, use_container_width=True)
+    else:
+        st.info("💡 进行一次入库或对话后，这里将显示各阶段的 p50 / p95 / p99 延迟。")
+
+    cache_stats = rag.answer_cache_stats()
+    col_a, col_b, col_c = st.columns(3)
+    col_a.metric("答案缓存命中率", f"{cache_stats['hit_rate']:.0%}")
+    col_b.metric("缓存节省的延迟", f"{cache_stats['seconds_saved']:.1f}s")
+    col_c.metric("Embedding 缓存命中率", f"{rag.embedding_cache_stats().get('hit_rate', 0.0):.0%}")
+
+    dup_stats = rag.near_duplicate_stats()
+    if dup_stats:
+        col_a, col_b, col_c = st.columns(3)
+        col_a.metric("近似重复 (关联 / 跳过)", f"{dup_stats['linked']} / {dup_stats['skipped']}")
+        col_b.metric("跳过节省的行数", f"{dup_stats['index_rows_saved_ratio']:.0%}",
+                     help=f"{dup_stats['skipped_chars']} 字符，约 {dup_stats['embed_seconds_saved']:.1f}s embedding")
+        col_c.metric("检索折叠的重复结果", dup_stats["collapsed"])
+
+    st.subheader("最近的请求 trace")
+    for trace in reversed(list(rag.metrics.recent_traces)[-10:]):
+        root = trace[0]
+        with st.expander(f"{root['name']} · {root['seconds'] * 1000:.0f} ms"):
+            st.dataframe(pd.DataFrame([
+                {**span, "name": "  " * span["depth"] + span["name"], "ms": round(span["seconds"] * 1000, 1)}
+                for span in trace
+            ]).drop(columns=["seconds", "depth"]), use_container_width=True)
 
+    with st.expander("Prometheus 文本"):
+        st.code(rag.metrics.prometheus_text(), language="text")
@@ -0,0 +1,123 @@
+"""
+关键字索引分词器基准: 对比 whitespace / cjk_bigram (/ jieba) 的
+索引规模、建索引耗时和查询延迟。
+
+用法 (在 RAG_project 目录下):
+    python benchmarks/bench_analyzer.py --chunks 5000 --queries 200
+    python benchmarks/bench_analyzer.py --json result.json
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analyzer import ANALYZERS, get_analyzer  # noqa: E402
+from keyword_index import KeywordIndex  # noqa: E402
+
+WORDS = (
+    "员工 公司 年假 报销 发票 合同 审批 流程 部门 经理 制度 规定 工资 社保 公积金 "
+    "培训 考勤 加班 出差 预算 采购 供应商 质量 安全 数据 系统 权限 账号 密码 服务器 "
+    "客户 订单 退款 发货 库存 财务 税务 法务 风险 项目 需求 测试 上线 版本 文档 会议"
+).split()
+LATIN = "the policy of API server token request the and for with VPN OA ERP".split()
+
+
+def make_corpus(n_chunks: int, seed: int = 0):
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(n_chunks):
+        sentences = []
+        for _ in range(rng.randint(3, 8)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(4, 12))]
+            if rng.random() < 0.3:
+                words.insert(rng.randrange(len(words)), rng.choice(LATIN))
+            sentences.append("".join(words) + rng.choice("。！？"))
+        texts.append("".join(sentences))
+    return texts
+
+
+def make_queries(n_queries: int, seed: int = 1):
+    rng = random.Random(seed)
+    return ["".join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))) + "是什么？" for _ in range(n_queries)]
+
+
+def bench(name: str, texts, queries, k: int):
+    analyzer = get_analyzer(name)
+    with tempfile.TemporaryDirectory() as d:
+        index = KeywordIndex(d, analyzer=analyzer)
+        ids = [str(i) for i in range(len(texts))]
+        metas = [{"source": f"doc{i % 50}.txt"} for i in range(len(texts))]
+        start = time.perf_counter()
+        for s in range(0, len(texts), 500):
+            index.add(ids[s:s + 500], texts[s:s + 500], metas[s:s + 500])
+        build_seconds = time.perf_counter() - start
+
+        conn = sqlite3.connect(index.path)
+        unique_terms = conn.execute("SELECT COUNT(DISTINCT term) FROM postings").fetchone()[0]
+        postings = conn.execute("SELECT COUNT(*) FROM postings").fetchone()[0]
+        conn.close()
+
+        latencies = []
+        hits = 0
+        for q in queries:
+            t0 = time.perf_counter()
+            result = index.search(q, k=k)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            hits += bool(result)
+        index.close()
+        size_bytes = sum(
+            os.path.getsize(os.path.join(d, f)) for f in os.listdir(d) if f.startswith(KeywordIndex.FILE_NAME)
+        )
+
+    latencies.sort()
+    return {
+        "analyzer": name,
+        "chunks": len(texts),
+        "unique_terms": unique_terms,
+        "postings": postings,
+        "index_bytes": size_bytes,
+        "build_seconds": round(build_seconds, 3),
+        "query_ms_p50": round(statistics.median(latencies), 3),
+        "query_ms_p95": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+        "queries_with_hits": hits,
+        "queries": len(queries),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--analyzers", default=",".join(ANALYZERS))
+    parser.add_argument("--json", help="结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    texts = make_corpus(args.chunks)
+    queries = make_queries(args.queries)
+    results = []
+    for name in args.analyzers.split(","):
+        try:
+            results.append(bench(name, texts, queries, args.k))
+        except ImportError as e:
+            print(f"跳过 {name}: {e}")
+
+    cols = ["analyzer", "unique_terms", "postings", "index_bytes", "build_seconds",
+            "query_ms_p50", "query_ms_p95", "queries_with_hits"]
+    print(" | ".join(cols))
+    for r in results:
+        print(" | ".join(str(r[c]) for c in cols))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+HTTP API 压测: 在本进程内启动 api.create_app (uvicorn) 与桩 LLM，
+用 httpx 异步客户端对 /retrieve、/chat、/chat (stream) 发起并发请求，
+统计延迟分位数、QPS 和状态码分布 (503 表示被并发上限拒绝)。
+
+用法 (在 RAG_project 目录下):
+    python benchmarks/bench_api.py --chunks 2000 --concurrency 64 --requests 500 --max-concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from langchain_core.embeddings import DeterministicFakeEmbedding  # noqa: E402
+
+from api import create_app  # noqa: E402
+from bench_suite import make_corpus, make_queries, percentile  # noqa: E402
+from rag_engine import RAGManager  # noqa: E402
+from stub_llm_server import StubLLMServer  # noqa: E402
+
+
+def start_server(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def load(base: str, path: str, payloads: List[Dict[str, Any]], concurrency: int, stream: bool = False):
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    gate = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base, timeout=120, limits=limits) as client:
+        async def one(payload):
+            async with gate:
+                t0 = time.perf_counter()
+                if stream:
+                    async with client.stream("POST", path, json=payload) as response:
+                        async for _ in response.aiter_bytes():
+                            pass
+                else:
+                    response = await client.post(path, json=payload)
+                statuses[response.status_code] += 1
+                if response.status_code == 200:
+                    latencies.append((time.perf_counter() - t0) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(p) for p in payloads))
+        wall = time.perf_counter() - start
+
+    return {
+        "p50_ms": round(percentile(latencies, 0.5), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "qps": round(statuses[200] / wall, 2),
+        "status": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=32, help="客户端并发数")
+    parser.add_argument("--max-concurrency", type=int, default=16, help="服务端并发上限")
+    parser.add_argument("--queue-timeout", type=float, default=30)
+    parser.add_argument("--llm-delay-ms", type=float, default=200)
+    parser.add_argument("--token-ms", type=float, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--json", help="结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = os.path.join(tmp, "corpus")
+        make_corpus(corpus, args.chunks, 300, seed=0)
+        rag = RAGManager(
+            os.path.join(tmp, "db"), embedding_cache_dir=None, answer_cache_size=0,
+            embeddings=DeterministicFakeEmbedding(size=384)
+        )
+        rag.ingest_paths(corpus, 300, 30)
+
+        app = create_app(rag, max_concurrency=args.max_concurrency, queue_timeout=args.queue_timeout)
+        server = start_server(app, args.port)
+        base = f"http://127.0.0.1:{args.port}"
+        queries = make_queries(100, seed=0)
+
+        result: Dict[str, Any] = {"params": vars(args)}
+        with StubLLMServer(delay=args.llm_delay_ms / 1000, token_interval=args.token_ms / 1000) as llm:
+            chat = {"api_key": "stub", "base_url": llm.base_url, "model_name": "stub", "use_cache": False}
+            for search_type in ("Vector", "BM25", "Hybrid"):
+                payloads = [{"query": queries[i % len(queries)], "search_type": search_type} for i in range(args.requests)]
+                result[f"retrieve.{search_type}"] = asyncio.run(load(base, "/retrieve", payloads, args.concurrency))
+            payloads = [{"query": queries[i % len(queries)], **chat} for i in range(args.requests)]
+            result["chat"] = asyncio.run(load(base, "/chat", payloads, args.concurrency))
+            payloads = [{**p, "stream": True} for p in payloads]
+            result["chat_stream"] = asyncio.run(load(base, "/chat", payloads, args.concurrency, stream=True))
+        server.should_exit = True
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+embedding 推理后端基准: 对每个配置 (后端 / batch_size / 线程数 / 进程数 / 是否按长度分桶) 测量
+编码合成 chunk 的吞吐，并检查相对基线 (第一个配置，默认为 torch fp32) 的向量偏差:
+
+  - texts_per_s: 预热后编码全部文本的吞吐
+  - cosine_min / cosine_mean: 同一文本在该配置与基线下向量的余弦相似度
+  - topk_overlap: 以查询检索 top-k chunk 时，与基线结果的平均重合比例 (int8 量化后应接近 1.0)
+  - padding_overhead: 按 token 数 (onnx 分词器，不可用时按字符数) 估计的 padding 占比，分桶与顺序组批对比
+
+配置写法: backend[:key=value,...]，如 "torch", "onnx:batch_size=64,threads=4", "onnx-int8:processes=2"
+
+用法 (在 RAG_project 目录下，需要能加载 all-MiniLM-L6-v2):
+    python benchmarks/bench_embeddings.py --texts 2000 --configs "torch;onnx;onnx-int8"
+    python benchmarks/bench_embeddings.py --configs "torch;onnx-int8:threads=2,processes=2" --json emb.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_suite import make_paragraph, make_queries  # noqa: E402
+from embedding_models import (  # noqa: E402
+    DEFAULT_MODEL_NAME, OnnxEmbeddings, embedding_factory, length_buckets, padding_overhead
+)
+
+INT_OPTIONS = ("batch_size", "threads", "processes")
+
+
+def parse_config(spec: str) -> Tuple[str, Dict[str, Any]]:
+    backend, _, rest = spec.partition(":")
+    options: Dict[str, Any] = {"backend": backend.strip()}
+    for item in filter(None, rest.split(",")):
+        key, _, value = item.partition("=")
+        key = key.strip()
+        if key in INT_OPTIONS:
+            options[key] = int(value)
+        elif key == "bucket_by_length":
+            options[key] = value.strip().lower() in ("1", "true", "yes")
+        else:
+            raise ValueError(f"unknown option in {spec!r}: {key}")
+    return spec, options
+
+
+def make_texts(count: int, seed: int) -> List[str]:
+    # 长短混合 (50 ~ 500 字)，接近入库时 chunk 长度的分布
+    rng = random.Random(seed)
+    return [make_paragraph(rng, rng.randint(50, 500)) for _ in range(count)]
+
+
+def normalize(vectors: List[List[float]]) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    return matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+
+def top_k(queries: np.ndarray, docs: np.ndarray, k: int) -> List[set]:
+    scores = queries @ docs.T
+    return [set(np.argsort(-row)[:k].tolist()) for row in scores]
+
+
+def token_lengths(texts: List[str], model_name: str) -> Tuple[List[int], str]:
+    try:
+        tokenizer, _ = OnnxEmbeddings(model_name)._load()
+        return [sum(e.attention_mask) for e in tokenizer.encode_batch(texts)], "tokens"
+    except Exception:
+        return [len(t) for t in texts], "chars"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--model", default=DEFAULT_MODEL_NAME)
+    parser.add_argument("--configs", default="torch;onnx;onnx-int8", help="分号分隔的配置，第一个为基线")
+    parser.add_argument("--batch-size", type=int, default=32, help="配置未指定 batch_size 时使用")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    texts = make_texts(args.texts, args.seed)
+    queries = make_queries(args.queries, args.seed)
+    lengths, unit = token_lengths(texts, args.model)
+    sequential = [list(range(i, min(i + args.batch_size, len(texts)))) for i in range(0, len(texts), args.batch_size)]
+    result: Dict[str, Any] = {
+        "params": vars(args),
+        "padding_overhead": {
+            "unit": unit,
+            "sequential": round(padding_overhead(lengths, sequential), 4),
+            "bucketed": round(padding_overhead(lengths, length_buckets(lengths, args.batch_size)), 4),
+        },
+        "results": {},
+    }
+    print("padding", result["padding_overhead"], file=sys.stderr)
+
+    baseline = None
+    for spec, options in map(parse_config, args.configs.split(";")):
+        options.setdefault("batch_size", args.batch_size)
+        t0 = time.perf_counter()
+        model = embedding_factory(args.model, **options)()
+        load_s = time.perf_counter() - t0
+        # 预热: 首次推理的图优化 / 内存分配 (以及子进程中的模型加载)
+        model.embed_documents(texts[:options["batch_size"] * max(1, options.get("processes", 0))])
+
+        t0 = time.perf_counter()
+        docs = normalize(model.embed_documents(texts))
+        elapsed = time.perf_counter() - t0
+        query_vectors = normalize([model.embed_query(q) for q in queries])
+        if hasattr(model, "close"):
+            model.close()
+
+        row: Dict[str, Any] = {"load_s": round(load_s, 2), "texts_per_s": round(len(texts) / elapsed, 1)}
+        if baseline is None:
+            baseline = (docs, top_k(query_vectors, docs, args.k))
+        else:
+            cosine = (docs * baseline[0]).sum(axis=1)
+            hits = top_k(query_vectors, docs, args.k)
+            row.update({
+                "cosine_min": round(float(cosine.min()), 5),
+                "cosine_mean": round(float(cosine.mean()), 5),
+                "topk_overlap": round(float(np.mean([len(a & b) / args.k for a, b in zip(hits, baseline[1])])), 4),
+            })
+        result["results"][spec] = row
+        print(spec, row, file=sys.stderr)
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
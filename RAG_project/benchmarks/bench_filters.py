@@ -0,0 +1,122 @@
+"""
+过滤检索基准: 在合成语料上测量按 source 过滤 (选中 100% / 50% / 10% / 1% 的文件) 时
+Vector / BM25 / Hybrid 检索的延迟，并与"先取 top-k 再过滤"的后置过滤对比:
+
+  - prefilter_p50_ms / prefilter_docs: retrieve(..., filters=...) 的延迟和返回条数 (应总是 k)
+  - postfilter_p50_ms / postfilter_docs: 不过滤取 top-k 后再按 source 筛选，选择性越高剩下的越少
+
+每个文件约 chunks / files 个 chunk，查询为与 bench_suite 相同分布的合成问题。
+
+用法 (在 RAG_project 目录下):
+    python benchmarks/bench_filters.py --chunks 20000 --files 200 --fake-embeddings --backend numpy
+    python benchmarks/bench_filters.py --backend chroma --fake-embeddings --json filters.json
+"""
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_suite import make_paragraph, make_queries  # noqa: E402
+from rag_engine import RAGManager  # noqa: E402
+
+FRACTIONS = (1.0, 0.5, 0.1, 0.01)
+
+
+def write_corpus(directory: str, chunks: int, files: int, chunk_size: int, seed: int) -> List[str]:
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    per_file = max(1, chunks // files)
+    paths = []
+    for i in range(files):
+        path = os.path.join(directory, f"doc_{i:05d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            for _ in range(per_file):
+                f.write(make_paragraph(rng, int(chunk_size * 0.8)) + "\n\n")
+        paths.append(path)
+    return paths
+
+
+def p50_ms(samples: List[float]) -> float:
+    return round(statistics.median(samples) * 1000, 3)
+
+
+def measure(rag: RAGManager, queries: List[str], search_type: str, k: int, sources: List[str]) -> Dict[str, Any]:
+    filters = {"sources": sources}
+    wanted = set(sources)
+    pre, post, pre_docs, post_docs = [], [], [], []
+    for query in queries:
+        t0 = time.perf_counter()
+        docs = rag.retrieve(query, search_type=search_type, k=k, filters=filters)
+        pre.append(time.perf_counter() - t0)
+        pre_docs.append(len(docs))
+
+        t0 = time.perf_counter()
+        docs = [d for d in rag.retrieve(query, search_type=search_type, k=k) if d.metadata.get("source") in wanted]
+        post.append(time.perf_counter() - t0)
+        post_docs.append(len(docs))
+    return {
+        "prefilter_p50_ms": p50_ms(pre),
+        "prefilter_docs": round(statistics.mean(pre_docs), 2),
+        "postfilter_p50_ms": p50_ms(post),
+        "postfilter_docs": round(statistics.mean(post_docs), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--backend", default="numpy")
+    parser.add_argument("--search-types", default="Vector,BM25,Hybrid")
+    parser.add_argument("--fake-embeddings", type=int, nargs="?", const=384, default=0, metavar="DIM",
+                        help="用确定性的假 embedding 代替 all-MiniLM-L6-v2 (只测检索开销)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    embeddings = None
+    if args.fake_embeddings:
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        embeddings = DeterministicFakeEmbedding(size=args.fake_embeddings)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_corpus(os.path.join(tmp, "corpus"), args.chunks, args.files, args.chunk_size, args.seed)
+        rag = RAGManager(
+            os.path.join(tmp, "db"), embedding_cache_dir=None, embeddings=embeddings, vector_backend=args.backend
+        )
+        t0 = time.perf_counter()
+        stats = rag.ingest_paths(paths, args.chunk_size, 0)
+        print(f"ingested {stats['chunks_written']} chunks in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+        queries = make_queries(args.queries, args.seed)
+        sources = sorted(paths)
+        result: Dict[str, Any] = {"params": vars(args), "chunks": stats["chunks_written"], "results": {}}
+        for search_type in args.search_types.split(","):
+            # 预热: 打开向量库、加载倒排索引页缓存
+            rag.retrieve(queries[0], search_type=search_type, k=args.k)
+            for fraction in FRACTIONS:
+                selected = sources[:max(1, math.ceil(len(sources) * fraction))]
+                row = measure(rag, queries, search_type, args.k, selected)
+                result["results"][f"{search_type}.{fraction:g}"] = {"sources": len(selected), **row}
+                print(search_type, fraction, row, file=sys.stderr)
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
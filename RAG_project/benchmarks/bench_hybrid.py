@@ -0,0 +1,99 @@
+"""
+Hybrid 检索微基准: 对比串行执行 (等价于原 EnsembleRetriever 的行为)
+与 HybridRetriever 并发执行 + RRF 融合的延迟。
+
+两路检索用固定延迟的模拟检索器，便于验证 "延迟 ≈ max(vector, bm25)"；
+加 --real 时改用真实的 KeywordIndex 作为 BM25 一路。
+
+用法 (在 RAG_project 目录下):
+    python benchmarks/bench_hybrid.py --vector-ms 30 --bm25-ms 20 --runs 50
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document  # noqa: E402
+from langchain_core.retrievers import BaseRetriever  # noqa: E402
+
+from analyzer import CJKBigramAnalyzer  # noqa: E402
+from keyword_index import KeywordIndex  # noqa: E402
+from retrievers import HybridRetriever, KeywordIndexRetriever, reciprocal_rank_fusion  # noqa: E402
+
+
+class FixedLatencyRetriever(BaseRetriever):
+    delay: float
+    docs: List[Document]
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        time.sleep(self.delay)
+        return list(self.docs)
+
+
+def sequential_hybrid(retrievers, weights, query, k):
+    results = [r.invoke(query) for r in retrievers]
+    return reciprocal_rank_fusion(results, weights, k=k)
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return round(statistics.median(samples), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vector-ms", type=float, default=30)
+    parser.add_argument("--bm25-ms", type=float, default=20)
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--real", action="store_true", help="BM25 一路使用真实 KeywordIndex")
+    parser.add_argument("--json", help="结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    docs = [Document(page_content=f"chunk {i}", metadata={"source": "a.txt"}) for i in range(2 * args.k)]
+    vector = FixedLatencyRetriever(delay=args.vector_ms / 1000, docs=docs)
+    tmp = tempfile.TemporaryDirectory()
+    if args.real:
+        index = KeywordIndex(tmp.name, analyzer=CJKBigramAnalyzer())
+        texts = [f"员工手册第{i}章 年假 报销 流程说明" for i in range(20000)]
+        index.add([str(i) for i in range(len(texts))], texts, [{"source": "hr.txt"}] * len(texts))
+        bm25 = KeywordIndexRetriever(index=index, k=2 * args.k)
+    else:
+        bm25 = FixedLatencyRetriever(delay=args.bm25_ms / 1000, docs=docs[::-1])
+    legs = [vector, bm25]
+    weights = [0.5, 0.5]
+
+    seq_vector = timed(lambda: vector.invoke("年假报销"), args.runs)
+    seq_bm25 = timed(lambda: bm25.invoke("年假报销"), args.runs)
+    sequential = timed(lambda: sequential_hybrid(legs, weights, "年假报销", args.k), args.runs)
+    hybrid = HybridRetriever(retrievers=legs, weights=weights, k=args.k)
+    concurrent = timed(lambda: hybrid.invoke("年假报销"), args.runs)
+    tmp.cleanup()
+
+    result = {
+        "vector_ms_p50": seq_vector,
+        "bm25_ms_p50": seq_bm25,
+        "sequential_hybrid_ms_p50": sequential,
+        "concurrent_hybrid_ms_p50": concurrent,
+        "max_leg_ms": max(seq_vector, seq_bm25),
+        "sum_legs_ms": round(seq_vector + seq_bm25, 2),
+    }
+    for key, value in result.items():
+        print(f"{key:28s} {value}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
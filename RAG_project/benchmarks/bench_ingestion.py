@@ -0,0 +1,84 @@
+"""
+批量入库基准: 对比逐个文件调用 ingest_file 与 ingest_paths 流水线
+(多进程解析 + 跨文件攒批 embedding + 按批写入) 的吞吐 (chunks/s)。
+
+会生成一批合成文本文件，两种方式各自写入独立的临时知识库，
+并关闭 embedding 缓存，保证两边都真实计算 embedding。
+
+用法 (在 RAG_project 目录下):
+    python benchmarks/bench_ingestion.py --files 40 --lines 200 --workers 4
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rag_engine import RAGManager  # noqa: E402
+
+
+def make_corpus(directory: str, files: int, lines: int):
+    os.makedirs(directory, exist_ok=True)
+    for i in range(files):
+        with open(os.path.join(directory, f"doc_{i:04d}.txt"), "w", encoding="utf-8") as f:
+            for j in range(lines):
+                f.write(f"第{i}篇文档的第{j}段，介绍检索增强生成中的切分、向量化与召回。Section {j} of doc {i}.\n")
+
+
+def run_sequential(manager: RAGManager, paths, args):
+    start = time.perf_counter()
+    chunks = 0
+    for path in paths:
+        chunks += manager.ingest_file(path, args.chunk_size, args.chunk_overlap)["report"]["new"]
+    return chunks, time.perf_counter() - start
+
+
+def run_pipeline(manager: RAGManager, corpus: str, args):
+    stats = manager.ingest_paths(
+        corpus, args.chunk_size, args.chunk_overlap,
+        workers=args.workers, embed_batch_size=args.batch_size
+    )
+    return stats["chunks_written"], stats["seconds"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--lines", type=int, default=200)
+    parser.add_argument("--chunk-size", type=int, default=300)
+    parser.add_argument("--chunk-overlap", type=int, default=30)
+    parser.add_argument("--workers", type=int, default=None, help="解析进程数，默认 CPU 核数")
+    parser.add_argument("--batch-size", type=int, default=256, help="embedding 批大小")
+    parser.add_argument("--json", help="结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = os.path.join(tmp, "corpus")
+        make_corpus(corpus, args.files, args.lines)
+        paths = sorted(os.path.join(corpus, n) for n in os.listdir(corpus))
+
+        sequential = RAGManager(os.path.join(tmp, "db_sequential"), embedding_cache_dir=None)
+        seq_chunks, seq_seconds = run_sequential(sequential, paths, args)
+
+        pipelined = RAGManager(os.path.join(tmp, "db_pipeline"), embedding_cache_dir=None)
+        pipe_chunks, pipe_seconds = run_pipeline(pipelined, corpus, args)
+
+    result = {
+        "files": args.files,
+        "sequential": {"chunks": seq_chunks, "seconds": round(seq_seconds, 2),
+                       "chunks_per_sec": round(seq_chunks / seq_seconds, 1)},
+        "pipeline": {"chunks": pipe_chunks, "seconds": round(pipe_seconds, 2),
+                     "chunks_per_sec": round(pipe_chunks / pipe_seconds, 1)},
+    }
+    result["speedup"] = round(seq_seconds / pipe_seconds, 2)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
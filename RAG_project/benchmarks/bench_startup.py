@@ -0,0 +1,154 @@
+"""
+启动开销基准: 每次在全新的子进程中测量
+  - import_seconds: import rag_engine (以及导入后已加载的重量级依赖)
+  - construct_seconds: 构造 RAGManager (不应加载模型、打开向量库)
+  - list_documents_seconds: 第一次 get_all_documents_metadata (只读 catalog)
+  - first_query_seconds / second_query_seconds: 第一次 (冷) 和第二次检索
+  - time_to_first_query_seconds: 进程内从 import 开始到第一次检索返回
+--warm-up 时构造后立即调用 warm_up()，等待预热完成后再查询，并记录预热耗时 (warm_up_seconds)。
+
+默认先在临时目录中建一个合成知识库；--db-dir 指定已有知识库时直接使用。
+
+用法 (在 RAG_project 目录下):
+    python benchmarks/bench_startup.py --fake-embeddings --runs 5
+    python benchmarks/bench_startup.py --db-dir ./chroma_db --warm-up --json startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = (
+    "chromadb", "langchain_openai", "openai", "langchain_community", "langchain_huggingface",
+    "sentence_transformers", "torch", "langchain_text_splitters"
+)
+
+
+def child(params: Dict[str, Any]) -> Dict[str, Any]:
+    t_start = time.perf_counter()
+    sys.path.insert(0, PROJECT_DIR)
+    from rag_engine import RAGManager
+    result: Dict[str, Any] = {"import_seconds": time.perf_counter() - t_start}
+    result["heavy_modules_after_import"] = [m for m in HEAVY_MODULES if m in sys.modules]
+
+    embeddings = None
+    if params["fake_embeddings"]:
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        embeddings = DeterministicFakeEmbedding(size=params["fake_embeddings"])
+
+    t0 = time.perf_counter()
+    rag = RAGManager(
+        params["db_dir"], embedding_cache_dir=params["cache_dir"],
+        embeddings=embeddings, vector_backend=params["backend"]
+    )
+    result["construct_seconds"] = time.perf_counter() - t0
+    warm_started = time.perf_counter()
+    warm_thread = rag.warm_up() if params["warm_up"] else None
+
+    t0 = time.perf_counter()
+    result["documents"] = len(rag.get_all_documents_metadata())
+    result["list_documents_seconds"] = time.perf_counter() - t0
+
+    if warm_thread is not None:
+        warm_thread.join()
+        result["warm_up_seconds"] = time.perf_counter() - warm_started
+
+    for name, query in (("first_query_seconds", params["queries"][0]), ("second_query_seconds", params["queries"][1])):
+        t0 = time.perf_counter()
+        rag.retrieve(query, search_type=params["search_type"], k=3)
+        result[name] = time.perf_counter() - t0
+        if name == "first_query_seconds":
+            result["time_to_first_query_seconds"] = time.perf_counter() - t_start
+    result["heavy_modules_after_query"] = [m for m in HEAVY_MODULES if m in sys.modules]
+    return result
+
+
+def build_corpus(db_dir: str, cache_dir: str, params: Dict[str, Any], chunks: int) -> None:
+    sys.path.insert(0, PROJECT_DIR)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from bench_suite import make_corpus
+    from rag_engine import RAGManager
+
+    embeddings = None
+    if params["fake_embeddings"]:
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        embeddings = DeterministicFakeEmbedding(size=params["fake_embeddings"])
+    corpus_dir = os.path.join(os.path.dirname(db_dir), "corpus")
+    paths = make_corpus(corpus_dir, chunks, 500, seed=0)
+    rag = RAGManager(db_dir, embedding_cache_dir=cache_dir, embeddings=embeddings, vector_backend=params["backend"])
+    rag.ingest_paths(paths, 500, 50)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-dir", help="已有知识库目录；不指定时生成合成知识库")
+    parser.add_argument("--chunks", type=int, default=2000, help="合成知识库的 chunk 数")
+    parser.add_argument("--backend", default="chroma")
+    parser.add_argument("--search-type", default="Vector")
+    parser.add_argument("--fake-embeddings", type=int, nargs="?", const=384, default=0, metavar="DIM",
+                        help="用确定性的假 embedding 代替 all-MiniLM-L6-v2 (只测框架开销)")
+    parser.add_argument("--warm-up", action="store_true", help="构造后调用 RAGManager.warm_up()")
+    parser.add_argument("--runs", type=int, default=3, help="重复次数，结果取中位数")
+    parser.add_argument("--json", help="结果另存为 JSON 文件")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(child(json.loads(args.child))))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        params = {
+            "db_dir": args.db_dir or os.path.join(tmp, "db"),
+            "cache_dir": os.path.join(tmp, "embedding_cache"),
+            "backend": args.backend,
+            "search_type": args.search_type,
+            "fake_embeddings": args.fake_embeddings,
+            "warm_up": args.warm_up,
+            "queries": ["什么是混合检索", "向量数据库如何持久化"],
+        }
+        if not args.db_dir:
+            # 建库放在子进程中，避免父进程的导入影响计时
+            subprocess.run(
+                [sys.executable, "-c",
+                 "import json, sys; sys.path.insert(0, sys.argv[1]); import bench_startup as b; "
+                 "b.build_corpus(*json.loads(sys.argv[2]))",
+                 os.path.dirname(os.path.abspath(__file__)),
+                 json.dumps([params["db_dir"], params["cache_dir"], params, args.chunks])],
+                check=True
+            )
+
+        runs: List[Dict[str, Any]] = []
+        for i in range(args.runs):
+            # 每次都用新的 embedding 缓存目录，第一次查询总是缓存未命中
+            run_params = {**params, "cache_dir": os.path.join(tmp, f"embedding_cache_{i}")}
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", json.dumps(run_params)],
+                check=True, capture_output=True, text=True
+            )
+            runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+            print(f"run {i + 1}:", out.stdout.strip().splitlines()[-1], file=sys.stderr)
+
+    result: Dict[str, Any] = {
+        "params": {k: v for k, v in vars(args).items() if k != "child"},
+        "documents": runs[0]["documents"],
+        "heavy_modules_after_import": runs[0]["heavy_modules_after_import"],
+        "heavy_modules_after_query": runs[0]["heavy_modules_after_query"],
+    }
+    for key in runs[0]:
+        if key.endswith("_seconds"):
+            result[key] = round(statistics.median(r[key] for r in runs), 4)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+离线基准套件: 在合成或自带的语料上测量
+  - 入库吞吐 (chunks/s) 与索引磁盘占用
+  - Vector / BM25 / Hybrid 检索在不同 k 与并发下的延迟 (p50/p95/p99) 和 QPS
+  - 端到端 chat() 延迟 (LLM 为本地 OpenAI 兼容桩服务，延迟可配置)
+
+结果是 JSON (含 git commit 与参数)，指标被展平为 "query.Hybrid.k3.c8.p95_ms" 形式的键，
+用 --compare 与另一次运行的结果对比，超出容忍度的退化会列出并以非零状态码退出，便于在提交之间比较。
+
+用法 (在 RAG_project 目录下):
+    python benchmarks/bench_suite.py --chunks 10000 --fake-embeddings --json base.json
+    python benchmarks/bench_suite.py --chunks 10000 --fake-embeddings --compare base.json --tolerance 0.15
+    python benchmarks/bench_suite.py --corpus ./docs --queries queries.txt --search-types Vector,Hybrid
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rag_engine import RAGManager  # noqa: E402
+from stub_llm_server import StubLLMServer  # noqa: E402
+
+# 合成语料的词表: 中英混合，保证 BM25 和向量检索都有区分度
+TOPICS = [
+    "检索增强生成", "向量数据库", "倒排索引", "文本切分", "重排序", "召回率", "知识库", "大语言模型",
+    "embedding", "tokenizer", "latency", "throughput", "cache", "shard", "quantization", "prompt",
+]
+TERMS = [
+    "性能", "延迟", "吞吐", "并发", "内存", "磁盘", "批处理", "索引", "查询", "评估", "部署", "监控",
+    "index", "query", "batch", "memory", "vector", "score", "filter", "metadata", "replica", "stream",
+]
+PARAGRAPHS_PER_FILE = 500
+
+
+def make_paragraph(rng: random.Random, chars: int) -> str:
+    parts: List[str] = []
+    size = 0
+    while size < chars:
+        sentence = f"{rng.choice(TOPICS)}的{rng.choice(TERMS)}与{rng.choice(TERMS)} {rng.choice(TERMS)} {rng.randint(0, 9999)}。"
+        parts.append(sentence)
+        size += len(sentence)
+    return "".join(parts)
+
+
+def make_corpus(directory: str, chunks: int, chunk_size: int, seed: int) -> List[str]:
+    """
+    生成约 chunks 个 chunk 的语料: 每段略小于 chunk_size、段间空行分隔，recursive 切分后约一段一个 chunk
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for i in range(0, chunks, PARAGRAPHS_PER_FILE):
+        path = os.path.join(directory, f"synthetic_{i // PARAGRAPHS_PER_FILE:05d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            for _ in range(min(PARAGRAPHS_PER_FILE, chunks - i)):
+                f.write(make_paragraph(rng, int(chunk_size * 0.8)) + "\n\n")
+        paths.append(path)
+    return paths
+
+
+def make_queries(count: int, seed: int) -> List[str]:
+    rng = random.Random(seed + 1)
+    return [f"{rng.choice(TOPICS)}的{rng.choice(TERMS)}如何优化 {rng.choice(TERMS)}" for _ in range(count)]
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def run_load(fn: Callable[[str], Any], queries: List[str], concurrency: int, requests: int) -> Dict[str, float]:
+    """
+    concurrency 个线程共发出 requests 个请求 (循环使用 queries)，返回延迟分位数 (ms) 与 QPS
+    """
+    fn(queries[0])  # 预热: 加载索引 / 建立连接
+    latencies: List[float] = []
+
+    def one(i: int):
+        t0 = time.perf_counter()
+        fn(queries[i % len(queries)])
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - start
+    return {
+        "p50_ms": round(percentile(latencies, 0.5), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "qps": round(requests / wall, 2),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def lower_is_better(metric: str) -> bool:
+    return metric.endswith(("_ms", "_seconds", "_bytes"))
+
+
+def compare(current: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[Dict[str, Any]]:
+    """
+    返回超出容忍度的退化项。_ms / _seconds / _bytes 越小越好，其余 (qps、chunks_per_sec) 越大越好
+    """
+    regressions = []
+    for metric, old in sorted(baseline.items()):
+        new = current.get(metric)
+        if new is None or not old:
+            continue
+        change = (new - old) / old
+        worse = change > tolerance if lower_is_better(metric) else change < -tolerance
+        if worse:
+            regressions.append({"metric": metric, "baseline": old, "current": new, "change": round(change, 4)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=1000, help="合成语料的目标 chunk 数 (1k ~ 1M)")
+    parser.add_argument("--corpus", help="使用已有的语料目录 (.pdf/.txt/.md)，代替合成语料")
+    parser.add_argument("--queries", help="查询文件，每行一个；默认生成合成查询")
+    parser.add_argument("--chunk-size", type=int, default=300)
+    parser.add_argument("--chunk-overlap", type=int, default=30)
+    parser.add_argument("--split-method", default="recursive", choices=["recursive", "fixed"])
+    parser.add_argument("--workers", type=int, default=None, help="入库解析进程数，默认 CPU 核数")
+    parser.add_argument("--batch-size", type=int, default=256, help="embedding 批大小")
+    parser.add_argument("--fake-embeddings", type=int, nargs="?", const=384, default=0, metavar="DIM",
+                        help="使用确定性的假 embedding (默认 384 维)，只测索引与检索本身的开销")
+    parser.add_argument("--search-types", default="Vector,BM25,Hybrid")
+    parser.add_argument("--k", default="3,10", help="逗号分隔的 k 列表")
+    parser.add_argument("--concurrency", default="1,8", help="逗号分隔的并发数列表")
+    parser.add_argument("--requests", type=int, default=200, help="每组检索配置的请求数")
+    parser.add_argument("--chat-requests", type=int, default=20, help="端到端 chat 的请求数，0 表示跳过")
+    parser.add_argument("--llm-delay-ms", type=float, default=200, help="桩 LLM 的响应延迟")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="结果另存为 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果对比")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="允许的相对退化 (0.1 = 10%%)")
+    args = parser.parse_args()
+
+    search_types = [s for s in args.search_types.split(",") if s]
+    ks = [int(k) for k in args.k.split(",")]
+    concurrencies = [int(c) for c in args.concurrency.split(",")]
+    metrics: Dict[str, float] = {}
+
+    embeddings = None
+    if args.fake_embeddings:
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        embeddings = DeterministicFakeEmbedding(size=args.fake_embeddings)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = args.corpus
+        if corpus is None:
+            corpus = os.path.join(tmp, "corpus")
+            make_corpus(corpus, args.chunks, args.chunk_size, args.seed)
+        if args.queries:
+            with open(args.queries, encoding="utf-8") as f:
+                queries = [line.strip() for line in f if line.strip()]
+        else:
+            queries = make_queries(100, args.seed)
+
+        db_dir = os.path.join(tmp, "db")
+        manager = RAGManager(db_dir, embedding_cache_dir=None, answer_cache_size=0, embeddings=embeddings)
+
+        stats = manager.ingest_paths(
+            corpus, args.chunk_size, args.chunk_overlap, args.split_method,
+            workers=args.workers, embed_batch_size=args.batch_size
+        )
+        if stats["errors"]:
+            print(json.dumps({"ingest_errors": stats["errors"]}, ensure_ascii=False), file=sys.stderr)
+        metrics["ingest.chunks"] = stats["chunks_written"]
+        metrics["ingest.seconds"] = round(stats["seconds"], 3)
+        metrics["ingest.chunks_per_sec"] = round(stats["chunks_per_sec"], 1)
+        metrics["ingest.embed_seconds"] = round(stats["embed_seconds"], 3)
+        metrics["index.size_bytes"] = dir_size(db_dir)
+
+        for search_type in search_types:
+            for k in ks:
+                def retrieve(query, search_type=search_type, k=k):
+                    return manager.retrieve(query, search_type=search_type, k=k)
+
+                for concurrency in concurrencies:
+                    result = run_load(retrieve, queries, concurrency, args.requests)
+                    for name, value in result.items():
+                        metrics[f"query.{search_type}.k{k}.c{concurrency}.{name}"] = value
+
+        if args.chat_requests:
+            with StubLLMServer(delay=args.llm_delay_ms / 1000) as server:
+                def chat(query):
+                    response = manager.chat(
+                        query, api_key="stub", base_url=server.base_url, model_name="stub",
+                        search_type=search_types[0], k=ks[0], use_cache=False
+                    )
+                    if response.get("error"):
+                        raise RuntimeError(response["error"])
+                    return response
+
+                for concurrency in concurrencies:
+                    result = run_load(chat, queries, concurrency, args.chat_requests)
+                    for name, value in result.items():
+                        metrics[f"chat.{search_types[0]}.k{ks[0]}.c{concurrency}.{name}"] = value
+
+    report: Dict[str, Any] = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "corpus": args.corpus or f"synthetic:{args.chunks}",
+            "params": {
+                "chunk_size": args.chunk_size,
+                "chunk_overlap": args.chunk_overlap,
+                "split_method": args.split_method,
+                "embeddings": f"fake:{args.fake_embeddings}" if args.fake_embeddings else manager.embedding_model_name,
+                "requests": args.requests,
+                "llm_delay_ms": args.llm_delay_ms,
+            },
+        },
+        "metrics": metrics,
+    }
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["regressions"] = compare(metrics, baseline["metrics"], args.tolerance)
+        report["baseline_commit"] = baseline.get("meta", {}).get("commit")
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
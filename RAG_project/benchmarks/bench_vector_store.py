@@ -0,0 +1,152 @@
+"""
+向量库后端基准: 在不同语料规模下对比 Chroma 与 NumpyVectorStore (float32 / int8) 的
+建库耗时、打开耗时 (启动开销)、单查询延迟、批量查询吞吐、recall@k (以精确余弦 top-k 为准) 和内存。
+
+每个 (后端, 规模) 在独立子进程中运行，内存为子进程打开并查询后的 RSS 增量。
+向量为带簇结构的合成单位向量 (与 all-MiniLM-L6-v2 一样已归一化，L2 与余弦排序一致)。
+
+用法 (在 RAG_project 目录下):
+    python benchmarks/bench_vector_store.py --sizes 1000,10000,100000 --dim 384 --queries 200
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_store import BACKENDS, create_vector_store  # noqa: E402
+
+WRITE_BATCH = 5000
+
+
+def make_vectors(n: int, dim: int, seed: int, clusters: int = 64) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vectors = centers[rng.integers(0, clusters, n)] + 0.5 * rng.normal(size=(n, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def rss_bytes() -> Optional[int]:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, n)) for root, _, files in os.walk(path) for n in files)
+
+
+def run_backend(backend: str, n: int, dim: int, queries: np.ndarray, k: int, seed: int, out) -> None:
+    vectors = make_vectors(n, dim, seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = create_vector_store(backend, tmp, None)
+        t0 = time.perf_counter()
+        for start in range(0, n, WRITE_BATCH):
+            end = min(start + WRITE_BATCH, n)
+            store.upsert(
+                [f"c{i}" for i in range(start, end)], vectors[start:end].tolist(),
+                [f"chunk {i}" for i in range(start, end)],
+                [{"source": f"doc_{i % 100}.txt"} for i in range(start, end)]
+            )
+        build_seconds = time.perf_counter() - t0
+        store.close()
+        del store, vectors
+
+        rss_before = rss_bytes()
+        t0 = time.perf_counter()
+        store = create_vector_store(backend, tmp, None)
+        store.count()
+        open_seconds = time.perf_counter() - t0
+
+        latencies = []
+        ids: List[List[str]] = []
+        for q in queries:
+            t0 = time.perf_counter()
+            docs = store.query_batch([q.tolist()], k)[0]
+            latencies.append((time.perf_counter() - t0) * 1000)
+            ids.append([d.id for d in docs])
+
+        t0 = time.perf_counter()
+        store.query_batch(queries.tolist(), k)
+        batch_seconds = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        store.query_batch([queries[0].tolist()], k, filter={"source": "doc_7.txt"})
+        filter_ms = (time.perf_counter() - t0) * 1000
+        rss_after = rss_bytes()
+        disk = dir_size(tmp)
+        store.close()
+
+    latencies.sort()
+    out.put({
+        "build_seconds": round(build_seconds, 3),
+        "open_seconds": round(open_seconds, 4),
+        "query_p50_ms": round(statistics.median(latencies), 3),
+        "query_p95_ms": round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 3),
+        "batch_qps": round(len(queries) / batch_seconds, 1),
+        "filtered_query_ms": round(filter_ms, 3),
+        "rss_delta_bytes": rss_after - rss_before if rss_before is not None else None,
+        "disk_bytes": disk,
+        "ids": ids,
+    })
+
+
+def recall_at_k(found: List[List[str]], truth: List[List[str]]) -> float:
+    return sum(len(set(f) & set(t)) for f, t in zip(found, truth)) / sum(len(t) for t in truth)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="逗号分隔的向量数")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {}
+    for n in (int(s) for s in args.sizes.split(",")):
+        vectors = make_vectors(n, args.dim, args.seed)
+        rng = np.random.default_rng(args.seed + 1)
+        queries = vectors[rng.integers(0, n, args.queries)] + 0.1 * rng.normal(size=(args.queries, args.dim))
+        queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+        truth = [[f"c{i}" for i in np.argsort(-(vectors @ q))[:args.k]] for q in queries]
+        del vectors
+
+        for backend in args.backends.split(","):
+            out = multiprocessing.Queue()
+            proc = multiprocessing.Process(
+                target=run_backend, args=(backend, n, args.dim, queries, args.k, args.seed, out)
+            )
+            proc.start()
+            row = out.get()
+            proc.join()
+            row[f"recall@{args.k}"] = round(recall_at_k(row.pop("ids"), truth), 4)
+            results[f"{backend}.n{n}"] = row
+            print(backend, n, json.dumps(row), file=sys.stderr)
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
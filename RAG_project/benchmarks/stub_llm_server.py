@@ -0,0 +1,172 @@
+"""
+本地 OpenAI 兼容的桩服务 (stub LLM)，用于测试和基准，不访问真实模型。
+
+支持 POST /v1/chat/completions 与 /chat/completions (含 stream=true 的 SSE)，
+可配置首 token 前延迟、每 token 间隔，以及前 N 次请求返回 429 (验证重试)。
+
+用法:
+    python benchmarks/stub_llm_server.py --port 8900 --delay-ms 200
+    # Base URL 填 http://127.0.0.1:8900/v1 ，API Key 任意
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_ANSWER = "这是桩服务返回的回答，用于测试 RAG 流程。"
+
+
+class StubLLMServer:
+    """
+    在后台线程运行的桩服务。
+
+        with StubLLMServer(delay=0.1) as server:
+            base_url = server.base_url
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        delay: float = 0.0,
+        token_interval: float = 0.0,
+        answer: str = DEFAULT_ANSWER,
+        fail_first: int = 0,
+        fail_status: int = 429
+    ):
+        self.delay = delay
+        self.token_interval = token_interval
+        self.answer = answer
+        self.fail_remaining = fail_first
+        self.fail_status = fail_status
+        self.requests = 0
+        self.connections = set()
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with server._lock:
+                    server.requests += 1
+                    server.connections.add(self.client_address)
+                    fail = server.fail_remaining > 0
+                    if fail:
+                        server.fail_remaining -= 1
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self._json(404, {"error": {"message": "not found"}})
+                if fail:
+                    return self._json(server.fail_status, {"error": {"message": "stub failure"}})
+
+                time.sleep(server.delay)
+                model = body.get("model", "stub")
+                if body.get("stream"):
+                    return self._stream(model)
+                self._json(200, {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": server.answer},
+                        "finish_reason": "stop"
+                    }],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": len(server.answer), "total_tokens": 1 + len(server.answer)}
+                })
+
+            def _json(self, status, payload):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, model):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for ch in server.answer:
+                        self._chunk(model, {"content": ch}, None)
+                        time.sleep(server.token_interval)
+                    self._chunk(model, {}, "stop")
+                    self._write(b"data: [DONE]\n\n")
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端取消了流式请求
+                    pass
+
+            def _chunk(self, model, delta, finish_reason):
+                payload = {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+                }
+                self._write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+            def _write(self, data: bytes):
+                self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--delay-ms", type=float, default=0, help="首 token 前的延迟")
+    parser.add_argument("--token-ms", type=float, default=0, help="流式输出时每个 token 的间隔")
+    parser.add_argument("--fail-first", type=int, default=0, help="前 N 个请求返回 429")
+    args = parser.parse_args()
+
+    server = StubLLMServer(
+        host=args.host, port=args.port, delay=args.delay_ms / 1000,
+        token_interval=args.token_ms / 1000, fail_first=args.fail_first
+    )
+    print(f"stub LLM listening on {server.base_url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
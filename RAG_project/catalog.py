@@ -0,0 +1,242 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import List, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def file_content_hash(file_path: str, block_size: int = 1024 * 1024) -> str:
+    """
+    分块计算文件内容的 sha256，避免一次性读入大文件。
+    """
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def make_chunk_id(source: str, text: str) -> str:
+    """
+    由 source + chunk 内容哈希得到确定性的 chunk id。
+    同一文件重复入库时 id 不变，可据此跳过未变化的 chunk。
+    """
+    content = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return hashlib.sha1(f"{source}\0{content}".encode("utf-8")).hexdigest()
+
+
+@contextlib.contextmanager
+def file_lock(lock_path: str, timeout: float = 10.0, stale_after: float = 30.0):
+    """
+    基于 O_CREAT | O_EXCL 的跨进程文件锁 (Windows / Linux 通用)。
+    持有锁的进程异常退出时，超过 stale_after 秒的锁文件视为失效。
+    """
+    deadline = time.time() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > stale_after:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            if time.time() > deadline:
+                raise TimeoutError(f"获取锁超时: {lock_path}")
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+
+class DocumentCatalog:
+    """
+    按 source 维护的文档目录 (catalog)。
+
+    记录每个文件的 chunk 数、总字符数、入库时间和内容哈希，持久化为
+    persist_directory 下的一个 JSON 文件。知识库是否为空、文档列表展示
+    都直接读这里，不再对 Chroma 做全量扫描。
+
+    多个实例共享同一目录时: 每次修改都在文件锁内"重新读取 -> 修改 -> 写回"，
+    读取时按文件 mtime 判断是否需要重新加载，因此不会互相覆盖。
+    """
+
+    FILE_NAME = "catalog.json"
+
+    def __init__(self, persist_directory: str):
+        self.path = os.path.join(persist_directory, self.FILE_NAME)
+        self.lock_path = self.path + ".lock"
+        self._entries: Dict[str, Dict] = {}
+        self._total_chunks = 0
+        self._stamp = None
+        # 文件存在但无法解析时为 True，调用方应从向量库 rebuild
+        self.corrupted = False
+        self._load()
+
+    @property
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    @property
+    def needs_rebuild(self) -> bool:
+        """
+        catalog 文件缺失 (旧版本数据库) 或已损坏时需要从向量库重建。
+        """
+        return self.corrupted or not self.exists
+
+    @property
+    def version(self):
+        """
+        catalog 文件的版本戳 (mtime / 大小 / inode)，任何进程修改 catalog 后都会变化
+        """
+        return self._file_stamp()
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _load(self) -> bool:
+        """
+        从磁盘加载 catalog。文件损坏时清空内存状态并标记 corrupted，返回 False。
+        """
+        stamp = self._file_stamp()
+        self._stamp = stamp
+        self.corrupted = False
+        if stamp is None:
+            self._entries = {}
+            self._total_chunks = 0
+            return True
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            total = sum(int(e["count"]) for e in entries.values())
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning("catalog 文件损坏，需要从向量库重建: %s", e)
+            self._entries = {}
+            self._total_chunks = 0
+            self.corrupted = True
+            return False
+        self._entries = entries
+        self._total_chunks = total
+        return True
+
+    def _refresh(self):
+        # 其他实例修改过文件时重新加载
+        if self._file_stamp() != self._stamp:
+            self._load()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        # 原子替换，避免写一半时进程退出导致 catalog 损坏
+        os.replace(tmp_path, self.path)
+        self._total_chunks = sum(e["count"] for e in self._entries.values())
+        self._stamp = self._file_stamp()
+        self.corrupted = False
+
+    @contextlib.contextmanager
+    def _mutate(self):
+        """
+        修改 catalog 的统一入口: 加锁 -> 从磁盘重新读取 -> 修改 -> 写回
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with file_lock(self.lock_path):
+            self._load()
+            yield self._entries
+            self._save()
+
+    def record_ingest(
+        self,
+        source: str,
+        chunk_count: int,
+        total_chars: int,
+        content_hash: Optional[str] = None,
+        split_params: Optional[Dict] = None
+    ):
+        """
+        记录一次入库。chunk_count / total_chars 是该 source 入库后库中的实际数量
+        (重复入库时覆盖而不是累加)，content_hash 和 split_params 对应当前库中的版本。
+        """
+        with self._mutate() as entries:
+            entries[source] = {
+                "source": source,
+                "count": chunk_count,
+                "total_chars": total_chars,
+                "ingested_at": time.time(),
+                "content_hash": content_hash,
+                "split_params": split_params,
+            }
+
+    def remove(self, source: str):
+        with self._mutate() as entries:
+            entries.pop(source, None)
+
+    def mark_stale(self, sources):
+        """
+        清除若干 source 的内容哈希，下次入库时即使文件没变也会重新处理
+        """
+        with self._mutate() as entries:
+            for source in sources:
+                if source in entries:
+                    entries[source]["content_hash"] = None
+
+    def clear(self):
+        """
+        清空 catalog。写入空文件而不是删除，以免被当作旧数据库触发迁移。
+        """
+        with self._mutate() as entries:
+            entries.clear()
+
+    def rebuild(self, metadatas: List[Dict], documents: Optional[List[str]] = None):
+        """
+        从已有的 chunk 元数据重建 catalog (仅用于旧版本数据库迁移或 catalog 损坏时)。
+        迁移得到的条目没有真实的入库时间和内容哈希，均置为 None。
+        """
+        with self._mutate() as entries:
+            entries.clear()
+            for idx, m in enumerate(metadatas):
+                if not m:
+                    continue
+                src = m.get("source", "Unknown")
+                if src not in entries:
+                    entries[src] = {"source": src, "count": 0, "total_chars": 0,
+                                    "ingested_at": None, "content_hash": None, "split_params": None}
+                entries[src]["count"] += 1
+                if documents is not None and documents[idx]:
+                    entries[src]["total_chars"] += len(documents[idx])
+
+    def get(self, source: str) -> Optional[Dict]:
+        self._refresh()
+        entry = self._entries.get(source)
+        return dict(entry) if entry else None
+
+    def list(self) -> List[Dict]:
+        self._refresh()
+        return [dict(e) for e in self._entries.values()]
+
+    @property
+    def total_chunks(self) -> int:
+        self._refresh()
+        return self._total_chunks
+
+    def is_empty(self) -> bool:
+        return self.total_chunks == 0
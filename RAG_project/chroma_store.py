@@ -0,0 +1,56 @@
+from typing import Dict, List, Optional
+
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+
+from vector_store import Where
+
+
+class ChromaVectorStore(Chroma):
+    """
+    Chroma 加上与 NumpyVectorStore 一致的批量接口
+    """
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str], metadatas: List[Dict]):
+        self._collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def count(self) -> int:
+        return self._collection.count()
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[Where] = None, **kwargs
+    ) -> List[Document]:
+        # 与 Chroma 的实现结果相同，但返回的 Document 带 chunk id (对话历史按 id 引用)
+        return self.query_batch([embedding], k, filter)[0]
+
+    def query_batch(
+        self, query_embeddings: List[List[float]], k: int, filter: Optional[Where] = None
+    ) -> List[List[Document]]:
+        # 一次 Chroma 查询带上全部查询向量，结果与逐个 similarity_search_by_vector 相同
+        results = self._collection.query(
+            query_embeddings=query_embeddings, n_results=k, where=filter, include=["documents", "metadatas"]
+        )
+        return [
+            [
+                Document(id=chunk_id, page_content=text, metadata=meta or {})
+                for chunk_id, text, meta in zip(ids, texts, metas)
+            ]
+            for ids, texts, metas in zip(results["ids"], results["documents"], results["metadatas"])
+        ]
+
+    def clear(self):
+        # 删除并重建 collection，目录和客户端保持不变
+        name, metadata = self._collection.name, self._collection.metadata
+        self._client.delete_collection(name)
+        self._collection = self._client.get_or_create_collection(name=name, embedding_function=None, metadata=metadata)
+
+    def close(self):
+        """
+        停止本目录的 Chroma 客户端 (System)，释放 HNSW 索引占用的内存和 SQLite 连接。
+        chromadb 按目录在进程内共享客户端，因此同一目录的其他 Chroma 实例也随之失效
+        """
+        from chromadb.api.client import SharedSystemClient
+
+        system = SharedSystemClient._identifer_to_system.pop(self._client._identifier, None)
+        if system is not None:
+            system.stop()
@@ -0,0 +1,142 @@
+import re
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+from langchain_core.documents import Document
+
+from analyzer import Analyzer, CJKBigramAnalyzer
+from utils import estimate_tokens
+
+# 句子边界: 中英文句末标点或换行之后
+_SENTENCE_END = re.compile(r"(?<=[。！？!?；;.\n])")
+DOC_SEPARATOR = "\n\n---\n\n"
+EMPTY_CONTEXT = "（无相关内容）"
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s for s in _SENTENCE_END.split(text) if s.strip()]
+
+
+class ContextPacker:
+    """
+    在 token 预算内组装 RAG 上下文，prompt 大小不再随 k 和 chunk_size 线性增长。
+
+    1. 按融合得分排序 (有 rrf_score 时)，否则保持检索顺序
+    2. 去掉近似重复的 chunk (分词集合的 Jaccard 相似度 >= dedup_threshold，如相邻 chunk 的重叠部分)
+    3. 超过 trim_min_tokens 的 chunk 只保留命中查询词的句子及其前后 sentence_window 句
+    4. 依次放入预算，放不下的 chunk 按句截断，剩余预算不足 min_tokens 时丢弃
+
+    token 数用 utils.estimate_tokens 估算。
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 2000,
+        dedup_threshold: float = 0.8,
+        trim_min_tokens: int = 120,
+        sentence_window: int = 1,
+        min_tokens: int = 40,
+        analyzer: Optional[Analyzer] = None
+    ):
+        self.max_tokens = max_tokens
+        self.dedup_threshold = dedup_threshold
+        self.trim_min_tokens = trim_min_tokens
+        self.sentence_window = sentence_window
+        self.min_tokens = min_tokens
+        self.analyzer = analyzer or CJKBigramAnalyzer()
+
+    def pack(self, query: str, docs: Sequence[Document]) -> Dict[str, Any]:
+        """
+        返回 {"context", "documents", "report"}。documents 是实际放入上下文的 (可能被裁剪的) chunk；
+        report 含 docs_in / docs_out / duplicates / trimmed / truncated / dropped /
+        original_tokens / context_tokens / tokens_saved
+        """
+        report = {"docs_in": len(docs), "duplicates": 0, "trimmed": 0, "truncated": 0, "dropped": 0}
+        original_tokens = estimate_tokens(DOC_SEPARATOR.join(d.page_content for d in docs)) if docs else 0
+
+        ranked = sorted(
+            enumerate(docs), key=lambda x: (-(x[1].metadata.get("rrf_score") or 0.0), x[0])
+        )
+        query_terms = set(self.analyzer.tokenize(query))
+        kept: List[Document] = []
+        seen: List[Set[str]] = []
+        budget = self.max_tokens
+        for _, doc in ranked:
+            terms = set(self.analyzer.tokenize(doc.page_content))
+            if any(self._jaccard(terms, other) >= self.dedup_threshold for other in seen):
+                report["duplicates"] += 1
+                continue
+            seen.append(terms)
+
+            text = doc.page_content
+            if estimate_tokens(text) > self.trim_min_tokens:
+                trimmed = self._trim(text, query_terms)
+                if trimmed != text:
+                    report["trimmed"] += 1
+                    text = trimmed
+
+            # 计入分隔符的开销
+            cost = estimate_tokens(text) + (estimate_tokens(DOC_SEPARATOR) if kept else 0)
+            if cost > budget:
+                if budget < self.min_tokens:
+                    report["dropped"] += 1
+                    continue
+                text = self._truncate(text, budget - (cost - estimate_tokens(text)))
+                if not text:
+                    report["dropped"] += 1
+                    continue
+                report["truncated"] += 1
+                cost = estimate_tokens(text) + (estimate_tokens(DOC_SEPARATOR) if kept else 0)
+            budget -= cost
+            kept.append(Document(id=doc.id, page_content=text, metadata=doc.metadata))
+
+        context = DOC_SEPARATOR.join(d.page_content for d in kept) if kept else EMPTY_CONTEXT
+        context_tokens = estimate_tokens(context) if kept else 0
+        report.update(
+            docs_out=len(kept),
+            original_tokens=original_tokens,
+            context_tokens=context_tokens,
+            tokens_saved=max(original_tokens - context_tokens, 0),
+        )
+        return {"context": context, "documents": kept, "report": report}
+
+    @staticmethod
+    def _jaccard(a: Set[str], b: Set[str]) -> float:
+        if not a or not b:
+            return 0.0
+        return len(a & b) / len(a | b)
+
+    def _trim(self, text: str, query_terms: Set[str]) -> str:
+        sentences = split_sentences(text)
+        hits = [i for i, s in enumerate(sentences) if query_terms & set(self.analyzer.tokenize(s))]
+        if not hits:
+            # 没有命中查询词的句子 (如纯语义匹配)，保留原文，交给预算截断
+            return text
+        keep = set()
+        for i in hits:
+            keep.update(range(max(0, i - self.sentence_window), min(len(sentences), i + self.sentence_window + 1)))
+        parts: List[str] = []
+        previous = -1
+        for i in sorted(keep):
+            if parts and i != previous + 1:
+                parts.append(" … ")
+            parts.append(sentences[i])
+            previous = i
+        return "".join(parts).strip()
+
+    @staticmethod
+    def _truncate(text: str, max_tokens: int) -> str:
+        # 按句截断；第一句就超出时按字符截断
+        parts: List[str] = []
+        used = 0
+        for sentence in split_sentences(text):
+            tokens = estimate_tokens(sentence)
+            if used + tokens > max_tokens:
+                break
+            parts.append(sentence)
+            used += tokens
+        if not parts and max_tokens > 0:
+            cut = text[:max_tokens]
+            while cut and estimate_tokens(cut) > max_tokens:
+                cut = cut[:-max(1, len(cut) // 10)]
+            return cut.strip()
+        return "".join(parts).strip()
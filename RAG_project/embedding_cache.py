@@ -0,0 +1,198 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class EmbeddingCache:
+    """
+    磁盘上的 embedding 缓存: (模型名 + 文本哈希) -> 向量。
+
+    - 向量以 float32 连续存放在一个定长行的数组文件 (vectors.f32) 中，第 i 行即 slot i
+    - SQLite 只保存 key -> slot 的映射和最近使用序号，用于 LRU 淘汰
+    - 条目数达到 max_entries 后淘汰最久未使用的条目，复用其 slot，文件大小有上界
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, max_entries: int = 200_000):
+        safe_name = re.sub(r"[^0-9A-Za-z_.-]+", "_", model_name)
+        self.directory = os.path.join(cache_dir, safe_name)
+        os.makedirs(self.directory, exist_ok=True)
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                slot INTEGER NOT NULL,
+                last_used INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_lru ON entries(last_used);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        """)
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        self.dim: Optional[int] = int(row[0]) if row else None
+        row = self._conn.execute("SELECT MAX(last_used) FROM entries").fetchone()
+        self._clock = row[0] or 0
+        self._vectors_path = os.path.join(self.directory, "vectors.f32")
+        self._file = open(self._vectors_path, "r+b" if os.path.exists(self._vectors_path) else "w+b")
+
+    def key(self, text: str, kind: str = "doc") -> str:
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def _row_bytes(self) -> int:
+        return self.dim * 4
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """
+        批量查询，返回命中的 key -> 向量，并更新 LRU 序号和命中计数
+        """
+        if not keys:
+            return {}
+        with self._lock:
+            found: Dict[str, int] = {}
+            unique = list(dict.fromkeys(keys))
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                for key, slot in self._conn.execute(
+                    f"SELECT key, slot FROM entries WHERE key IN ({marks})", batch
+                ):
+                    found[key] = slot
+            result = {}
+            if found:
+                row_bytes = self._row_bytes()
+                # 按 slot 顺序读取，减少随机寻址
+                for key, slot in sorted(found.items(), key=lambda x: x[1]):
+                    self._file.seek(slot * row_bytes)
+                    result[key] = np.frombuffer(self._file.read(row_bytes), dtype=np.float32).tolist()
+                self._clock += 1
+                self._conn.executemany(
+                    "UPDATE entries SET last_used = ? WHERE key = ?", [(self._clock, k) for k in found]
+                )
+                self._conn.commit()
+            self.hits += sum(1 for k in keys if k in result)
+            self.misses += sum(1 for k in keys if k not in result)
+            return result
+
+    def put_many(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+        with self._lock:
+            vectors = np.asarray(list(items.values()), dtype=np.float32)
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('dim', ?)", (str(self.dim),))
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"向量维度 {vectors.shape[1]} 与缓存维度 {self.dim} 不一致")
+
+            keys = list(items.keys())
+            existing = {}
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                existing.update(self._conn.execute(
+                    f"SELECT key, slot FROM entries WHERE key IN ({marks})", batch
+                ).fetchall())
+            # 已缓存的 key 不重复写入
+            fresh = [k for k in keys if k not in existing]
+
+            # 分配 slot: 先用空闲的新行，满了再淘汰最久未使用的条目
+            count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            free = max(0, self.max_entries - count)
+            slots = {}
+            next_slot = self._conn.execute("SELECT COALESCE(MAX(slot) + 1, 0) FROM entries").fetchone()[0]
+            for k in fresh[:free]:
+                slots[k] = next_slot
+                next_slot += 1
+            overflow = fresh[free:]
+            if overflow:
+                victims = self._conn.execute(
+                    "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (len(overflow),)
+                ).fetchall()
+                self._conn.executemany("DELETE FROM entries WHERE key = ?", [(v[0],) for v in victims])
+                for k, (_, slot) in zip(overflow, victims):
+                    slots[k] = slot
+
+            row_bytes = self._row_bytes()
+            self._clock += 1
+            rows = []
+            for k, vec in zip(keys, vectors):
+                if k not in slots:
+                    # 单批超过 max_entries 时多出来的部分不缓存
+                    continue
+                self._file.seek(slots[k] * row_bytes)
+                self._file.write(vec.tobytes())
+                rows.append((k, slots[k], self._clock))
+            self._file.flush()
+            self._conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self),
+            "max_entries": self.max_entries,
+        }
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    在任意 Embeddings 外包一层磁盘缓存。文档和查询的 embedding 都会走缓存，
+    未命中的文本合并成一批交给底层模型计算。
+    """
+
+    def __init__(self, underlying: Embeddings, cache: EmbeddingCache):
+        self.underlying = underlying
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_many(texts, "doc")
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        批量计算查询 embedding (与 embed_query 共用缓存键)。Embeddings 接口没有批量查询方法，
+        未命中的查询合并成一批交给 embed_documents (all-MiniLM 等对称模型两者结果相同)
+        """
+        return self._embed_many(texts, "query")
+
+    def _embed_many(self, texts: List[str], kind: str) -> List[List[float]]:
+        keys = [self.cache.key(t, kind) for t in texts]
+        found = self.cache.get_many(keys)
+        missing = list(dict.fromkeys(k for k in keys if k not in found))
+        if missing:
+            text_by_key = dict(zip(keys, texts))
+            vectors = self.underlying.embed_documents([text_by_key[k] for k in missing])
+            computed = dict(zip(missing, vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+        return [list(found[k]) for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self.cache.key(text, "query")
+        found = self.cache.get_many([key])
+        if key in found:
+            return found[key]
+        vector = self.underlying.embed_query(text)
+        self.cache.put_many({key: vector})
+        return vector
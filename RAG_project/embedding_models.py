@@ -0,0 +1,367 @@
+"""
+embedding 模型的创建与推理后端 (同一个 all-MiniLM-L6-v2 模型):
+
+- "torch": sentence-transformers (HuggingFaceEmbeddings)，默认，可调 batch_size 和 intra-op 线程数
+- "onnx": onnxruntime 推理 Hugging Face Hub 上该模型导出的 onnx/model.onnx，分词用 tokenizers，
+  按长度分桶组批 (同一批文本长度接近，padding 少)
+- "onnx-int8": 同上，使用 int8 动态量化的模型 (Hub 上的 onnx/model_quint8_avx2.onnx；本地模型目录
+  没有量化文件时用 onnxruntime.quantization 从 model.onnx 生成，需要 pip install onnx)
+
+processes > 0 时在多个子进程中各加载一份模型并行编码 (ProcessPoolEmbeddings)。
+所有重量级依赖 (torch / sentence-transformers / onnxruntime / tokenizers) 都在第一次 embed 时才导入。
+切换后端前可以用 benchmarks/bench_embeddings.py 测吞吐和相对默认后端的向量偏差。
+"""
+import functools
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+BACKENDS = ("torch", "onnx", "onnx-int8")
+# onnx-int8 默认使用的 Hub 预量化文件 (x86 AVX2 即可运行)
+DEFAULT_INT8_FILE = "onnx/model_quint8_avx2.onnx"
+
+
+def huggingface_factory(model_name: str) -> Callable[[], Embeddings]:
+    def factory() -> Embeddings:
+        # sentence-transformers / torch 的导入和模型加载要数秒，放到第一次 embed 时
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=model_name)
+    return factory
+
+
+class LazyEmbeddings(Embeddings):
+    """
+    第一次 embed 时才创建底层模型。外面再套一层 CachedEmbeddings 时，缓存命中的查询
+    完全不需要加载模型；也可以调用 load() (如 RAGManager.warm_up 在后台线程中) 提前加载。
+    """
+
+    def __init__(self, factory: Callable[[], Embeddings], model_name: str):
+        self.model_name = model_name
+        self._factory = factory
+        self._model: Optional[Embeddings] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self) -> Embeddings:
+        if self._model is None:
+            with self._lock:
+                # 并发的首次调用只加载一次
+                if self._model is None:
+                    self._model = self._factory()
+        return self._model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.load().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.load().embed_query(text)
+
+
+# ---------- 组批 ----------
+
+def length_buckets(lengths: Sequence[int], batch_size: int) -> List[List[int]]:
+    """
+    按长度降序排列后每 batch_size 个一批，返回各批的原始下标。
+    每批只需 padding 到批内最长，长短文本混在一起时能省掉大部分 padding
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def padding_overhead(lengths: Sequence[int], batches: Sequence[Sequence[int]]) -> float:
+    """
+    按 batches 组批时 padding 的 token 数占实际 token 数的比例
+    """
+    real = sum(lengths)
+    padded = sum(max(lengths[i] for i in batch) * len(batch) for batch in batches if batch)
+    return (padded - real) / real if real else 0.0
+
+
+# ---------- ONNX 后端 ----------
+
+def mean_pool(hidden: np.ndarray, attention_mask: np.ndarray, normalize: bool = True) -> np.ndarray:
+    """
+    按 attention_mask 对 token 向量取平均 (与 sentence-transformers 的 Pooling(mean) 相同)，再做 L2 归一化
+    """
+    mask = attention_mask[..., None].astype(np.float32)
+    pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+    if normalize:
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        pooled = pooled / np.clip(norms, 1e-12, None)
+    return pooled.astype(np.float32)
+
+
+def resolve_model_dir(model_name: str, files: Sequence[str]) -> str:
+    """
+    本地目录直接返回；否则从 Hugging Face Hub 下载 (只下载 files 和分词器) 到本地缓存
+    """
+    if os.path.isdir(model_name):
+        return model_name
+    from huggingface_hub import snapshot_download
+    return snapshot_download(model_name, allow_patterns=["tokenizer.json", "config.json", *files])
+
+
+def quantize_model(model_path: str, output_path: str) -> str:
+    """
+    int8 动态量化 (权重 int8，激活运行时量化)，结果缓存在 output_path
+    """
+    if not os.path.exists(output_path):
+        try:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+        except ImportError as e:
+            raise ImportError("int8 quantization needs the onnx package: pip install onnx") from e
+        quantize_dynamic(model_path, output_path, weight_type=QuantType.QInt8)
+    return output_path
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    onnxruntime 推理 sentence-transformers 模型: 分词 -> Transformer (ONNX) -> mean pooling -> 归一化。
+
+    - batch_size: 每次推理的文本数；bucket_by_length=True 时先按 token 数分桶再组批
+    - threads: onnxruntime 的 intra-op 线程数，None 表示由 onnxruntime 决定 (通常为物理核数)。
+      与 processes 同时使用时，processes * threads 不宜超过核数
+    - quantize: 使用 int8 量化模型
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL_NAME,
+        quantize: bool = False,
+        batch_size: int = 32,
+        threads: Optional[int] = None,
+        max_length: int = 256,
+        bucket_by_length: bool = True,
+        onnx_file: Optional[str] = None
+    ):
+        self.model_name = model_name
+        self.quantize = quantize
+        self.batch_size = batch_size
+        self.threads = threads
+        self.max_length = max_length
+        self.bucket_by_length = bucket_by_length
+        self.onnx_file = onnx_file or (DEFAULT_INT8_FILE if quantize else "onnx/model.onnx")
+        self._components = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """
+        返回 (tokenizer, session)
+        """
+        from onnxruntime import GraphOptimizationLevel, InferenceSession, SessionOptions
+        from tokenizers import Tokenizer
+
+        model_dir = resolve_model_dir(self.model_name, [self.onnx_file])
+        model_path = os.path.join(model_dir, self.onnx_file)
+        if self.quantize and not os.path.exists(model_path):
+            # 本地导出的模型目录通常只有 fp32 的 model.onnx
+            model_path = quantize_model(os.path.join(model_dir, "onnx", "model.onnx"),
+                                        os.path.join(model_dir, "onnx", "model_int8.onnx"))
+        tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        tokenizer.enable_truncation(self.max_length)
+        # 只 padding 到批内最长
+        tokenizer.enable_padding(pad_id=tokenizer.token_to_id("[PAD]") or 0, pad_token="[PAD]")
+        options = SessionOptions()
+        options.graph_optimization_level = GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+        session = InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        return tokenizer, session
+
+    def _get_components(self):
+        if self._components is None:
+            with self._lock:
+                if self._components is None:
+                    self._components = self._load()
+        return self._components
+
+    def _encode_batch(self, tokenizer, session, texts: List[str]) -> np.ndarray:
+        encodings = tokenizer.encode_batch(texts)
+        input_ids = np.asarray([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.asarray([e.attention_mask for e in encodings], dtype=np.int64)
+        feed = {"input_ids": input_ids, "attention_mask": attention_mask,
+                "token_type_ids": np.zeros_like(input_ids)}
+        wanted = {i.name for i in session.get_inputs()}
+        hidden = session.run(None, {k: v for k, v in feed.items() if k in wanted})[0]
+        return mean_pool(hidden, attention_mask)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        tokenizer, session = self._get_components()
+        if self.bucket_by_length:
+            # 先分词一次得到各文本的 token 数 (分词器开启了 padding，用 attention_mask 计数)，分词开销远小于推理
+            lengths = [sum(e.attention_mask) for e in tokenizer.encode_batch(list(texts), add_special_tokens=False)]
+            batches = length_buckets(lengths, self.batch_size)
+        else:
+            batches = [list(range(i, min(i + self.batch_size, len(texts))))
+                       for i in range(0, len(texts), self.batch_size)]
+        out = np.empty((len(texts), 0), dtype=np.float32)
+        for batch in batches:
+            vectors = self._encode_batch(tokenizer, session, [texts[i] for i in batch])
+            if out.shape[1] == 0:
+                out = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            out[batch] = vectors
+        return out.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+# ---------- 多进程 ----------
+
+_worker_model: Optional[Embeddings] = None
+
+
+def _init_worker(factory: Callable[[], Embeddings]):
+    global _worker_model
+    _worker_model = factory()
+
+
+def _worker_embed(texts: List[str]) -> List[List[float]]:
+    return _worker_model.embed_documents(texts)
+
+
+class ProcessPoolEmbeddings(Embeddings):
+    """
+    在 processes 个子进程中各加载一份模型 (factory 必须可 pickle)，embed_documents 把文本
+    按长度排序后切成 chunk_size 一块分给各进程，结果按原顺序返回。查询只有一条文本，
+    进程间通信不划算，在当前进程中用 query_model 计算 (第一次查询时才创建)
+    """
+
+    def __init__(self, factory: Callable[[], Embeddings], processes: int, chunk_size: int = 256):
+        if processes < 1:
+            raise ValueError(f"processes must be >= 1, got {processes}")
+        self.factory = factory
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._query_model: Optional[Embeddings] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                import multiprocessing
+                # spawn: 不继承父进程的线程 (torch / onnxruntime 线程池在 fork 后可能死锁)
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker, initargs=(self.factory,)
+                )
+            return self._pool
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        chunks = [order[i:i + self.chunk_size] for i in range(0, len(order), self.chunk_size)]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        pool = self._get_pool()
+        for chunk, vectors in zip(chunks, pool.map(_worker_embed, [[texts[i] for i in c] for c in chunks])):
+            for i, vector in zip(chunk, vectors):
+                results[i] = vector
+        return results
+
+    def embed_query(self, text: str) -> List[float]:
+        if self._query_model is None:
+            with self._lock:
+                if self._query_model is None:
+                    self._query_model = self.factory()
+        return self._query_model.embed_query(text)
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+# ---------- 按配置创建 ----------
+
+def build_embeddings(
+    model_name: str = DEFAULT_MODEL_NAME,
+    backend: str = "torch",
+    batch_size: int = 32,
+    threads: Optional[int] = None,
+    bucket_by_length: bool = True
+) -> Embeddings:
+    """
+    在当前进程中创建 embedding 模型 (会立即加载)
+    """
+    if backend == "torch":
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        from langchain_huggingface import HuggingFaceEmbeddings
+        # sentence-transformers 的 encode 本身就按长度排序组批
+        return HuggingFaceEmbeddings(model_name=model_name, encode_kwargs={"batch_size": batch_size})
+    if backend in ("onnx", "onnx-int8"):
+        embeddings = OnnxEmbeddings(
+            model_name, quantize=backend == "onnx-int8", batch_size=batch_size, threads=threads,
+            bucket_by_length=bucket_by_length
+        )
+        embeddings._get_components()
+        return embeddings
+    raise ValueError(f"unknown embedding backend: {backend} (expected one of {BACKENDS})")
+
+
+def embedding_factory(
+    model_name: str = DEFAULT_MODEL_NAME,
+    backend: str = "torch",
+    batch_size: int = 32,
+    threads: Optional[int] = None,
+    processes: int = 0,
+    bucket_by_length: bool = True
+) -> Callable[[], Embeddings]:
+    """
+    返回创建 embedding 模型的工厂 (交给 LazyEmbeddings，第一次 embed 时才调用)。参数不合法时立即抛 ValueError
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown embedding backend: {backend} (expected one of {BACKENDS})")
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be >= 1, got {batch_size}")
+    build = functools.partial(
+        build_embeddings, model_name, backend, batch_size, threads, bucket_by_length
+    )
+    if processes:
+        # 每个进程分块的大小取 batch_size 的整数倍，子进程内仍按 batch_size 推理
+        return functools.partial(ProcessPoolEmbeddings, build, processes, batch_size * 8)
+    return build
+
+
+def embedding_id(model_name: str, backend: str = "torch") -> str:
+    """
+    embedding 缓存使用的模型标识。fp32 的 torch / onnx 结果一致 (误差约 1e-6)，共用缓存；
+    int8 量化后向量有偏差，单独缓存
+    """
+    return f"{model_name}@{backend}" if backend == "onnx-int8" else model_name
+
+
+def create_embeddings(model_name: str = DEFAULT_MODEL_NAME, **options: Any) -> LazyEmbeddings:
+    """
+    按 embedding_options ({"backend", "batch_size", "threads", "processes", "bucket_by_length"}) 创建懒加载的模型
+    """
+    return LazyEmbeddings(
+        embedding_factory(model_name, **options), embedding_id(model_name, options.get("backend", "torch"))
+    )
+
+
+def env_embedding_options() -> Dict[str, Any]:
+    """
+    环境变量 RAG_EMBEDDING_BACKEND / RAG_EMBEDDING_BATCH_SIZE / RAG_EMBEDDING_THREADS / RAG_EMBEDDING_PROCESSES
+    """
+    options: Dict[str, Any] = {"backend": os.environ.get("RAG_EMBEDDING_BACKEND", "torch")}
+    for key, env in (("batch_size", "RAG_EMBEDDING_BATCH_SIZE"), ("threads", "RAG_EMBEDDING_THREADS"),
+                     ("processes", "RAG_EMBEDDING_PROCESSES")):
+        if os.environ.get(env):
+            options[key] = int(os.environ[env])
+    return options
@@ -0,0 +1,464 @@
+import os
+import pickle
+import queue
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from catalog import file_content_hash, make_chunk_id
+from utils import DEFAULT_WINDOW_CHARS, iter_doc, iter_split_windows
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md")
+# 超过该大小的文件不交给进程池整体解析，而是在解析线程中逐窗口流式处理
+DEFAULT_STREAM_THRESHOLD_BYTES = 4 * 1024 * 1024
+
+# 进度回调的参数: {"stage", "files_total", "files_done", "chunks_embedded", "chunks_written", ...}
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+# (chunk_id, text, metadata)
+ChunkTuple = Tuple[str, str, Dict]
+
+
+def collect_paths(paths_or_dir) -> List[str]:
+    """
+    接受单个目录、单个文件或路径列表，展开为支持格式的文件列表 (目录递归遍历)
+    """
+    if isinstance(paths_or_dir, str):
+        paths_or_dir = [paths_or_dir]
+    files = []
+    for path in paths_or_dir:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(
+                    os.path.join(root, n) for n in sorted(names)
+                    if os.path.splitext(n)[1].lower() in SUPPORTED_EXTENSIONS
+                )
+        else:
+            files.append(path)
+    return files
+
+
+def iter_chunk_windows(
+    file_path: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    split_method: str,
+    window_chars: int = DEFAULT_WINDOW_CHARS
+) -> Iterator[List[ChunkTuple]]:
+    """
+    流式加载 + 切分一个文件，逐窗口产出带确定性 id 的 chunk
+    """
+    for window in iter_split_windows(
+        iter_doc(file_path, block_chars=window_chars), chunk_size, chunk_overlap, split_method, window_chars
+    ):
+        yield [(make_chunk_id(file_path, c.page_content), c.page_content, c.metadata) for c in window]
+
+
+def parse_file(
+    file_path: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    split_method: str,
+    known_hash: Optional[str] = None,
+    window_chars: int = DEFAULT_WINDOW_CHARS
+) -> Dict[str, Any]:
+    """
+    工作进程中执行: 计算哈希、加载、切分、生成确定性 chunk id。
+    哈希与 known_hash 相同时不加载文件，直接返回 skipped。
+    返回值只含基本类型，跨进程传输开销小。切分结果与流式处理完全相同。
+    """
+    content_hash = file_content_hash(file_path)
+    if known_hash is not None and content_hash == known_hash:
+        return {"source": file_path, "content_hash": content_hash, "skipped": True, "chunks": [], "final": True}
+    chunks: List[ChunkTuple] = []
+    for window in iter_chunk_windows(file_path, chunk_size, chunk_overlap, split_method, window_chars):
+        chunks.extend(window)
+    return {"source": file_path, "content_hash": content_hash, "skipped": False, "chunks": chunks, "final": True}
+
+
+_DONE = object()
+
+
+def _drain(q: "queue.Queue") -> Iterator:
+    while True:
+        item = q.get()
+        if item is _DONE:
+            return
+        yield item
+
+
+class _Spool:
+    """
+    写入阶段的磁盘暂存区: 按顺序追加 pickle 记录，提交时按原顺序回放，用完即删
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self._file = tempfile.TemporaryFile(prefix="ingest-spool-", dir=directory)
+
+    def append(self, item):
+        pickle.dump(item, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def replay(self) -> Iterator:
+        self._file.flush()
+        self._file.seek(0)
+        while True:
+            try:
+                yield pickle.load(self._file)
+            except EOFError:
+                return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._file.close()
+
+
+class BulkIngestionPipeline:
+    """
+    多文件批量入库流水线，三段之间用有界队列衔接 (背压):
+
+    1. 解析: 小文件交给进程池整体加载 + 切分 (CPU 密集，绕开 GIL)；
+       大文件在解析线程中逐页 / 逐块流式加载，每次只有一个窗口的原文在内存中
+    2. Embedding: 独立线程按固定 batch_size 攒批计算，跨文件拼批
+    3. 写入: 调用方线程按批写入 Chroma / BM25 索引，文件的 chunk 全部写完后更新 catalog，
+       并在这里调用 progress_callback (Streamlit 只允许在脚本线程更新界面)
+
+    atomic=True 时写入阶段先把批次暂存到磁盘 (spool)，全部文件处理完后在一次写锁内提交，
+    新 chunk 对检索一次性可见；否则按批写入，处理过程中即可检索到已写入的部分。
+
+    同时驻留内存的数据量约为 (queue_size + 2) 个窗口 / 批次，与文件大小无关。
+    单个文件失败时回滚它已写入的 chunk，不影响其他文件。
+    """
+
+    def __init__(
+        self,
+        manager,
+        chunk_size: int,
+        chunk_overlap: int,
+        split_method: str = "recursive",
+        workers: Optional[int] = None,
+        embed_batch_size: int = 256,
+        queue_size: int = 4,
+        window_chars: int = DEFAULT_WINDOW_CHARS,
+        stream_threshold_bytes: int = DEFAULT_STREAM_THRESHOLD_BYTES,
+        atomic: bool = False,
+        spool_dir: Optional[str] = None,
+        progress_callback: Optional[ProgressCallback] = None
+    ):
+        self.manager = manager
+        self.split_params = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "split_method": split_method}
+        # workers=0 时不启动进程池，所有文件都在解析线程中流式处理
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.embed_batch_size = embed_batch_size
+        self.queue_size = queue_size
+        self.window_chars = window_chars
+        self.stream_threshold_bytes = stream_threshold_bytes
+        self.atomic = atomic
+        self.spool_dir = spool_dir
+        self._lock_held = False
+        self.progress_callback = progress_callback
+        # 每个失败文件的原始异常，供单文件入库 (ingest_file) 原样抛出
+        self.exceptions: List[BaseException] = []
+
+    def run(self, paths: Iterable[str]) -> Dict[str, Any]:
+        files = collect_paths(list(paths))
+        start = time.perf_counter()
+        stats = {
+            "stage": "running", "files_total": len(files), "files_done": 0, "skipped_files": 0,
+            "chunks_total": 0, "chunks_embedded": 0, "chunks_staged": 0, "chunks_written": 0,
+            "new": 0, "unchanged": 0, "removed": 0, "near_duplicates": 0, "near_duplicates_skipped": 0,
+            "near_duplicate_chars_saved": 0, "embed_seconds": 0.0, "errors": []
+        }
+        metrics = getattr(self.manager, "metrics", None)
+        self._trace_ctx = metrics.context() if metrics is not None else None
+        parsed_q: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        write_q: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+
+        parser = threading.Thread(target=self._parse_stage, args=(files, parsed_q, stop), daemon=True)
+        embedder = threading.Thread(
+            target=self._traced, args=(self._embed_stage, parsed_q, write_q, stop, stats), daemon=True
+        )
+        parser.start()
+        embedder.start()
+        try:
+            self._write_stage(write_q, stats)
+        finally:
+            stop.set()
+            # 写入阶段异常退出时，排空队列让上游线程能结束
+            for q in (parsed_q, write_q):
+                while True:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        break
+            parser.join()
+            embedder.join()
+
+        elapsed = time.perf_counter() - start
+        stats.update(
+            stage="done",
+            seconds=elapsed,
+            chunks_per_sec=stats["chunks_written"] / elapsed if elapsed else 0.0,
+            seconds_saved=(stats["unchanged"] + stats["near_duplicates_skipped"]) * self.manager._embed_seconds_per_chunk
+        )
+        self._report(stats)
+        return stats
+
+    def _traced(self, fn, *args):
+        # embedding 线程中的 span 归入调用方当前的 trace (如 ingest_paths)
+        metrics = getattr(self.manager, "metrics", None)
+        if metrics is None:
+            return fn(*args)
+        with metrics.attach(self._trace_ctx):
+            return fn(*args)
+
+    def _put(self, q: "queue.Queue", item, stop: threading.Event) -> bool:
+        # 带超时地放入有界队列，下游已停止时放弃
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _known_hash(self, path: str) -> Optional[str]:
+        entry = self.manager.catalog.get(path)
+        if entry and entry.get("split_params") == self.split_params:
+            return entry.get("content_hash")
+        return None
+
+    def _should_stream(self, path: str) -> bool:
+        if self.workers == 0:
+            return True
+        try:
+            return os.path.getsize(path) >= self.stream_threshold_bytes
+        except OSError:
+            return False
+
+    def _stream_file(self, path: str, parsed_q: "queue.Queue", stop: threading.Event) -> bool:
+        """
+        在当前线程中逐窗口解析一个文件，每个窗口单独放入队列
+        """
+        try:
+            content_hash = file_content_hash(path)
+            if content_hash == self._known_hash(path):
+                item = {"source": path, "content_hash": content_hash, "skipped": True, "chunks": [], "final": True}
+                return self._put(parsed_q, item, stop)
+            for window in iter_chunk_windows(path, window_chars=self.window_chars, **self.split_params):
+                if not self._put(parsed_q, {"source": path, "chunks": window, "final": False}, stop):
+                    return False
+        except Exception as e:
+            return self._put(parsed_q, {"source": path, "error": e}, stop)
+        item = {"source": path, "content_hash": content_hash, "skipped": False, "chunks": [], "final": True}
+        return self._put(parsed_q, item, stop)
+
+    def _parse_stage(self, files: List[str], parsed_q: "queue.Queue", stop: threading.Event):
+        executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers else None
+        try:
+            pending = []
+            # 同时在途的文件数有上限，避免一次性把所有文件的 chunk 都放进内存
+            max_inflight = max(1, self.workers) * 2
+            file_iter = iter(files)
+            while not stop.is_set():
+                while len(pending) < max_inflight:
+                    path = next(file_iter, None)
+                    if path is None:
+                        break
+                    if self._should_stream(path):
+                        pending.append((path, None))
+                    else:
+                        pending.append((path, executor.submit(
+                            parse_file, path, known_hash=self._known_hash(path),
+                            window_chars=self.window_chars, **self.split_params
+                        )))
+                if not pending:
+                    break
+                path, future = pending.pop(0)
+                if future is None:
+                    if not self._stream_file(path, parsed_q, stop):
+                        break
+                    continue
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"source": path, "error": e}
+                if not self._put(parsed_q, result, stop):
+                    break
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+            self._put(parsed_q, _DONE, stop)
+
+    def _embed_stage(self, parsed_q: "queue.Queue", write_q: "queue.Queue", stop: threading.Event, stats: Dict):
+        buffer: List[Tuple[str, ChunkTuple]] = []
+        # 文件结束标记在它的最后一个 chunk 所在批次之后才发出
+        pending_files: List[Dict] = []
+        # 正在处理的文件: 库中已有 id、已见过的 id (文件内去重)、作为近似重复跳过的 id、字符数、新增数
+        states: Dict[str, Dict[str, Any]] = {}
+
+        def emit_pending() -> bool:
+            while pending_files:
+                if not self._put(write_q, ("file", pending_files.pop(0)), stop):
+                    return False
+            return True
+
+        def flush() -> bool:
+            if not buffer:
+                return True
+            batch = buffer[:]
+            del buffer[:]
+            vectors, seconds = self.manager._embed_texts([c[1] for _, c in batch])
+            stats["embed_seconds"] += seconds
+            stats["chunks_embedded"] += len(batch)
+            if not self._put(write_q, ("batch", batch, vectors), stop):
+                return False
+            return emit_pending()
+
+        try:
+            while not stop.is_set():
+                item = parsed_q.get()
+                if item is _DONE:
+                    break
+                source = item["source"]
+                if "error" in item or item.get("skipped"):
+                    states.pop(source, None)
+                    pending_files.append(item)
+                else:
+                    state = states.get(source)
+                    if state is None:
+                        state = states[source] = {
+                            "existing": self.manager._existing_ids(source),
+                            "seen": set(), "skipped": set(), "total_chars": 0, "new": 0
+                        }
+                    for chunk in item["chunks"]:
+                        chunk_id, text, _ = chunk
+                        if chunk_id in state["seen"]:
+                            continue
+                        state["seen"].add(chunk_id)
+                        state["total_chars"] += len(text)
+                        if chunk_id in state["existing"]:
+                            continue
+                        # 近似重复检测: 与其他文件已有的 chunk 比较 (未启用时原样返回)
+                        chunk, duplicate_of = self.manager._check_near_duplicate(source, chunk)
+                        if duplicate_of is not None:
+                            stats["near_duplicates"] += 1
+                        if chunk is None:
+                            stats["near_duplicates_skipped"] += 1
+                            stats["near_duplicate_chars_saved"] += len(text)
+                            state["skipped"].add(chunk_id)
+                            continue
+                        state["new"] += 1
+                        buffer.append((source, chunk))
+                        if len(buffer) >= self.embed_batch_size and not flush():
+                            return
+                    if item["final"]:
+                        states.pop(source)
+                        pending_files.append({
+                            "source": source, "content_hash": item["content_hash"], "skipped": False,
+                            "keep_ids": state["seen"] - state["skipped"], "skipped_ids": state["skipped"],
+                            "total_chars": state["total_chars"], "new": state["new"]
+                        })
+                if not buffer and not emit_pending():
+                    return
+            flush()
+        except Exception as e:
+            stats["errors"].append(f"embedding: {e!r}")
+            self.exceptions.append(e)
+        finally:
+            self._put(write_q, _DONE, stop)
+
+    def _write_stage(self, write_q: "queue.Queue", stats: Dict):
+        if not self.atomic:
+            self._apply(_drain(write_q), stats)
+            return
+        # 原子提交: 先把算好 embedding 的批次暂存到磁盘，全部完成后在一次写锁内写入，
+        # 检索方要么看到入库前的状态，要么看到全部新 chunk
+        with _Spool(self.spool_dir) as spool:
+            for item in _drain(write_q):
+                spool.append(item)
+                if item[0] == "batch":
+                    stats["chunks_staged"] += len(item[1])
+                    self._report(stats)
+            stats["stage"] = "committing"
+            self._report(stats)
+            with self.manager._lock.write_lock():
+                self._lock_held = True
+                try:
+                    self._apply(spool.replay(), stats)
+                finally:
+                    self._lock_held = False
+
+    def _apply(self, items: Iterable, stats: Dict):
+        manager = self.manager
+        # 每个未完成文件已写入的新 chunk id，文件失败时据此回滚
+        written: Dict[str, List[str]] = {}
+        try:
+            for item in items:
+                if item[0] == "batch":
+                    _, batch, vectors = item
+                    with self._write_lock():
+                        manager._write_chunks(
+                            [c[0] for _, c in batch], [c[1] for _, c in batch], [c[2] for _, c in batch], vectors
+                        )
+                    for source, chunk in batch:
+                        written.setdefault(source, []).append(chunk[0])
+                    stats["chunks_written"] += len(batch)
+                else:
+                    result = item[1]
+                    self._finish_file(result, written.pop(result["source"], []), stats)
+                self._report(stats)
+        except BaseException:
+            for ids in written.values():
+                self._rollback(ids)
+            raise
+
+    def _write_lock(self):
+        # 原子提交时整个提交过程已持有写锁 (不可重入)
+        return nullcontext() if self._lock_held else self.manager._lock.write_lock()
+
+    def _rollback(self, ids: List[str]):
+        if ids:
+            with self._write_lock():
+                self.manager._delete_chunks(ids)
+
+    def _finish_file(self, result: Dict, written_ids: List[str], stats: Dict):
+        stats["files_done"] += 1
+        source = result["source"]
+        if "error" in result:
+            self._rollback(written_ids)
+            stats["errors"].append(f"{source}: {result['error']!r}")
+            self.exceptions.append(result["error"])
+            return
+        if result["skipped"]:
+            entry = self.manager.catalog.get(source) or {}
+            stats["skipped_files"] += 1
+            stats["unchanged"] += entry.get("count", 0)
+            stats["chunks_total"] += entry.get("count", 0)
+            return
+        keep_ids = result["keep_ids"]
+        try:
+            with self._write_lock():
+                removed = self.manager._finalize_source(
+                    source, keep_ids, result["total_chars"], result["content_hash"], self.split_params,
+                    result["skipped_ids"]
+                )
+        except Exception as e:
+            # catalog 或索引更新失败时回滚本文件的新增，保持三者一致
+            self._rollback(written_ids)
+            stats["errors"].append(f"{source}: {e!r}")
+            self.exceptions.append(e)
+            return
+        stats["chunks_total"] += len(keep_ids)
+        stats["new"] += result["new"]
+        stats["unchanged"] += len(keep_ids) - result["new"]
+        stats["removed"] += removed
+
+    def _report(self, stats: Dict):
+        if self.progress_callback:
+            self.progress_callback(dict(stats))
@@ -0,0 +1,154 @@
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class IngestionJob:
+    """
+    一个后台入库任务的状态快照来源。字段只由执行它的工作线程修改，
+    读取请用 IngestionJobManager.get / list 返回的 dict 副本。
+    """
+
+    def __init__(self, job_id: str, paths: List[str], params: Dict[str, Any], kb: Optional[str] = None):
+        self.id = job_id
+        self.paths = paths
+        self.params = params
+        self.kb = kb
+        self.state = QUEUED
+        self.progress = 0.0
+        self.stats: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "paths": list(self.paths),
+            "kb": self.kb,
+            "state": self.state,
+            "progress": self.progress,
+            "stats": dict(self.stats),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class IngestionJobManager:
+    """
+    后台入库任务队列。任务在独立的线程池中执行，不阻塞 Streamlit 脚本，
+    页面 rerun 或切换标签页后任务继续运行 (管理器本身通过 st.cache_resource 跨会话共享)。
+
+    每个任务调用 RAGManager.ingest_paths(atomic=True): 解析和 embedding 期间检索照常使用旧索引，
+    任务提交时在一次写锁内写入，新 chunk 一次性可见。
+
+    rag 也可以是 KnowledgeBaseManager，此时提交任务时用 kb 指定写入哪个知识库。
+    """
+
+    def __init__(self, rag, max_workers: int = 1, keep_finished: int = 50):
+        self.rag = rag
+        self.keep_finished = keep_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest-job")
+        self._jobs: Dict[str, IngestionJob] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def submit(
+        self,
+        paths: List[str],
+        chunk_size: int,
+        chunk_overlap: int,
+        split_method: str = "recursive",
+        kb: Optional[str] = None,
+        **options
+    ) -> str:
+        """
+        提交入库任务，立即返回任务 id。options 原样传给 ingest_paths (如 workers / embed_batch_size)
+        """
+        params = dict(chunk_size=chunk_size, chunk_overlap=chunk_overlap, split_method=split_method, **options)
+        with self._lock:
+            job = IngestionJob(f"job-{next(self._ids)}", list(paths), params, kb)
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job)
+        return job.id
+
+    def _run(self, job: IngestionJob):
+        job.state = RUNNING
+        job.started_at = time.time()
+
+        def on_progress(stats):
+            job.stats = stats
+            total = max(stats["files_total"], 1)
+            job.progress = min(stats["files_done"] / total, 1.0)
+
+        try:
+            rag = self.rag.get(job.kb) if job.kb is not None else self.rag
+            stats = rag.ingest_paths(job.paths, atomic=True, progress_callback=on_progress, **job.params)
+            job.stats = stats
+            job.progress = 1.0
+            if stats["errors"] and stats["files_done"] == len(stats["errors"]):
+                job.state = FAILED
+                job.error = "; ".join(stats["errors"])
+            else:
+                # 部分文件失败时其余文件照常提交，错误列在 stats["errors"] 中
+                job.state = DONE
+        except Exception as e:
+            job.state = FAILED
+            job.error = repr(e)
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        # 只保留最近 keep_finished 个已结束的任务，调用方需持有 self._lock
+        finished = [j for j in self._jobs.values() if j.state in (DONE, FAILED)]
+        for job in sorted(finished, key=lambda j: j.created_at)[:-self.keep_finished or None]:
+            del self._jobs[job.id]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        """
+        所有任务，最新提交的在前
+        """
+        with self._lock:
+            jobs = sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)
+            return [j.to_dict() for j in jobs]
+
+    def active(self, kb: Optional[str] = None) -> bool:
+        """
+        是否有排队或进行中的任务；指定 kb 时只看写入该知识库的任务
+        """
+        with self._lock:
+            return any(
+                j.state in (QUEUED, RUNNING) and (kb is None or j.kb == kb) for j in self._jobs.values()
+            )
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        等待任务结束并返回其状态 (主要用于脚本和测试)
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job["state"] in (DONE, FAILED):
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                return job
+            time.sleep(0.05)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,337 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+from collections import Counter
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from analyzer import Analyzer, WhitespaceAnalyzer
+
+if TYPE_CHECKING:
+    from search_filters import SearchFilter
+
+# search() 的返回: (chunk_id, score, text, metadata)
+SearchHit = Tuple[str, float, str, Dict]
+
+
+class KeywordIndex:
+    """
+    持久化的 BM25 倒排索引，存放在 persist_directory 下的 SQLite 文件中。
+
+    - postings 表按 (term, chunk_id) 聚簇，查询只读取查询词涉及的倒排链，
+      开销与语料规模无关
+    - 文档数、总长度等统计量存在 meta 表里，增删时增量维护
+    - 连接在第一次使用时才打开 (懒加载)
+    - 建索引和查询使用同一个 Analyzer，其名称记录在 meta 表中
+    """
+
+    FILE_NAME = "keyword_index.sqlite3"
+
+    def __init__(
+        self,
+        persist_directory: str,
+        analyzer: Optional[Analyzer] = None,
+        k1: float = 1.5,
+        b: float = 0.75
+    ):
+        self.path = os.path.join(persist_directory, self.FILE_NAME)
+        self.analyzer = analyzer or WhitespaceAnalyzer()
+        self.k1 = k1
+        self.b = b
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id TEXT PRIMARY KEY,
+                    source TEXT,
+                    text TEXT NOT NULL,
+                    metadata TEXT NOT NULL,
+                    length INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS chunks_source ON chunks(source);
+                CREATE TABLE IF NOT EXISTS postings (
+                    term TEXT NOT NULL,
+                    chunk_id TEXT NOT NULL,
+                    tf INTEGER NOT NULL,
+                    doc_len INTEGER NOT NULL,
+                    PRIMARY KEY (term, chunk_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS postings_chunk ON postings(chunk_id);
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+            """)
+            self._conn = conn
+        return self._conn
+
+    @property
+    def is_open(self) -> bool:
+        return self._conn is not None
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # ---------- 统计量 ----------
+
+    def _get_stat(self, conn: sqlite3.Connection, key: str) -> int:
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return int(row[0]) if row else 0
+
+    def _add_stats(self, conn: sqlite3.Connection, n_docs: int, total_length: int):
+        for key, delta in (("n_docs", n_docs), ("total_length", total_length)):
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + ?",
+                (key, str(delta), delta)
+            )
+
+    def stored_analyzer(self) -> Optional[str]:
+        """
+        建索引时使用的分词器名称；索引为空时返回 None
+        """
+        with self._lock:
+            row = self._connect().execute("SELECT value FROM meta WHERE key = 'analyzer'").fetchone()
+            return row[0] if row else None
+
+    def count(self) -> int:
+        with self._lock:
+            return self._get_stat(self._connect(), "n_docs")
+
+    # ---------- 写入 ----------
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict]):
+        """
+        增量写入一批 chunk。id 已存在时先删除旧版本再写入。
+        """
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                self._delete_ids(conn, ids)
+                chunk_rows = []
+                posting_rows = []
+                total_length = 0
+                for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                    tokens = self.analyzer.tokenize(text)
+                    length = len(tokens)
+                    total_length += length
+                    chunk_rows.append((
+                        chunk_id, (metadata or {}).get("source"), text,
+                        json.dumps(metadata or {}, ensure_ascii=False), length
+                    ))
+                    for term, tf in Counter(tokens).items():
+                        posting_rows.append((term, chunk_id, tf, length))
+                conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?)", chunk_rows)
+                conn.executemany("INSERT INTO postings VALUES (?, ?, ?, ?)", posting_rows)
+                self._add_stats(conn, len(chunk_rows), total_length)
+                conn.execute(
+                    "INSERT OR IGNORE INTO meta (key, value) VALUES ('analyzer', ?)", (self.analyzer.name,)
+                )
+
+    def _delete_ids(self, conn: sqlite3.Connection, ids: List[str]) -> int:
+        removed = 0
+        # SQLite 单条语句的参数个数有限，分批删除
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            marks = ",".join("?" * len(batch))
+            row = conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks WHERE id IN ({marks})", batch
+            ).fetchone()
+            if not row[0]:
+                continue
+            conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({marks})", batch)
+            conn.execute(f"DELETE FROM chunks WHERE id IN ({marks})", batch)
+            self._add_stats(conn, -row[0], -row[1])
+            removed += row[0]
+        return removed
+
+    def delete_ids(self, ids: List[str]) -> int:
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                return self._delete_ids(conn, list(ids))
+
+    def delete_source(self, source: str) -> int:
+        """
+        删除某个 source 的全部 chunk，返回删除的数量
+        """
+        with self._lock:
+            conn = self._connect()
+            ids = [r[0] for r in conn.execute("SELECT id FROM chunks WHERE source = ?", (source,))]
+            with conn:
+                return self._delete_ids(conn, ids)
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM postings")
+                conn.execute("DELETE FROM chunks")
+                conn.execute("DELETE FROM meta WHERE key IN ('n_docs', 'total_length', 'analyzer')")
+
+    # ---------- 查询 ----------
+
+    def get_by_source(self, source: str) -> List[Tuple[str, str, Dict]]:
+        """
+        按写入顺序返回某个 source 的全部 (chunk_id, text, metadata)
+        """
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT id, text, metadata FROM chunks WHERE source = ? ORDER BY rowid", (source,)
+            ).fetchall()
+        return [(r[0], r[1], json.loads(r[2])) for r in rows]
+
+    @staticmethod
+    def _sources_cte(sources: List[str]) -> Tuple[str, List]:
+        # 按 sources 给定的顺序排列，同一 source 内按写入顺序
+        values = ",".join("(?, ?)" for _ in sources)
+        return f"WITH wanted(source, pos) AS (VALUES {values}) ", [v for i, s in enumerate(sources) for v in (s, i)]
+
+    def count_by_sources(self, sources: List[str]) -> int:
+        if not sources:
+            return 0
+        cte, params = self._sources_cte(sources)
+        with self._lock:
+            return self._connect().execute(
+                cte + "SELECT COUNT(*) FROM chunks c JOIN wanted w ON c.source = w.source", params
+            ).fetchone()[0]
+
+    def page_by_sources(
+        self, sources: List[str], offset: int, limit: int, preview_chars: int = 100
+    ) -> List[Tuple[str, str, int, str]]:
+        """
+        分页读取若干 source 的 chunk 摘要 (chunk_id, source, 字符数, 前 preview_chars 个字符)，
+        不读取完整正文和 metadata，用于大规模预览
+        """
+        if not sources:
+            return []
+        cte, params = self._sources_cte(sources)
+        with self._lock:
+            return [tuple(r) for r in self._connect().execute(
+                cte + "SELECT c.id, c.source, length(c.text), substr(c.text, 1, ?) "
+                "FROM chunks c JOIN wanted w ON c.source = w.source "
+                "ORDER BY w.pos, c.rowid LIMIT ? OFFSET ?",
+                params + [preview_chars, limit, offset]
+            )]
+
+    def get_many(self, ids: List[str]) -> List[Tuple[str, str, Dict]]:
+        """
+        按 id 读取 (chunk_id, text, metadata)，顺序与 ids 一致，不存在的 id 跳过
+        """
+        found: Dict[str, Tuple[str, str, Dict]] = {}
+        with self._lock:
+            conn = self._connect()
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                for r in conn.execute(f"SELECT id, text, metadata FROM chunks WHERE id IN ({marks})", batch):
+                    found[r[0]] = (r[0], r[1], json.loads(r[2]))
+        return [found[i] for i in ids if i in found]
+
+    def search(self, query: str, k: int = 3, filter: Optional["SearchFilter"] = None) -> List[SearchHit]:
+        """
+        BM25 检索，返回得分最高的 k 个 (chunk_id, score, text, metadata)。
+
+        idf 使用非负形式 log(1 + (N - df + 0.5) / (df + 0.5))。
+        """
+        return self.search_many([query], k, filter)[0]
+
+    def _select_filtered(self, conn: sqlite3.Connection, filter: "SearchFilter") -> int:
+        """
+        把满足 filter 的 chunk id 写入临时表 filtered_ids，返回数量
+        """
+        clauses, params = [], []
+        if filter.sources is not None:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS filter_sources (source TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM filter_sources")
+            conn.executemany("INSERT OR IGNORE INTO filter_sources VALUES (?)", [(s,) for s in filter.sources])
+            clauses.append("source IN (SELECT source FROM filter_sources)")
+        if filter.page_min is not None:
+            clauses.append("json_extract(metadata, '$.page') >= ?")
+            params.append(filter.page_min)
+        if filter.page_max is not None:
+            clauses.append("json_extract(metadata, '$.page') <= ?")
+            params.append(filter.page_max)
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS filtered_ids (id TEXT PRIMARY KEY) WITHOUT ROWID")
+        conn.execute("DELETE FROM filtered_ids")
+        where = " AND ".join(clauses) or "1"
+        count = conn.execute(f"INSERT INTO filtered_ids SELECT id FROM chunks WHERE {where}", params).rowcount
+        # 只写了临时表，立即提交，不让隐式事务一直持有读快照
+        conn.commit()
+        return count
+
+    def search_many(
+        self, queries: List[str], k: int = 3, filter: Optional["SearchFilter"] = None
+    ) -> List[List[SearchHit]]:
+        """
+        批量 BM25 检索，结果与逐个调用 search 相同、顺序与 queries 一致。
+        多个查询共享的词只读取一次倒排链，命中 chunk 的正文也只查一次。
+
+        filter (search_filters.SearchFilter) 为前置过滤: 先在 chunks 表中圈出满足条件的 chunk，
+        只读取并打分这些 chunk 的倒排项。idf / 平均长度仍按全库统计，得分与不过滤时一致。
+        """
+        query_terms = [Counter(self.analyzer.tokenize(q)) for q in queries]
+        if k <= 0 or not any(query_terms) or (filter is not None and filter.matches_nothing):
+            return [[] for _ in queries]
+        with self._lock:
+            conn = self._connect()
+            n_docs = self._get_stat(conn, "n_docs")
+            if n_docs == 0:
+                return [[] for _ in queries]
+            avgdl = self._get_stat(conn, "total_length") / n_docs or 1.0
+            if filter is not None and not self._select_filtered(conn, filter):
+                return [[] for _ in queries]
+
+            # term -> [(chunk_id, 单词项 BM25 得分)]，每个不同的词只查询一次
+            term_scores: Dict[str, List[Tuple[str, float]]] = {}
+            for term in {t for terms in query_terms for t in terms}:
+                if filter is None:
+                    postings = conn.execute(
+                        "SELECT chunk_id, tf, doc_len FROM postings WHERE term = ?", (term,)
+                    ).fetchall()
+                    df = len(postings)
+                else:
+                    # 按 (term, chunk_id) 主键逐个查候选 chunk，df 只数倒排链长度
+                    postings = conn.execute(
+                        "SELECT p.chunk_id, p.tf, p.doc_len FROM filtered_ids f "
+                        "JOIN postings p ON p.term = ? AND p.chunk_id = f.id", (term,)
+                    ).fetchall()
+                    df = conn.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+                if not postings:
+                    continue
+                idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+                term_scores[term] = [
+                    (chunk_id, idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * doc_len / avgdl)))
+                    for chunk_id, tf, doc_len in postings
+                ]
+
+            tops = []
+            for terms in query_terms:
+                scores: Dict[str, float] = {}
+                for term, qtf in terms.items():
+                    for chunk_id, score in term_scores.get(term, ()):
+                        scores[chunk_id] = scores.get(chunk_id, 0.0) + qtf * score
+                tops.append(sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k])
+
+            wanted = list({cid for top in tops for cid, _ in top})
+            rows: Dict[str, Tuple[str, str]] = {}
+            for start in range(0, len(wanted), 500):
+                batch = wanted[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                for r in conn.execute(f"SELECT id, text, metadata FROM chunks WHERE id IN ({marks})", batch):
+                    rows[r[0]] = (r[1], r[2])
+        return [
+            [(cid, score, rows[cid][0], json.loads(rows[cid][1])) for cid, score in top if cid in rows]
+            for top in tops
+        ]
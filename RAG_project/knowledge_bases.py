@@ -0,0 +1,175 @@
+"""
+一个进程内管理多个相互隔离的知识库。
+
+每个知识库是 root_directory 下的一个子目录，有自己的向量库 collection、关键字索引、
+近似重复索引、catalog 和答案缓存 (即一个独立的 RAGManager)；embedding 模型、embedding 缓存、
+LLM 客户端池和埋点注册表在所有知识库间共享，模型只加载一次。
+
+知识库在第一次 get() 时才创建 RAGManager，其向量库 / 索引又在第一次检索或写入时才打开；
+同时打开的知识库超过 max_open 个时，按最近使用顺序 (LRU) 关闭最久未用的 (RAGManager.close)，
+内存随活跃知识库数增长而不是随知识库总数增长。被关闭的 RAGManager 对象保留，
+下次使用时按需重新打开，因此同一目录在进程内始终只有一个实例。
+"""
+import logging
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from catalog import DocumentCatalog
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from embedding_models import DEFAULT_MODEL_NAME, create_embeddings
+from llm_clients import LLMClientPool
+from metrics import MetricsRegistry
+from rag_engine import RAGManager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KB = "default"
+NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+
+def validate_name(name: str) -> str:
+    if not isinstance(name, str) or not NAME_PATTERN.match(name) or name in (".", ".."):
+        raise ValueError(f"invalid knowledge base name: {name!r} (letters, digits, '_', '-', '.', up to 64 chars)")
+    return name
+
+
+class KnowledgeBaseManager:
+    """
+    按名称管理多个知识库，线程安全。manager_options 原样传给每个 RAGManager
+    (如 vector_backend / analyzer / near_dup_threshold / context_max_tokens / answer_cache_size)；
+    embedding_options 用于创建共享的默认模型 (embeddings 为 None 时)，见 embedding_models.embedding_factory。
+    """
+
+    def __init__(
+        self,
+        root_directory: str = "./knowledge_bases",
+        max_open: int = 4,
+        embeddings: Optional[Embeddings] = None,
+        embedding_cache_dir: Optional[str] = "./embedding_cache",
+        embedding_cache_size: int = 200_000,
+        metrics: Optional[MetricsRegistry] = None,
+        llm_pool: Optional[LLMClientPool] = None,
+        embedding_options: Optional[Dict[str, Any]] = None,
+        **manager_options: Any
+    ):
+        if max_open < 1:
+            raise ValueError(f"max_open must be >= 1, got {max_open}")
+        self.root_directory = root_directory
+        self.max_open = max_open
+        self.metrics = metrics or MetricsRegistry()
+        self.llm_pool = llm_pool or LLMClientPool()
+        if embeddings is None:
+            embeddings = create_embeddings(DEFAULT_MODEL_NAME, **(embedding_options or {}))
+        if embedding_cache_dir:
+            model_name = getattr(embeddings, "model_name", None) or type(embeddings).__name__
+            embeddings = CachedEmbeddings(
+                embeddings, EmbeddingCache(embedding_cache_dir, model_name, max_entries=embedding_cache_size)
+            )
+        # 所有知识库共用的 embedding (模型 + 缓存)
+        self.embeddings = embeddings
+        self.manager_options = manager_options
+        # name -> RAGManager，按最近使用排序 (最后一个最新)
+        self._managers: "OrderedDict[str, RAGManager]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(root_directory, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root_directory, validate_name(name))
+
+    def exists(self, name: str) -> bool:
+        return os.path.isdir(self._path(name))
+
+    def names(self) -> List[str]:
+        return sorted(
+            n for n in os.listdir(self.root_directory)
+            if NAME_PATTERN.match(n) and os.path.isdir(os.path.join(self.root_directory, n))
+        )
+
+    def list(self) -> List[Dict[str, Any]]:
+        """
+        全部知识库的 {"name", "open", "documents", "chunks"}。只读各自的 catalog，不打开向量库
+        """
+        with self._lock:
+            managers = dict(self._managers)
+        result = []
+        for name in self.names():
+            rag = managers.get(name)
+            catalog = rag.catalog if rag is not None else DocumentCatalog(self._path(name))
+            result.append({
+                "name": name,
+                "open": rag is not None and rag.is_open,
+                "documents": len(catalog.list()),
+                "chunks": catalog.total_chunks,
+            })
+        return result
+
+    def create(self, name: str) -> RAGManager:
+        """
+        新建知识库 (已存在时直接返回)
+        """
+        return self.get(name, create=True)
+
+    def get(self, name: str, create: bool = False) -> RAGManager:
+        """
+        返回知识库的 RAGManager 并标记为最近使用；不存在且 create=False 时抛 KeyError。
+        打开的知识库超过 max_open 个时关闭最久未用的
+        """
+        path = self._path(name)
+        with self._lock:
+            rag = self._managers.get(name)
+            if rag is None:
+                if not os.path.isdir(path):
+                    if not create:
+                        raise KeyError(f"unknown knowledge base: {name}")
+                    os.makedirs(path)
+                rag = RAGManager(
+                    path, embedding_cache_dir=None, embeddings=self.embeddings, metrics=self.metrics,
+                    llm_pool=self.llm_pool, **self.manager_options
+                )
+                self._managers[name] = rag
+            self._managers.move_to_end(name)
+            idle = [m for n, m in self._managers.items() if n != name and m.is_open]
+        # 关闭需要等待该知识库上正在进行的读写 (写锁)，放在 self._lock 之外
+        for victim in idle[:max(0, len(idle) + 1 - self.max_open)]:
+            self._close(victim)
+        return rag
+
+    def _close(self, rag: RAGManager):
+        with self.metrics.span("knowledge_base_close"):
+            rag.close()
+        self.metrics.inc("rag_knowledge_base_evictions_total")
+
+    def open_count(self) -> int:
+        with self._lock:
+            return sum(1 for m in self._managers.values() if m.is_open)
+
+    def delete(self, name: str):
+        """
+        删除整个知识库 (目录)。先关闭全部文件句柄，因此不需要等待文件系统释放
+        """
+        path = self._path(name)
+        with self._lock:
+            rag = self._managers.pop(name, None)
+        if rag is not None:
+            rag.close()
+        if not os.path.isdir(path):
+            raise KeyError(f"unknown knowledge base: {name}")
+        shutil.rmtree(path)
+
+    def warm_up(self, name: str = DEFAULT_KB, background: bool = True):
+        """
+        预热某个知识库 (同时加载共享的 embedding 模型)
+        """
+        return self.get(name, create=True).warm_up(background=background)
+
+    def close(self):
+        with self._lock:
+            managers = list(self._managers.values())
+        for rag in managers:
+            rag.close()
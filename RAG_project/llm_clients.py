@@ -0,0 +1,74 @@
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Tuple
+
+import httpx
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+
+
+class LLMClientPool:
+    """
+    按 (base_url, model_name, api_key) 缓存 ChatOpenAI 客户端。
+
+    - 所有客户端共用一个 httpx 连接池，跨问题复用 keep-alive 连接和 TLS 会话
+    - 超时、连接数、最大重试次数可配置；429 / 5xx / 超时由 openai SDK 按指数退避重试
+    - slot() 限制同时进行中的 LLM 调用数量
+    """
+
+    def __init__(
+        self,
+        timeout: float = 60.0,
+        connect_timeout: float = 10.0,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        max_concurrency: int = 8,
+        max_retries: int = 3,
+        temperature: float = 0.1
+    ):
+        self.max_retries = max_retries
+        self.temperature = temperature
+        self._timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections
+        )
+        self._http_client = httpx.Client(timeout=self._timeout, limits=limits)
+        self._http_async_client = httpx.AsyncClient(timeout=self._timeout, limits=limits)
+        self._clients: Dict[Tuple[str, str, str], "ChatOpenAI"] = {}
+        self._lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+
+    def get(self, api_key: str, base_url: str, model_name: str) -> "ChatOpenAI":
+        key = (base_url, model_name, api_key)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                # langchain_openai / openai 导入较慢，第一次调用 LLM 时才导入
+                from langchain_openai import ChatOpenAI
+                client = ChatOpenAI(
+                    openai_api_key=api_key,
+                    openai_api_base=base_url,
+                    model_name=model_name,
+                    temperature=self.temperature,
+                    request_timeout=self._timeout,
+                    max_retries=self.max_retries,
+                    http_client=self._http_client,
+                    http_async_client=self._http_async_client
+                )
+                self._clients[key] = client
+            return client
+
+    @contextmanager
+    def slot(self):
+        """
+        占用一个 LLM 并发名额，名额用完时阻塞等待
+        """
+        with self._semaphore:
+            yield
+
+    def close(self):
+        with self._lock:
+            self._clients.clear()
+        self._http_client.close()
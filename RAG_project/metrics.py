@@ -0,0 +1,245 @@
+"""
+RAG 流水线的轻量级埋点: 分阶段 span 计时、直方图 (p50/p95/p99) 与 Prometheus 文本格式导出。
+
+    with metrics.span("vector_search", k=3) as span:
+        docs = ...
+        span.set(docs=len(docs))
+
+同一线程内嵌套的 span 组成一条 trace，最外层 span 结束时整条 trace 进入 recent_traces，
+供诊断面板展示；每个 span 的耗时记入直方图 rag_stage_seconds{stage="..."}。
+"""
+import bisect
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 秒级延迟的默认分桶 (Prometheus histogram 的 le 边界)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    固定分桶的累计直方图 + 最近 reservoir_size 个样本 (用于计算分位数)
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, reservoir_size: int = 2048):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._samples: Deque[float] = deque(maxlen=reservoir_size)
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self._samples.append(value)
+
+    def quantile(self, q: float) -> float:
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Span:
+    def __init__(self, name: str, attrs: Dict[str, Any], depth: int):
+        self.name = name
+        self.attrs = attrs
+        self.depth = depth
+        self.start = time.perf_counter()
+        self.seconds = 0.0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "seconds": self.seconds, "depth": self.depth, **self.attrs}
+
+
+class MetricsRegistry:
+    """
+    线程安全的指标注册表。所有方法都很轻量，可以在热路径上调用。
+    """
+
+    def __init__(self, max_traces: int = 50):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, LabelKey], Histogram] = {}
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._local = threading.local()
+        self.recent_traces: Deque[List[Dict[str, Any]]] = deque(maxlen=max_traces)
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> Tuple[str, LabelKey]:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    @contextmanager
+    def span(self, name: str, **attrs) -> Iterator[Span]:
+        """
+        计时一个阶段。attrs 以及 span.set() 设置的字段 (k、返回文档数、字符数等) 会写入 trace 和 debug 日志。
+        """
+        stack: List[Span] = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+            self._local.finished = []
+        span = Span(name, dict(attrs), len(stack))
+        stack.append(span)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = e
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            span.seconds = time.perf_counter() - span.start
+            stack.pop()
+            self.observe("rag_stage_seconds", span.seconds, stage=name)
+            if error is not None:
+                self.inc("rag_stage_errors_total", stage=name)
+            logger.debug("span %s %.4fs %s", name, span.seconds, span.attrs)
+            self._local.finished.append(span)
+            if not stack:
+                # 最外层 span 结束: 按开始时间排序后记为一条 trace
+                trace = sorted(self._local.finished, key=lambda s: s.start)
+                self._local.finished = []
+                with self._lock:
+                    self.recent_traces.append([s.to_dict() for s in trace])
+
+    def context(self) -> Optional[Tuple[List[Span], List[Span]]]:
+        """
+        当前线程的 trace 上下文，交给 attach() 在其他线程 (如 Hybrid 的检索线程池) 中延续同一条 trace
+        """
+        stack = getattr(self._local, "stack", None)
+        return (stack, self._local.finished) if stack else None
+
+    @contextmanager
+    def attach(self, ctx: Optional[Tuple[List[Span], List[Span]]]):
+        previous = (getattr(self._local, "stack", None), getattr(self._local, "finished", None))
+        if ctx is not None:
+            # 复制父线程的 span 栈 (决定嵌套深度)，结束的 span 追加到父 trace 中
+            self._local.stack, self._local.finished = list(ctx[0]), ctx[1]
+        try:
+            yield
+        finally:
+            self._local.stack, self._local.finished = previous
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """
+        每个直方图的 count / mean / p50 / p95 / p99 (秒)，用于诊断面板
+        """
+        with self._lock:
+            rows = []
+            for (name, labels), h in sorted(self._histograms.items()):
+                rows.append({
+                    "metric": name,
+                    **dict(labels),
+                    "count": h.count,
+                    "mean": h.sum / h.count if h.count else 0.0,
+                    "p50": h.quantile(0.5),
+                    "p95": h.quantile(0.95),
+                    "p99": h.quantile(0.99),
+                })
+            return rows
+
+    def counters(self) -> Dict[str, float]:
+        with self._lock:
+            return {_render_name(name, labels): v for (name, labels), v in sorted(self._counters.items())}
+
+    def prometheus_text(self) -> str:
+        """
+        Prometheus 文本格式 (exposition format 0.0.4)
+        """
+        lines: List[str] = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{_render_name(name, labels)} {value:g}")
+            for (name, labels), h in sorted(self._histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip([f"{b:g}" for b in h.buckets] + ["+Inf"], h.counts):
+                    cumulative += count
+                    lines.append(f"{_render_name(name + '_bucket', labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{_render_name(name + '_sum', labels)} {h.sum:.6f}")
+                lines.append(f"{_render_name(name + '_count', labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.recent_traces.clear()
+
+
+def _render_name(name: str, labels: LabelKey) -> str:
+    if not labels:
+        return name
+    body = ",".join(f'{k}="{v}"' for k, v in labels)
+    return f"{name}{{{body}}}"
+
+
+def serve_metrics(registry: MetricsRegistry, host: str = "127.0.0.1", port: int = 9464) -> ThreadingHTTPServer:
+    """
+    在后台线程启动 /metrics 端点 (Prometheus 抓取用)，返回 server 以便调用方关闭
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            data = registry.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info("metrics endpoint listening on http://%s:%s/metrics", host, server.server_address[1])
+    return server
+
+
+@contextmanager
+def maybe_span(registry: Optional[MetricsRegistry], name: str, **attrs) -> Iterator[Span]:
+    """
+    registry 为 None 时不做任何记录 (供可选埋点的组件使用)
+    """
+    if registry is None:
+        yield Span(name, dict(attrs), 0)
+        return
+    with registry.span(name, **attrs) as span:
+        yield span
@@ -0,0 +1,297 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+# 入库时写入每个 chunk 的 metadata: 所属近似重复组 (规范 chunk 的 id)，检索时按它折叠
+GROUP_KEY = "near_dup_group"
+ACTIONS = ("link", "skip")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class MinHasher:
+    """
+    字符 shingle 的 MinHash 签名 (中英文通用，不依赖分词)。
+
+    文本归一化 (小写、合并空白) 后取长度为 shingle_size 的字符窗口，窗口哈希用 numpy 滚动计算；
+    num_perm 个 multiply-shift 哈希函数各取最小值。两个签名相同位置相等的比例是
+    shingle 集合 Jaccard 相似度的无偏估计。参数固定时签名在进程间稳定，可以持久化。
+    """
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+
+    def _shingles(self, text: str) -> np.ndarray:
+        text = _WHITESPACE.sub(" ", text.lower()).strip()
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        if codes.size == 0:
+            return codes
+        n = max(codes.size - self.shingle_size + 1, 1)
+        hashes = np.zeros(n, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            for j in range(min(self.shingle_size, codes.size)):
+                # 多项式滚动哈希，uint64 溢出即取模
+                hashes = hashes * np.uint64(1000003) + codes[j:j + n]
+            hashes ^= hashes >> np.uint64(29)
+            hashes *= np.uint64(0xBF58476D1CE4E5B9)
+        return hashes >> np.uint64(32)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """
+        返回 uint32[num_perm] 签名；空文本返回 None
+        """
+        shingles = self._shingles(text)
+        if shingles.size == 0:
+            return None
+        with np.errstate(over="ignore"):
+            values = (self._a[:, None] * shingles[None, :] + self._b[:, None]) >> np.uint64(32)
+        return values.min(axis=1).astype(np.uint32)
+
+
+def estimate_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.mean(a == b))
+
+
+class NearDuplicateIndex:
+    """
+    入库时使用的近似重复 chunk 索引 (MinHash + LSH 分桶)，存放在 persist_directory 下的 SQLite 文件中。
+
+    - signatures 表: 每个 chunk 的签名、source、规范 chunk id (canonical_id，自身为规范时为 NULL)
+      以及是否实际写入了向量库 (stored，skip 模式跳过的重复为 0)
+    - bands 表: 签名切成 bands 段，每段的哈希 -> chunk id。任一段相同即为候选，
+      再用签名估计的 Jaccard 相似度与 threshold 比较；只有写入了向量库的 chunk 参与分桶
+    - 同一 source 内的 chunk 互不比较: 文件修改后重新入库时，新段落不会被判为自己旧版本的重复
+    """
+
+    FILE_NAME = "near_dup.sqlite3"
+    # 签名参数变化后旧签名不再可比，需要重建
+    VERSION = "minhash-128-32-5"
+
+    def __init__(self, persist_directory: str, threshold: float = 0.9, num_perm: int = 128, bands: int = 32):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.path = os.path.join(persist_directory, self.FILE_NAME)
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm=num_perm)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS signatures (
+                    id TEXT PRIMARY KEY,
+                    source TEXT,
+                    canonical_id TEXT,
+                    stored INTEGER NOT NULL,
+                    chars INTEGER NOT NULL,
+                    signature BLOB NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS signatures_source ON signatures(source);
+                CREATE INDEX IF NOT EXISTS signatures_canonical ON signatures(canonical_id);
+                CREATE TABLE IF NOT EXISTS bands (
+                    band INTEGER NOT NULL,
+                    hash INTEGER NOT NULL,
+                    chunk_id TEXT NOT NULL,
+                    PRIMARY KEY (band, hash, chunk_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS bands_chunk ON bands(chunk_id);
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+            """)
+            row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if row is None or row[0] != self.VERSION:
+                with conn:
+                    conn.execute("DELETE FROM bands")
+                    conn.execute("DELETE FROM signatures")
+                    conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (self.VERSION,))
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _band_hashes(self, signature: np.ndarray) -> List[Tuple[int, int]]:
+        return [
+            (band, int.from_bytes(
+                hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(), digest_size=8).digest(),
+                "little", signed=True
+            ))
+            for band in range(self.bands)
+        ]
+
+    # ---------- 查询 ----------
+
+    def count_stored(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM signatures WHERE stored = 1").fetchone()[0]
+
+    def _find(
+        self, conn: sqlite3.Connection, signature: np.ndarray, bands: List[Tuple[int, int]], source: Optional[str]
+    ) -> Optional[Tuple[str, float]]:
+        marks = ",".join("(?, ?)" for _ in bands)
+        params = [v for pair in bands for v in pair]
+        rows = conn.execute(
+            f"SELECT s.id, s.canonical_id, s.signature FROM signatures s "
+            f"WHERE s.id IN (SELECT DISTINCT chunk_id FROM bands WHERE (band, hash) IN (VALUES {marks})) "
+            f"AND (s.source IS NOT ? OR ? IS NULL)",
+            params + [source, source]
+        ).fetchall()
+        best: Optional[Tuple[str, float]] = None
+        for chunk_id, canonical_id, blob in rows:
+            similarity = estimate_similarity(signature, np.frombuffer(blob, dtype=np.uint32))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (canonical_id or chunk_id, similarity)
+        return best
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT COUNT(*), "
+                "COALESCE(SUM(stored = 1 AND canonical_id IS NOT NULL), 0), "
+                "COALESCE(SUM(stored = 0), 0), "
+                "COALESCE(SUM(CASE WHEN stored = 0 THEN chars ELSE 0 END), 0) FROM signatures"
+            ).fetchone()
+        return {"indexed": row[0], "linked": row[1], "skipped": row[2], "skipped_chars": row[3]}
+
+    # ---------- 写入 ----------
+
+    def add(self, chunk_id: str, text: str, source: Optional[str], store_duplicate: bool) -> Optional[Tuple[str, float]]:
+        """
+        查找与 text 近似重复的已有 chunk (来自其他 source) 并记录这个 chunk。
+
+        返回 (规范 chunk id, 估计相似度)，不重复时返回 None。store_duplicate=False (skip 模式) 时
+        重复 chunk 只记录为别名，不参与分桶，调用方不会把它写入向量库。
+        查找和记录在同一把锁内完成，同一批入库的 chunk 之间也能互相识别。
+        """
+        signature = self.hasher.signature(text)
+        if signature is None:
+            return None
+        bands = self._band_hashes(signature)
+        with self._lock:
+            conn = self._connect()
+            match = self._find(conn, signature, bands, source)
+            stored = match is None or store_duplicate
+            with conn:
+                self._delete_ids(conn, [chunk_id])
+                conn.execute(
+                    "INSERT INTO signatures VALUES (?, ?, ?, ?, ?, ?)",
+                    (chunk_id, source, match[0] if match else None, int(stored), len(text), signature.tobytes())
+                )
+                if stored:
+                    conn.executemany("INSERT OR IGNORE INTO bands VALUES (?, ?, ?)", [b + (chunk_id,) for b in bands])
+        return match
+
+    def add_canonical(self, ids: Sequence[str], texts: Sequence[str], metadatas: Sequence[Dict]):
+        """
+        把已在库中的 chunk 作为规范 chunk 批量加入索引 (启用去重前入库的数据回填用)
+        """
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                    signature = self.hasher.signature(text or "")
+                    if signature is None:
+                        continue
+                    conn.execute(
+                        "INSERT OR REPLACE INTO signatures VALUES (?, ?, NULL, 1, ?, ?)",
+                        (chunk_id, (metadata or {}).get("source"), len(text), signature.tobytes())
+                    )
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO bands VALUES (?, ?, ?)",
+                        [b + (chunk_id,) for b in self._band_hashes(signature)]
+                    )
+
+    def _delete_ids(self, conn: sqlite3.Connection, ids: List[str]) -> Set[str]:
+        """
+        删除一批 chunk，返回因此失去规范 chunk 的 skip 别名所在的 source (这些别名一并删除)
+        """
+        orphaned: Set[str] = set()
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            marks = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT id, source FROM signatures WHERE stored = 0 AND canonical_id IN ({marks})", batch
+            ).fetchall()
+            orphan_ids = [r[0] for r in rows]
+            orphaned.update(r[1] for r in rows)
+            for group in (batch, orphan_ids):
+                if not group:
+                    continue
+                group_marks = ",".join("?" * len(group))
+                conn.execute(f"DELETE FROM bands WHERE chunk_id IN ({group_marks})", group)
+                conn.execute(f"DELETE FROM signatures WHERE id IN ({group_marks})", group)
+        return orphaned
+
+    def delete_ids(self, ids: Iterable[str]) -> Set[str]:
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                return self._delete_ids(conn, list(ids))
+
+    def retain_source(self, source: str, keep_ids: Set[str]) -> Set[str]:
+        """
+        删除某个 source 中不在 keep_ids 里的记录 (文件重新入库后已不存在的 chunk / 别名)，
+        keep_ids 为空时删除整个 source。返回失去规范 chunk 的其他 source
+        """
+        with self._lock:
+            conn = self._connect()
+            ids = [
+                r[0] for r in conn.execute("SELECT id FROM signatures WHERE source = ?", (source,))
+                if r[0] not in keep_ids
+            ]
+            with conn:
+                return self._delete_ids(conn, ids) - {source}
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM bands")
+                conn.execute("DELETE FROM signatures")
+
+
+def collapse_near_duplicates(docs: Sequence[Document], k: int) -> Tuple[List[Document], int]:
+    """
+    检索结果中同一近似重复组 (metadata[GROUP_KEY]) 只保留排名最前的一个，最多返回 k 个。
+    保留的 chunk 在 metadata["near_duplicates"] 中记录被折叠的数量。返回 (结果, 折叠数)。
+    """
+    kept: List[Document] = []
+    index_by_group: Dict[str, int] = {}
+    collapsed = 0
+    for doc in docs:
+        group = doc.metadata.get(GROUP_KEY)
+        if group is None:
+            if len(kept) < k:
+                kept.append(doc)
+            continue
+        if group in index_by_group:
+            first = kept[index_by_group[group]]
+            first.metadata["near_duplicates"] = first.metadata.get("near_duplicates", 0) + 1
+            collapsed += 1
+            continue
+        if len(kept) < k:
+            index_by_group[group] = len(kept)
+            kept.append(Document(id=doc.id, page_content=doc.page_content, metadata=dict(doc.metadata)))
+    return kept, collapsed
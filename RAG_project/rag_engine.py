@@ -1,40 +1,257 @@
+import logging
 import os
-import shutil
+import threading
 import time
-from typing import List, Optional, Dict, Any
-
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter, CharacterTextSplitter
-from langchain_openai import ChatOpenAI
-from langchain.chains import create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_community.retrievers import BM25Retriever
-from langchain.retrievers import EnsembleRetriever
-from langchain_core.prompts import ChatPromptTemplate
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Optional, Dict, Any, Iterator, Sequence
+
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from utils import ReadWriteLock, DEFAULT_WINDOW_CHARS, estimate_tokens
+from catalog import DocumentCatalog
+from keyword_index import KeywordIndex
+from analyzer import get_analyzer
+from llm_clients import LLMClientPool
+from embedding_cache import EmbeddingCache, CachedEmbeddings
+from embedding_models import DEFAULT_MODEL_NAME, create_embeddings, env_embedding_options
+from ingestion import BulkIngestionPipeline, ProgressCallback
+from answer_cache import SemanticAnswerCache
+from context_packer import ContextPacker
+from vector_store import create_vector_store
+from search_filters import SearchFilter, resolve_filters
+from near_dup import ACTIONS as NEAR_DUP_ACTIONS, GROUP_KEY as NEAR_DUP_GROUP_KEY
+from near_dup import NearDuplicateIndex, collapse_near_duplicates
+from metrics import MetricsRegistry
+
+if TYPE_CHECKING:
+    from langchain_core.prompts import ChatPromptTemplate
+
+# 启动路径上只导入轻量模块: langchain_core 的 Runnable 体系 (retrievers / prompts，约 0.5 秒)、
+# langchain_openai、chromadb、sentence-transformers 都在第一次用到时才导入，见 warm_up
 
-from utils import load_doc
+logger = logging.getLogger(__name__)
+
+
+def env_options() -> Dict[str, Any]:
+    """
+    app.py / api.py 共用的环境变量配置:
+    RAG_VECTOR_BACKEND (chroma / numpy / numpy-int8)、RAG_NEAR_DUP_THRESHOLD (如 0.85，不设置则关闭)、
+    RAG_NEAR_DUP_ACTION (link / skip)，以及 embedding 推理后端 (见 embedding_models.env_embedding_options)
+    """
+    threshold = os.environ.get("RAG_NEAR_DUP_THRESHOLD")
+    return {
+        "vector_backend": os.environ.get("RAG_VECTOR_BACKEND", "chroma"),
+        "near_dup_threshold": float(threshold) if threshold else None,
+        "near_dup_action": os.environ.get("RAG_NEAR_DUP_ACTION", "link"),
+        "embedding_options": env_embedding_options(),
+    }
 
 class RAGManager:
-    def __init__(self, persist_directory: str = "./chroma_db"):
+    """
+    RAG 引擎。设计为进程内共享的单例 (见 app.py 的 get_rag_manager)，
+    多个会话并发调用时由读写锁保护: 入库、删除、清空为写操作，检索为读操作。
+    """
+
+    def __init__(
+        self,
+        persist_directory: str = "./chroma_db",
+        analyzer: str = "cjk_bigram",
+        llm_pool: Optional[LLMClientPool] = None,
+        embedding_cache_dir: Optional[str] = "./embedding_cache",
+        embedding_cache_size: int = 200_000,
+        answer_cache_size: int = 1000,
+        answer_cache_ttl: float = 3600.0,
+        answer_cache_threshold: float = 0.95,
+        metrics: Optional[MetricsRegistry] = None,
+        embeddings: Optional[Embeddings] = None,
+        context_max_tokens: Optional[int] = 2000,
+        vector_backend: str = "chroma",
+        near_dup_threshold: Optional[float] = None,
+        near_dup_action: str = "link",
+        embedding_options: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Args:
+            analyzer: 关键字索引的分词器，"cjk_bigram" (默认，中文字符 bigram)、
+                      "jieba" (词典分词，需安装 jieba) 或 "whitespace" (按空白切分)
+            llm_pool: LLM 客户端池，可传入自定义超时 / 并发 / 重试配置
+            embedding_cache_dir: embedding 磁盘缓存目录 (与知识库分开存放，清空知识库后仍可复用)，
+                                 None 表示不使用缓存；embeddings 已是 CachedEmbeddings 时忽略
+            embedding_cache_size: 缓存的最大条目数，超出后按 LRU 淘汰
+            answer_cache_size / answer_cache_ttl / answer_cache_threshold:
+                语义答案缓存的最大条目数 (0 表示关闭)、过期秒数和问题相似度阈值
+            metrics: 分阶段耗时的埋点注册表，默认每个 RAGManager 独立一个
+            embeddings: 自定义 Embedding 实现 (如基准测试中的假模型)，默认 all-MiniLM-L6-v2 (第一次 embed 时才加载)
+            context_max_tokens: RAG 上下文的 token 预算 (去重、按句裁剪、截断)，None 表示拼接全部检索结果
+            vector_backend: 向量库后端，"chroma" (默认，HNSW 近似检索)、"numpy" (内存映射的 float32 矩阵，
+                            精确检索) 或 "numpy-int8" (int8 量化)。不同后端的数据分开存放，切换后需重新入库
+            near_dup_threshold: 入库时近似重复 chunk 检测的相似度阈值 (MinHash 估计的字符 shingle
+                                Jaccard 相似度，如 0.85)，None 表示关闭。只与其他文件的 chunk 比较
+            near_dup_action: "link" (默认，照常入库并记录所属的规范 chunk，检索时同组只保留一个) 或
+                             "skip" (不 embedding、不写入，节省存储和检索开销)
+            embedding_options: 默认模型的推理配置 (embeddings 为 None 时使用)，如
+                               {"backend": "onnx-int8", "batch_size": 64, "threads": 4, "processes": 0}，
+                               见 embedding_models.embedding_factory
+        """
+        if near_dup_threshold is not None and not 0 < near_dup_threshold <= 1:
+            raise ValueError(f"near_dup_threshold must be in (0, 1], got {near_dup_threshold}")
+        if near_dup_action not in NEAR_DUP_ACTIONS:
+            raise ValueError(f"unknown near_dup_action: {near_dup_action} (expected one of {NEAR_DUP_ACTIONS})")
         self.persist_directory = persist_directory
-        self.embedding_model_name = "sentence-transformers/all-MiniLM-L6-v2"
-        # 初始化 Embedding，避免每次调用都重新加载
-        self.embeddings = HuggingFaceEmbeddings(model_name=self.embedding_model_name)
-        self.vectorstore = None
-        # 存储所有文档用于 BM25 检索
-        self.stored_documents: List[Document] = []
+        self.vector_backend = vector_backend
+        # 各阶段 span 的耗时直方图 / 最近的 trace，供诊断面板和 /metrics 使用
+        self.metrics = metrics or MetricsRegistry()
+        # 按 (base_url, model, api_key) 复用 LLM 客户端和 HTTP 连接
+        self.llm_pool = llm_pool or LLMClientPool()
+        self.analyzer = get_analyzer(analyzer)
+        if embeddings is None:
+            # 模型在第一次 embed (或 warm_up) 时加载一次，构造 RAGManager 不再等待数秒。
+            # int8 后端的缓存标识不同 (embedding_id)，与 fp32 的缓存互不混用
+            embeddings = create_embeddings(DEFAULT_MODEL_NAME, **(embedding_options or {}))
+            self.embedding_model_name = embeddings.model_name
+        elif isinstance(embeddings, CachedEmbeddings):
+            # 已带缓存 (KnowledgeBaseManager 让多个知识库共用一个模型和一份缓存)，不再重复包装
+            self.embedding_model_name = embeddings.cache.model_name
+        else:
+            self.embedding_model_name = getattr(embeddings, "model_name", None) or type(embeddings).__name__
+        # 未经缓存包装的模型，warm_up 时直接调用它
+        self._embedding_model = embeddings.underlying if isinstance(embeddings, CachedEmbeddings) else embeddings
+        self.embeddings = embeddings
+        if embedding_cache_dir and not isinstance(embeddings, CachedEmbeddings):
+            # 文档和查询的 embedding 都经过磁盘缓存 (Chroma 查询时也会用到)
+            self.embeddings = CachedEmbeddings(
+                self.embeddings,
+                EmbeddingCache(embedding_cache_dir, self.embedding_model_name, max_entries=embedding_cache_size)
+            )
+        # 向量库在第一次访问 self.vectorstore 时才打开 (见 vectorstore 属性)
+        self._vectorstore = None
+        self._vectorstore_lock = threading.Lock()
+        self.catalog: Optional[DocumentCatalog] = None
+        # 持久化的 BM25 倒排索引，首次查询时才打开
+        self.keyword_index: Optional[KeywordIndex] = None
+        self._keyword_index_checked = False
+        self._keyword_index_init_lock = threading.Lock()
+        # 近似重复 chunk 索引 (near_dup_threshold 不为 None 时启用)，首次入库时与库中数据核对
+        self.near_dup_threshold = near_dup_threshold
+        self.near_dup_action = near_dup_action
+        self.near_dup_index: Optional[NearDuplicateIndex] = None
+        self._near_dup_checked = False
+        # 写: process_file / delete_document / clear_database；读: 检索
+        self._lock = ReadWriteLock()
+        # 每个 chunk 的平均 embedding 耗时，用于估算去重节省的时间
+        self._embed_seconds_per_chunk = 0.0
+        # 相同 / 近似问题直接返回缓存的回答；语料每次变化都会递增 _kb_version
+        self.answer_cache = SemanticAnswerCache(
+            max_entries=answer_cache_size, ttl_seconds=answer_cache_ttl, threshold=answer_cache_threshold
+        )
+        self._kb_version = 0
+        # 检索结果放入 prompt 前按 token 预算压缩
+        self.context_packer = (
+            ContextPacker(max_tokens=context_max_tokens, analyzer=self.analyzer) if context_max_tokens else None
+        )
         self._init_vectorstore()
 
     def _init_vectorstore(self):
         """
-        初始化或加载现有的 ChromaDB
+        加载文档目录 (catalog) 和关键字索引；向量库 (按 vector_backend 选择) 推迟到第一次使用时打开，
+        文档列表等只读 catalog 的操作不需要导入 chromadb、加载 HNSW 索引。
+        已有数据但 catalog 缺失或损坏时必须从向量库重建，此时立即打开 (全新的目录不需要)。
         """
-        self.vectorstore = Chroma(
-            persist_directory=self.persist_directory,
-            embedding_function=self.embeddings
-        )
+        self._vectorstore = None
+        self.catalog = DocumentCatalog(self.persist_directory)
+        if self.catalog.needs_rebuild and os.path.isdir(self.persist_directory) and os.listdir(self.persist_directory):
+            self._open_vectorstore()
+        self.keyword_index = KeywordIndex(self.persist_directory, analyzer=self.analyzer)
+        self._keyword_index_checked = False
+        if self.near_dup_threshold is not None:
+            self.near_dup_index = NearDuplicateIndex(self.persist_directory, threshold=self.near_dup_threshold)
+            self._near_dup_checked = False
+
+    @property
+    def vectorstore(self):
+        if self._vectorstore is None:
+            return self._open_vectorstore()
+        return self._vectorstore
+
+    def _open_vectorstore(self):
+        with self._vectorstore_lock:
+            if self._vectorstore is not None:
+                return self._vectorstore
+            with self.metrics.span("vectorstore_open"):
+                store = create_vector_store(self.vector_backend, self.persist_directory, self.embeddings)
+                # catalog 缺失 (旧版本数据库)、损坏，或与向量库数量不一致 (上次写入中途失败)
+                # 时，从向量库重建一次。count() 是 O(1) 的
+                if self.catalog.needs_rebuild or self.catalog.total_chunks != store.count():
+                    data = store.get(include=["metadatas", "documents"])
+                    self.catalog.rebuild(data["metadatas"], data["documents"])
+            self._vectorstore = store
+            return store
+
+    def warm_up(self, background: bool = True) -> Optional[threading.Thread]:
+        """
+        提前打开向量库并加载 embedding 模型，让第一个查询不必承担冷启动开销。
+        background=True 时在守护线程中进行并返回该线程，调用方 (如 app.py) 不会被阻塞；
+        预热期间到来的查询会等待同一把锁，不会重复加载。
+        """
+        def run():
+            try:
+                with self.metrics.span("warm_up"):
+                    import retrievers  # noqa: F401
+                    self._open_vectorstore()
+                    # 直接调用未缓存的模型，确保模型真正加载 (首次推理的初始化开销也一并付掉)
+                    self._embedding_model.embed_query("warm up")
+            except Exception:
+                logger.exception("warm up failed")
+
+        if not background:
+            run()
+            return None
+        thread = threading.Thread(target=run, name="rag-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def _ensure_keyword_index(self) -> KeywordIndex:
+        """
+        懒加载关键字索引。首次使用时检查它与向量库是否一致、分词器是否相同，
+        不一致 (如旧版本数据库没有索引，或换了分词器) 时从 Chroma 重建一次。
+        """
+        with self._keyword_index_init_lock:
+            if self._keyword_index_checked:
+                return self.keyword_index
+            stored = self.keyword_index.stored_analyzer()
+            if (self.keyword_index.count() != self.catalog.total_chunks
+                    or (stored is not None and stored != self.analyzer.name)):
+                logger.warning("keyword index out of sync, rebuilding from vectorstore")
+                data = self.vectorstore.get(include=["metadatas", "documents"])
+                self.keyword_index.clear()
+                self.keyword_index.add(data["ids"], data["documents"], data["metadatas"])
+            self._keyword_index_checked = True
+            return self.keyword_index
+
+    def _ensure_near_dup_index(self) -> NearDuplicateIndex:
+        """
+        首次使用时检查近似重复索引是否覆盖了库中全部 chunk；不一致 (如对已有知识库新开启去重)
+        时从向量库回填，已有的 chunk 都作为规范 chunk
+        """
+        with self._keyword_index_init_lock:
+            if not self._near_dup_checked:
+                if self.near_dup_index.count_stored() != self.catalog.total_chunks:
+                    logger.warning("near-duplicate index out of sync, rebuilding from vectorstore")
+                    data = self.vectorstore.get(include=["metadatas", "documents"])
+                    self.near_dup_index.clear()
+                    self.near_dup_index.add_canonical(data["ids"], data["documents"], data["metadatas"])
+                self._near_dup_checked = True
+            return self.near_dup_index
+
+    def _forget_near_duplicates(self, orphaned: set):
+        """
+        skip 模式下被跳过的重复 chunk 依赖其他文件中的规范 chunk。规范 chunk 被删除后，
+        把这些文件在 catalog 中标记为需要重新处理，下次入库时恢复它们的内容
+        """
+        if orphaned:
+            logger.warning("canonical chunks removed, re-ingest to restore skipped duplicates: %s", sorted(orphaned))
+            self.catalog.mark_stale(orphaned)
 
     def process_file(
         self, 
@@ -45,90 +262,350 @@ class RAGManager:
     ) -> List[Document]:
         """
         加载文件，切分，并存入向量库。
-        返回切分后的 chunks 以便预览。
+        返回该文件当前的全部 chunks 以便预览。
         
         Args:
             split_method: "recursive" (递归字符切分) 或 "fixed" (固定大小切分)
         """
-        # 1. 加载
-        docs = load_doc(file_path)
-        if not docs:
-            return []
+        return self.ingest_file(file_path, chunk_size, chunk_overlap, split_method)["chunks"]
 
-        # 2. 根据切分方式选择 Splitter
-        if split_method == "fixed":
-            text_splitter = CharacterTextSplitter(
-                chunk_size=chunk_size,
-                chunk_overlap=chunk_overlap,
-                separator="\n"
-            )
-        else:  # 默认 recursive
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=chunk_size,
-                chunk_overlap=chunk_overlap,
-                separators=["\n\n", "\n", "。", "！", "？", " ", ""]
+    def ingest_file(
+        self,
+        file_path: str,
+        chunk_size: int,
+        chunk_overlap: int,
+        split_method: str = "recursive",
+        window_chars: int = DEFAULT_WINDOW_CHARS,
+        progress_callback: Optional[ProgressCallback] = None
+    ) -> Dict[str, Any]:
+        """
+        幂等入库: chunk id 由 source + 内容哈希确定。
+
+        - 文件内容和切分参数都没变: 直接跳过，不加载、不切分、不 embedding
+        - 文件有变化: 只 embedding 新增的 chunk，删除已不存在的旧 chunk
+
+        文件按页 / 文本块流式加载，每次只切分、embedding、写入一个窗口 (约 window_chars 个字符)，
+        大文件的内存占用不随文件大小增长。写入途中失败会回滚本次新增的 chunk。
+
+        返回 {"chunks": [...], "report": {...}}，report 包含
+        source / new / unchanged / removed / skipped_file / near_duplicates / embed_seconds / seconds_saved
+        """
+        pipeline = BulkIngestionPipeline(
+            self, chunk_size, chunk_overlap, split_method,
+            workers=0, window_chars=window_chars, progress_callback=progress_callback
+        )
+        self._ensure_keyword_index()
+        if self.near_dup_index is not None:
+            self._ensure_near_dup_index()
+        with self.metrics.span("ingest_file", source=file_path) as span:
+            stats = pipeline.run([file_path])
+            span.set(new=stats["new"], unchanged=stats["unchanged"], removed=stats["removed"])
+        if pipeline.exceptions:
+            raise pipeline.exceptions[0]
+
+        report = {
+            "source": file_path,
+            "new": stats["new"],
+            "unchanged": stats["unchanged"],
+            "removed": stats["removed"],
+            "skipped_file": stats["skipped_files"] > 0,
+            "near_duplicates": stats["near_duplicates"],
+            "embed_seconds": stats["embed_seconds"],
+            "seconds_saved": stats["seconds_saved"]
+        }
+        logger.info("ingest report %s", report)
+        return {"chunks": self.get_document_chunks([file_path]), "report": report}
+
+    def ingest_paths(
+        self,
+        paths_or_dir,
+        chunk_size: int,
+        chunk_overlap: int,
+        split_method: str = "recursive",
+        workers: Optional[int] = None,
+        embed_batch_size: int = 256,
+        window_chars: int = DEFAULT_WINDOW_CHARS,
+        atomic: bool = False,
+        progress_callback: Optional[ProgressCallback] = None
+    ) -> Dict[str, Any]:
+        """
+        批量入库: 多进程解析切分，跨文件攒批 embedding，按批写入。
+        与 ingest_file 一样是幂等的，未变化的文件直接跳过。
+
+        Args:
+            paths_or_dir: 目录、文件路径或路径列表 (目录会递归查找 pdf/txt/md)
+            workers: 解析进程数，默认 CPU 核数；0 表示在线程中流式解析
+            window_chars: 大文件流式处理时每个窗口的字符数，决定内存占用上限
+            atomic: True 时批次先暂存到磁盘，全部处理完后在一次写锁内提交，新 chunk 一次性可见
+                    (后台任务使用，见 jobs.IngestionJobManager)
+            progress_callback: 每写完一批或一个文件时在调用方线程中回调，参数为当前统计
+
+        返回统计 dict: files_total / files_done / skipped_files / new / unchanged / removed /
+        near_duplicates / near_duplicates_skipped / near_duplicate_chars_saved /
+        chunks_written / embed_seconds / seconds / chunks_per_sec / seconds_saved / errors
+        """
+        self._ensure_keyword_index()
+        if self.near_dup_index is not None:
+            self._ensure_near_dup_index()
+        pipeline = BulkIngestionPipeline(
+            self, chunk_size, chunk_overlap, split_method,
+            workers=workers, embed_batch_size=embed_batch_size,
+            window_chars=window_chars, atomic=atomic, progress_callback=progress_callback
+        )
+        with self.metrics.span("ingest_paths") as span:
+            stats = pipeline.run([paths_or_dir] if isinstance(paths_or_dir, str) else paths_or_dir)
+            span.set(files=stats["files_done"], new=stats["new"], chunks_per_sec=round(stats["chunks_per_sec"], 1))
+        logger.info("bulk ingest finished: %s", {k: v for k, v in stats.items() if k != "errors"})
+        return stats
+
+    # ---------- 入库流水线 (ingestion.BulkIngestionPipeline) 调用的步骤 ----------
+
+    def _existing_ids(self, source: str) -> set:
+        """
+        库中某个 source 已有的 chunk id (按 where 过滤，只返回 id)
+        """
+        return set(self.vectorstore.get(where={"source": source}, include=[])["ids"])
+
+    def _check_near_duplicate(self, source: str, chunk):
+        """
+        入库流水线对每个新 chunk (chunk_id, text, metadata) 调用，返回 (要写入的 chunk, 规范 chunk id)。
+        未启用去重时原样返回；启用时 metadata 记录所属的近似重复组，
+        skip 模式下的重复 chunk 返回 (None, 规范 chunk id)，不再 embedding 和写入
+        """
+        if self.near_dup_index is None:
+            return chunk, None
+        chunk_id, text, metadata = chunk
+        match = self.near_dup_index.add(chunk_id, text, source, store_duplicate=self.near_dup_action == "link")
+        canonical = match[0] if match else None
+        if canonical is not None and self.near_dup_action == "skip":
+            return None, canonical
+        return (chunk_id, text, {**metadata, NEAR_DUP_GROUP_KEY: canonical or chunk_id}), canonical
+
+    def _embed_texts(self, texts: List[str]):
+        """
+        计算一批文本的 embedding，返回 (向量列表, 耗时秒数)，并更新每个 chunk 的平均耗时
+        """
+        if not texts:
+            return [], 0.0
+        with self.metrics.span("embed_documents", texts=len(texts)) as span:
+            embeddings = self.embeddings.embed_documents(texts)
+        seconds = span.seconds
+        per_chunk = seconds / len(texts)
+        self._embed_seconds_per_chunk = 0.8 * self._embed_seconds_per_chunk + 0.2 * per_chunk \
+            if self._embed_seconds_per_chunk else per_chunk
+        return embeddings, seconds
+
+    def _write_chunks(self, ids: List[str], texts: List[str], metadatas: List[Dict], embeddings: List[List[float]]):
+        """
+        把已算好 embedding 的一批 chunk 写入向量库和 BM25 索引。调用方需持有写锁。
+        """
+        if not ids:
+            return
+        self._corpus_changed()
+        with self.metrics.span("write_chunks", chunks=len(ids)):
+            self.vectorstore.upsert(ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
+            try:
+                self._ensure_keyword_index().add(ids, texts, metadatas)
+            except Exception:
+                self.vectorstore.delete(ids=ids)
+                if self.near_dup_index is not None:
+                    self._forget_near_duplicates(self.near_dup_index.delete_ids(ids))
+                raise
+
+    def _delete_chunks(self, ids: List[str]):
+        """
+        从向量库和 BM25 索引中删除一批 chunk (入库失败时回滚用)。调用方需持有写锁。
+        """
+        self._corpus_changed()
+        self.vectorstore.delete(ids=ids)
+        self._ensure_keyword_index().delete_ids(ids)
+        if self.near_dup_index is not None:
+            self._forget_near_duplicates(self.near_dup_index.delete_ids(ids))
+
+    def _finalize_source(
+        self,
+        source: str,
+        keep_ids: set,
+        total_chars: int,
+        content_hash: str,
+        split_params: Dict,
+        skipped_ids: frozenset = frozenset()
+    ) -> int:
+        """
+        一个文件的 chunk 全部写入后: 删除已不存在的旧 chunk 并更新 catalog。
+        skipped_ids 是作为近似重复被跳过的 chunk，在近似重复索引中保留它们的记录。
+        调用方需持有写锁。返回删除的旧 chunk 数。
+        """
+        stale = sorted(self._existing_ids(source) - keep_ids)
+        self._corpus_changed()
+        if stale:
+            self.vectorstore.delete(ids=stale)
+            self._ensure_keyword_index().delete_ids(stale)
+        if self.near_dup_index is not None:
+            self._forget_near_duplicates(self.near_dup_index.retain_source(source, keep_ids | skipped_ids))
+        if keep_ids:
+            self.catalog.record_ingest(
+                source=source,
+                chunk_count=len(keep_ids),
+                total_chars=total_chars,
+                content_hash=content_hash,
+                split_params=split_params
             )
-        chunks = text_splitter.split_documents(docs)
+        else:
+            self.catalog.remove(source)
+        return len(stale)
+
+    def get_document_chunks(self, sources: Sequence[str]) -> List[Document]:
+        """
+        按入库顺序读取若干文件当前在库中的 chunks (用于预览)
+        """
+        index = self._ensure_keyword_index()
+        with self._lock.read_lock():
+            return [
+                Document(id=cid, page_content=text, metadata=meta)
+                for source in sources
+                for cid, text, meta in index.get_by_source(source)
+            ]
+
+    def count_document_chunks(self, sources: Sequence[str]) -> int:
+        index = self._ensure_keyword_index()
+        with self._lock.read_lock():
+            return index.count_by_sources(list(sources))
+
+    def preview_document_chunks(
+        self, sources: Sequence[str], offset: int = 0, limit: int = 50, preview_chars: int = 100
+    ) -> List[Dict[str, Any]]:
+        """
+        分页预览若干文件的 chunks: 每页只从索引读取 id、来源、字符数和前 preview_chars 个字符，
+        内存与耗时只和页大小有关。完整内容用 get_chunks 按 id 读取
+        """
+        index = self._ensure_keyword_index()
+        with self._lock.read_lock():
+            rows = index.page_by_sources(list(sources), offset, limit, preview_chars)
+        return [{"id": cid, "source": source, "chars": chars, "preview": preview} for cid, source, chars, preview in rows]
+
+    def get_chunks(self, ids: Sequence[str]) -> List[Document]:
+        """
+        按 chunk id 读取完整的 chunks (顺序与 ids 一致，已删除的跳过)
+        """
+        index = self._ensure_keyword_index()
+        with self._lock.read_lock():
+            return [Document(id=cid, page_content=text, metadata=meta) for cid, text, meta in index.get_many(list(ids))]
+
+    def _corpus_changed(self):
+        """
+        语料发生变化 (入库 / 删除 / 清空)，使答案缓存失效。调用方需持有写锁。
+        """
+        self._kb_version += 1
+        self.answer_cache.clear()
+
+    @property
+    def kb_version(self):
+        """
+        知识库版本戳: 本进程内的变更计数 + catalog 文件版本 (覆盖其他进程的修改)
+        """
+        return (self._kb_version, self.catalog.version)
+
+    def answer_cache_stats(self) -> Dict[str, Any]:
+        """
+        答案缓存的命中率、节省的延迟 (秒) 和条目数
+        """
+        return self.answer_cache.stats()
 
-        # 3. 存入向量库
-        if chunks:
-            self.vectorstore.add_documents(chunks)
-            # 同时存储到内存列表，用于 BM25 检索
-            self.stored_documents.extend(chunks)
+    def embedding_cache_stats(self) -> Dict[str, Any]:
+        """
+        embedding 缓存的命中 / 未命中计数和条目数；未启用缓存时返回空字典
+        """
+        if isinstance(self.embeddings, CachedEmbeddings):
+            return self.embeddings.cache.stats()
+        return {}
 
-        return chunks
+    def near_duplicate_stats(self) -> Dict[str, Any]:
+        """
+        近似重复检测的效果: indexed / linked / skipped / skipped_chars，skip 模式省下的 embedding 时间
+        (embed_seconds_saved) 和向量库行数比例 (index_rows_saved_ratio，暴力检索的耗时与行数成正比)，
+        以及检索时折叠掉的重复结果数 (collapsed)。未启用时返回空字典
+        """
+        if self.near_dup_index is None:
+            return {}
+        stats: Dict[str, Any] = self.near_dup_index.stats()
+        stored = stats["indexed"] - stats["skipped"]
+        stats.update(
+            embed_seconds_saved=stats["skipped"] * self._embed_seconds_per_chunk,
+            index_rows_saved_ratio=stats["skipped"] / stats["indexed"] if stats["indexed"] else 0.0,
+            stored=stored,
+            collapsed=int(self.metrics.counters().get("rag_near_duplicates_collapsed_total", 0)),
+        )
+        return stats
 
     def get_all_documents_metadata(self) -> List[Dict]:
         """
         获取数据库中所有文档的 Metadata 信息，用于列表展示。
-        注意：Chroma API 获取所有数据可能较慢，这里仅作简单实现。
-        """
-        # 这是一个比较重的操作，如果数据量大需优化
-        # 直接利用 get() 获取所有 metadatas
-        data = self.vectorstore.get()
-        metadatas = data['metadatas']
-        # 去重，按 source 归类
-        unique_files = {}
-        for idx, m in enumerate(metadatas):
-            if not m: continue
-            src = m.get('source', 'Unknown')
-            if src not in unique_files:
-                unique_files[src] = {'count': 0, 'source': src}
-            unique_files[src]['count'] += 1
-        
-        return list(unique_files.values())
+        直接读取 catalog，复杂度为 O(文件数)，不再扫描 Chroma。
+
+        每项包含: source, count (chunk 数), total_chars, ingested_at, content_hash, split_params
+        """
+        with self._lock.read_lock():
+            return self.catalog.list()
 
     def delete_document(self, source_path: str):
         """
         根据 source 删除文档
         """
-        # Chroma 的 delete 方法支持 where 过滤
-        self.vectorstore.delete(where={"source": source_path})
+        with self._lock.write_lock():
+            self._corpus_changed()
+            # 各向量库后端的 delete 都支持 where 过滤
+            self.vectorstore.delete(where={"source": source_path})
+            self._ensure_keyword_index().delete_source(source_path)
+            self.catalog.remove(source_path)
+            if self.near_dup_index is not None:
+                self._forget_near_duplicates(self.near_dup_index.retain_source(source_path, set()))
 
     def clear_database(self):
         """
-        完全清空知识库
+        清空本知识库: 原地清空向量库 collection、关键字索引、近似重复索引和 catalog。
+        不删除目录，不需要关闭连接再 rmtree、等待文件系统释放，Chroma 客户端也不会留下过期的缓存
         """
-        # 1. 删除内存中的对象
-        # 2. 删除磁盘文件
-        if self.vectorstore:
-            # 尝试释放资源
-            self.vectorstore = None
-        
-        # 清空 BM25 用的文档列表
-        self.stored_documents = []
-        
-        if os.path.exists(self.persist_directory):
-            try:
-                shutil.rmtree(self.persist_directory)
-                time.sleep(0.5) # 等待文件系统释放
-            except Exception as e:
-                print(f"Error deleting directory: {e}")
-        
-        # 3. 重新初始化
-        self._init_vectorstore()
+        with self._lock.write_lock():
+            self._corpus_changed()
+            self.vectorstore.clear()
+            self.keyword_index.clear()
+            self._keyword_index_checked = True
+            if self.near_dup_index is not None:
+                self.near_dup_index.clear()
+                self._near_dup_checked = True
+            self.catalog.clear()
 
-    def get_retriever(self, search_type="Vector", k=3):
+    @property
+    def is_open(self) -> bool:
+        """
+        向量库或关键字索引当前是否打开 (占用内存和文件句柄)
+        """
+        return self._vectorstore is not None or self.keyword_index.is_open
+
+    def close(self):
+        """
+        释放向量库、关键字索引、近似重复索引和答案缓存占用的内存与文件句柄 (KnowledgeBaseManager
+        按 LRU 关闭不活跃的知识库时调用)。对象仍可继续使用，下次访问时按需重新打开
+        """
+        with self._lock.write_lock():
+            with self._vectorstore_lock:
+                if self._vectorstore is not None:
+                    self._vectorstore.close()
+                    self._vectorstore = None
+            self.keyword_index.close()
+            if self.near_dup_index is not None:
+                self.near_dup_index.close()
+            self.answer_cache.clear()
+
+    def get_retriever(
+        self,
+        search_type: str = "Vector",
+        k: int = 3,
+        fetch_k: Optional[int] = None,
+        weights: Sequence[float] = (0.5, 0.5),
+        filters: Optional[Dict[str, Any]] = None
+    ):
         """
         获取检索器
         
@@ -136,118 +613,272 @@ class RAGManager:
             search_type: 
                 - "Vector": 向量相似度检索
                 - "BM25": 关键字检索 (BM25 算法)
-                - "Hybrid": 混合检索 (Vector + BM25 综合排序)
+                - "Hybrid": 混合检索 (Vector + BM25 并发检索，RRF 融合)
             k: 返回的文档数量
+            fetch_k: Hybrid 模式下每一路的候选数量，默认 2 * k
+            weights: Hybrid 模式下 (Vector, BM25) 的融合权重
+            filters: 按 source / 文件类型 / 页码 / 入库时间过滤，格式见 search_filters；
+                向量库和倒排索引都在打分前过滤
         """
-        # 向量检索器
-        vector_retriever = self.vectorstore.as_retriever(
-            search_type="similarity", 
-            search_kwargs={"k": k}
-        )
-        
-        if search_type == "Vector":
-            return vector_retriever
-        
-        elif search_type == "BM25":
-            # BM25 关键字检索
-            if not self.stored_documents:
-                print("WARNING: No documents in memory for BM25, falling back to Vector")
-                return vector_retriever
-            bm25_retriever = BM25Retriever.from_documents(self.stored_documents, k=k)
-            return bm25_retriever
+        from retrievers import KeywordIndexRetriever, HybridRetriever, VectorSearchRetriever
+
+        search_filter = self.resolve_filters(filters)
+        if search_type == "BM25":
+            # BM25 关键字检索: 直接查询持久化倒排索引，不再每次重建
+            return KeywordIndexRetriever(
+                index=self._ensure_keyword_index(), k=k, metrics=self.metrics, filter=search_filter
+            )
         
         elif search_type == "Hybrid":
-            # 混合检索: 结合 Vector 和 BM25
-            if not self.stored_documents:
-                print("WARNING: No documents in memory for Hybrid, falling back to Vector")
-                return vector_retriever
-            bm25_retriever = BM25Retriever.from_documents(self.stored_documents, k=k)
-            # EnsembleRetriever 将两个检索器的结果融合
-            # weights 控制两者权重，默认各占 50%
-            ensemble_retriever = EnsembleRetriever(
+            # 混合检索: 两路并发，各取 fetch_k 个候选，RRF 融合后取前 k 个
+            fetch_k = fetch_k or 2 * k
+            vector_retriever = VectorSearchRetriever(
+                vectorstore=self.vectorstore, embeddings=self.embeddings, k=fetch_k, metrics=self.metrics,
+                filter=search_filter
+            )
+            bm25_retriever = KeywordIndexRetriever(
+                index=self._ensure_keyword_index(), k=fetch_k, metrics=self.metrics, filter=search_filter
+            )
+            return HybridRetriever(
                 retrievers=[vector_retriever, bm25_retriever],
-                weights=[0.5, 0.5]
+                weights=list(weights),
+                k=k,
+                metrics=self.metrics
             )
-            return ensemble_retriever
         
         else:
-            return vector_retriever
+            # 向量检索器 ("Vector" 及未知类型)；查询 embedding 与向量搜索分别计时
+            return VectorSearchRetriever(
+                vectorstore=self.vectorstore, embeddings=self.embeddings, k=k, metrics=self.metrics,
+                filter=search_filter
+            )
 
-    def chat(self, query: str, api_key: str, base_url: str, model_name: str = "glm-4-flash", search_type: str = "Vector") -> Dict[str, Any]:
+    def resolve_filters(self, filters) -> Optional[SearchFilter]:
         """
-        RAG 对话核心方法
-        
-        智能响应逻辑:
-        - 如果知识库为空: 使用普通 LLM 对话模式
-        - 如果知识库有文档: 使用 RAG 模式，且对于知识库中没有的内容会拒绝回答
+        把 filters 字典按 catalog 解析为 SearchFilter (已是 SearchFilter 时原样返回)，为空时返回 None
+        """
+        if filters is None or isinstance(filters, SearchFilter):
+            return filters
+        return resolve_filters(filters, self.catalog.list())
+
+    def retrieve(
+        self,
+        query: str,
+        search_type: str = "Vector",
+        k: int = 3,
+        fetch_k: Optional[int] = None,
+        weights: Sequence[float] = (0.5, 0.5),
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[Document]:
+        """
+        只检索不生成: 在读锁内按 get_retriever 的参数检索，计入 span "retrieval"。
+        同一近似重复组的 chunk 只保留排名最前的一个 (link 模式下多取一倍候选再折叠)
+        """
+        search_k = k * self._near_dup_fetch_factor()
+        search_filter = self.resolve_filters(filters)
+        with self.metrics.span(
+            "retrieval", search_type=search_type, k=k, filtered=search_filter is not None
+        ) as span:
+            with self._lock.read_lock():
+                retriever = self.get_retriever(
+                    search_type=search_type, k=search_k, fetch_k=fetch_k, weights=weights, filters=search_filter
+                )
+                docs = retriever.invoke(query)
+            docs = self._collapse_near_duplicates([docs], k, span)[0]
+            span.set(docs=len(docs))
+        return docs
+
+    def _near_dup_fetch_factor(self) -> int:
+        return 2 if self.near_dup_index is not None and self.near_dup_action == "link" else 1
+
+    def _collapse_near_duplicates(self, results: List[List[Document]], k: int, span=None) -> List[List[Document]]:
+        collapsed_total = 0
+        out = []
+        for docs in results:
+            docs, collapsed = collapse_near_duplicates(docs, k)
+            collapsed_total += collapsed
+            out.append(docs)
+        if collapsed_total:
+            self.metrics.inc("rag_near_duplicates_collapsed_total", collapsed_total)
+            if span is not None:
+                span.set(near_duplicates_collapsed=collapsed_total)
+        return out
+
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        一次批量计算多个查询的 embedding。带缓存时走 CachedEmbeddings.embed_queries，
+        否则直接用 embed_documents (Embeddings 接口没有批量查询方法)
+        """
+        with self.metrics.span("embed_query_batch", queries=len(queries)):
+            embed = getattr(self.embeddings, "embed_queries", None) or self.embeddings.embed_documents
+            return embed(list(queries))
+
+    def _vector_search_batch(
+        self, query_vectors: List[List[float]], k: int, search_filter: Optional[SearchFilter] = None
+    ) -> List[List[Document]]:
+        # 一次查询带上全部查询向量，结果与 similarity_search_by_vector 逐个查询相同
+        if search_filter is not None and search_filter.matches_nothing:
+            return [[] for _ in query_vectors]
+        where = search_filter.where() if search_filter is not None else None
+        with self.metrics.span("vector_search_batch", queries=len(query_vectors), k=k, filtered=where is not None):
+            return self.vectorstore.query_batch(query_vectors, k, where)
+
+    def _bm25_search_batch(
+        self, queries: List[str], k: int, search_filter: Optional[SearchFilter] = None
+    ) -> List[List[Document]]:
+        with self.metrics.span("bm25_search_batch", queries=len(queries), k=k, filtered=search_filter is not None):
+            hits = self._ensure_keyword_index().search_many(queries, k=k, filter=search_filter)
+        return [
+            [Document(id=chunk_id, page_content=text, metadata=metadata) for chunk_id, _score, text, metadata in q]
+            for q in hits
+        ]
+
+    def retrieve_batch(
+        self,
+        queries: List[str],
+        search_type: str = "Vector",
+        k: int = 3,
+        fetch_k: Optional[int] = None,
+        weights: Sequence[float] = (0.5, 0.5),
+        query_vectors: Optional[List[List[float]]] = None,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[List[Document]]:
+        """
+        批量检索，结果顺序与 queries 一致，每一项与 retrieve(query, ...) 相同。
+        查询 embedding 一次批量计算 (或由 query_vectors 传入)，向量检索合并为一次 Chroma 查询，
+        BM25 共享倒排链读取；Hybrid 的两路批量检索并发执行后逐个查询做 RRF 融合。
+        filters 对整批查询生效。
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+        search_filter = self.resolve_filters(filters)
+        with self.metrics.span(
+            "retrieval_batch", search_type=search_type, k=k, queries=len(queries), filtered=search_filter is not None
+        ) as span:
+            results = self._search_batch(
+                queries, search_type, k * self._near_dup_fetch_factor(), fetch_k, weights, query_vectors,
+                search_filter
+            )
+            return self._collapse_near_duplicates(results, k, span)
+
+    def _search_batch(
+        self, queries, search_type, k, fetch_k, weights, query_vectors, search_filter=None
+    ) -> List[List[Document]]:
+        with self._lock.read_lock():
+            if search_type == "BM25":
+                return self._bm25_search_batch(queries, k, search_filter)
+            if query_vectors is None:
+                query_vectors = self._embed_queries(queries)
+            if search_type != "Hybrid":
+                return self._vector_search_batch(query_vectors, k, search_filter)
+
+            from retrievers import get_hybrid_executor, reciprocal_rank_fusion
+
+            fetch_k = fetch_k or 2 * k
+            ctx = self.metrics.context()
+
+            def bm25_leg():
+                with self.metrics.attach(ctx):
+                    return self._bm25_search_batch(queries, fetch_k, search_filter)
+
+            bm25_future = get_hybrid_executor().submit(bm25_leg)
+            vector_results = self._vector_search_batch(query_vectors, fetch_k, search_filter)
+            bm25_results = bm25_future.result()
+            with self.metrics.span("fusion_batch", queries=len(queries)):
+                return [
+                    reciprocal_rank_fusion([v, b], list(weights), k=k)
+                    for v, b in zip(vector_results, bm25_results)
+                ]
+
+    def _prepare_chat(
+        self,
+        query: str,
+        api_key: str,
+        base_url: str,
+        model_name: str,
+        search_type: str,
+        k: int,
+        fetch_k: Optional[int],
+        hybrid_weights: Sequence[float],
+        use_cache: bool = True,
+        query_vector: Optional[List[float]] = None,
+        retrieved_docs: Optional[List[Document]] = None,
+        search_filter: Optional[SearchFilter] = None
+    ) -> Dict[str, Any]:
+        """
+        chat / chat_stream / chat_batch 的公共部分: 查答案缓存、准备 LLM、判断模式、检索、组装 chain。
+        query_vector / retrieved_docs 由 chat_batch 传入已批量算好的查询向量和检索结果，
+        search_filter 为调用方已解析的 filters。
+
+        返回 {"chain", "inputs", "source_documents", "mode", "timings", "cache_key"}，
+        命中答案缓存时返回 {"cached", "source_documents", "mode", "timings"}，出错时返回 {"error": ...}
         """
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.output_parsers import StrOutputParser
+
         # 优先使用传入的 api_key，如果为空则尝试环境变量 ZHIPU_API_KEY
         final_api_key = api_key or os.environ.get("ZHIPU_API_KEY")
         
         if not final_api_key:
             return {"error": "请提供 API Key (或设置 ZHIPU_API_KEY 环境变量)"}
 
-        # 1. 准备 LLM
-        print(f"DEBUG: initializing LLM with model={model_name}, base_url={base_url}")
-        try:
-            llm = ChatOpenAI(
-                openai_api_key=final_api_key,
-                openai_api_base=base_url,
-                model_name=model_name,
-                temperature=0.1
-            )
-        except Exception as e:
-            print(f"DEBUG: LLM Init Failed: {e}")
-            raise e
-
-        # 2. 检查知识库是否为空 (同时检查内存列表和向量库)
-        # stored_documents 是内存列表，重启后会清空
-        # vectorstore 是持久化的，需要检查两者
-        try:
-            vectorstore_data = self.vectorstore.get()
-            vectorstore_count = len(vectorstore_data.get('ids', []))
-        except:
-            vectorstore_count = 0
-        
-        has_documents = len(self.stored_documents) > 0 or vectorstore_count > 0
-        print(f"DEBUG: stored_documents={len(self.stored_documents)}, vectorstore={vectorstore_count}, has_documents={has_documents}")
-        
-        from langchain_core.output_parsers import StrOutputParser
+        # 0. 语义答案缓存: 同一检索配置、同一模型、同一知识库版本下的相同 / 近似问题
+        cache_key = None
+        if use_cache and self.answer_cache.max_entries:
+            scope = self._answer_scope(search_type, k, fetch_k, hybrid_weights, base_url, model_name, search_filter)
+            if query_vector is None:
+                with self.metrics.span("embed_query", query_chars=len(query)):
+                    query_vector = self.embeddings.embed_query(query)
+            hit = self._lookup_answer(scope, query_vector)
+            if hit:
+                return hit
+            cache_key = (scope, query_vector)
+
+        # 1. 准备 LLM (从客户端池获取，复用连接)
+        logger.debug("getting LLM client for model=%s, base_url=%s", model_name, base_url)
+        llm = self.llm_pool.get(final_api_key, base_url, model_name)
+
+        # 2. 检查知识库是否为空 (读 catalog 计数，O(1))
+        vectorstore_count = self.catalog.total_chunks
+        has_documents = vectorstore_count > 0
+        logger.debug("vectorstore=%s, has_documents=%s", vectorstore_count, has_documents)
         
         if not has_documents:
             # ========== 模式 A: 普通对话 (无知识库) ==========
-            print("DEBUG: Using normal chat mode (no knowledge base)")
+            logger.debug("Using normal chat mode (no knowledge base)")
             
             normal_prompt = ChatPromptTemplate.from_template("""
 你是一个友好的 AI 助手。请用中文回答用户的问题。
 
 用户问题: {input}
 """)
-            
-            normal_chain = normal_prompt | llm | StrOutputParser()
-            
-            try:
-                response = normal_chain.invoke({"input": query})
-                return {
-                    "answer": response,
-                    "source_documents": [],
-                    "mode": "normal_chat"
-                }
-            except Exception as e:
-                print(f"DEBUG: Normal chat failed: {e}")
-                raise e
+            inputs = {"input": query}
+            self._record_prompt(normal_prompt, inputs)
+            return {
+                "chain": normal_prompt | llm | StrOutputParser(),
+                "inputs": inputs,
+                "source_documents": [],
+                "mode": "normal_chat",
+                "timings": {"retrieval_seconds": 0.0},
+                "cache_key": cache_key
+            }
         
-        else:
-            # ========== 模式 B: RAG 模式 (有知识库) ==========
-            print("DEBUG: Using RAG mode with strict answering policy")
-            
-            # 准备 Retriever
-            retriever = self.get_retriever(search_type=search_type)
-            retrieved_docs = retriever.invoke(query)
-            print(f"DEBUG: Retrieved {len(retrieved_docs)} docs")
-            
-            # 严格的 RAG Prompt - 要求模型只根据上下文回答，否则拒绝
-            rag_prompt = ChatPromptTemplate.from_template("""
+        # ========== 模式 B: RAG 模式 (有知识库) ==========
+        logger.debug("Using RAG mode with strict answering policy")
+        
+        # 检索 (读锁只覆盖检索，不覆盖耗时的 LLM 调用)
+        retrieval_seconds = 0.0
+        if retrieved_docs is None:
+            retrieval_start = time.perf_counter()
+            retrieved_docs = self.retrieve(
+                query, search_type=search_type, k=k, fetch_k=fetch_k, weights=hybrid_weights, filters=search_filter
+            )
+            retrieval_seconds = time.perf_counter() - retrieval_start
+        logger.debug("Retrieved %d docs", len(retrieved_docs))
+        
+        # 严格的 RAG Prompt - 要求模型只根据上下文回答，否则拒绝
+        rag_prompt = ChatPromptTemplate.from_template("""
 你是一个基于知识库的问答助手。请严格遵守以下规则:
 
 1. 只能根据下方提供的「上下文」内容来回答问题
@@ -263,32 +894,340 @@ class RAGManager:
 
 请根据上述规则回答:""")
 
-            def format_docs(docs):
-                if not docs:
-                    return "（无相关内容）"
-                return "\n\n---\n\n".join(doc.page_content for doc in docs)
+        def format_docs(docs):
+            if not docs:
+                return "（无相关内容）"
+            return "\n\n---\n\n".join(doc.page_content for doc in docs)
+
+        timings = {"retrieval_seconds": retrieval_seconds}
+        with self.metrics.span("prompt_build", docs=len(retrieved_docs)) as span:
+            if self.context_packer is not None:
+                packed = self.context_packer.pack(query, retrieved_docs)
+                context = packed["context"]
+                report = packed["report"]
+                span.set(**report)
+                timings.update(context_tokens=report["context_tokens"], context_tokens_saved=report["tokens_saved"])
+                self.metrics.observe("rag_context_tokens_saved", report["tokens_saved"])
+            else:
+                context = format_docs(retrieved_docs)
+            inputs = {"input": query, "context": context}
+            span.set(context_chars=len(inputs["context"]))
+            self._record_prompt(rag_prompt, inputs, span)
+
+        rag_chain = rag_prompt | llm | StrOutputParser()
+        return {
+            "chain": rag_chain,
+            "inputs": inputs,
+            "source_documents": retrieved_docs,
+            "mode": "rag",
+            "timings": timings,
+            "cache_key": cache_key
+        }
+
+    def _answer_scope(self, search_type, k, fetch_k, hybrid_weights, base_url, model_name, search_filter=None):
+        # 同一检索配置 (含过滤条件)、同一模型、同一知识库版本下的回答才能复用
+        filter_key = search_filter.cache_key() if search_filter is not None else None
+        return (self.kb_version, search_type, k, fetch_k, tuple(hybrid_weights), base_url, model_name, filter_key)
+
+    def _lookup_answer(self, scope, query_vector) -> Optional[Dict[str, Any]]:
+        """
+        查答案缓存，命中时返回 _prepare_chat 的缓存命中格式，否则返回 None
+        """
+        with self.metrics.span("answer_cache_lookup") as span:
+            hit = self.answer_cache.lookup(scope, query_vector)
+            span.set(hit=bool(hit))
+        if not hit:
+            return None
+        logger.debug("answer cache hit, similarity=%.3f", hit["similarity"])
+        self.metrics.inc("rag_answer_cache_hits_total")
+        return {
+            "cached": hit,
+            "source_documents": hit["source_documents"],
+            "mode": hit["mode"],
+            "timings": {
+                "cache_hit": True,
+                "cache_seconds": span.seconds,
+                "seconds_saved": hit["seconds_saved"]
+            }
+        }
+
+    def _record_prompt(self, prompt: "ChatPromptTemplate", inputs: Dict[str, Any], span=None):
+        """
+        记录最终 prompt 的字符数和估算 token 数 (直方图 rag_prompt_chars / rag_prompt_tokens)
+        """
+        text = "".join(m.content for m in prompt.format_messages(**inputs))
+        tokens = estimate_tokens(text)
+        self.metrics.observe("rag_prompt_chars", len(text))
+        self.metrics.observe("rag_prompt_tokens", tokens)
+        if span is not None:
+            span.set(prompt_chars=len(text), prompt_tokens=tokens)
 
-            rag_chain = (
-                {"context": lambda x: format_docs(x["context"]), "input": lambda x: x["input"]}
-                | rag_prompt 
-                | llm
-                | StrOutputParser()
+    def chat(
+        self,
+        query: str,
+        api_key: str,
+        base_url: str,
+        model_name: str = "glm-4-flash",
+        search_type: str = "Vector",
+        k: int = 3,
+        fetch_k: Optional[int] = None,
+        hybrid_weights: Sequence[float] = (0.5, 0.5),
+        use_cache: bool = True,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        RAG 对话核心方法
+        
+        智能响应逻辑:
+        - 如果知识库为空: 使用普通 LLM 对话模式
+        - 如果知识库有文档: 使用 RAG 模式，且对于知识库中没有的内容会拒绝回答
+
+        Args:
+            k / fetch_k / hybrid_weights / filters: 透传给 get_retriever
+            use_cache: 是否使用语义答案缓存 (过滤条件不同的回答互不复用)
+
+        返回的 timings 中 retrieval_seconds 与 llm_seconds 分开统计；
+        命中答案缓存时 timings 为 {"cache_hit": True, "cache_seconds", "seconds_saved"}
+        各阶段耗时同时记入 self.metrics (span: chat > answer_cache_lookup / retrieval / prompt_build / llm)
+        """
+        with self.metrics.span("chat", search_type=search_type, k=k, model=model_name) as root:
+            prepared = self._prepare_chat(
+                query, api_key, base_url, model_name, search_type, k, fetch_k, hybrid_weights, use_cache,
+                search_filter=self.resolve_filters(filters)
             )
-            
-            try:
-                response = rag_chain.invoke({
-                    "input": query,
-                    "context": retrieved_docs
-                })
-                print("DEBUG: RAG chain invoke success")
-                
+            if "error" in prepared:
+                return prepared
+            root.set(mode=prepared["mode"])
+            if "cached" in prepared:
                 return {
-                    "answer": response,
-                    "source_documents": retrieved_docs,
-                    "mode": "rag"
+                    "answer": prepared["cached"]["answer"],
+                    "source_documents": prepared["source_documents"],
+                    "mode": prepared["mode"],
+                    "timings": prepared["timings"]
                 }
-            except Exception as e:
-                print(f"DEBUG: RAG chain invoke failed: {e}")
-                import traceback
-                traceback.print_exc()
-                raise e
+
+            timings = prepared["timings"]
+            try:
+                # LLM 耗时单独计时 (不含检索)，并受客户端池的并发上限约束
+                with self.llm_pool.slot():
+                    with self.metrics.span("llm", model=model_name) as span:
+                        response = prepared["chain"].invoke(prepared["inputs"])
+                        span.set(answer_chars=len(response))
+                    timings["llm_seconds"] = span.seconds
+                logger.debug("%s chain invoke success", prepared["mode"])
+            except Exception:
+                logger.exception("%s chain invoke failed", prepared["mode"])
+                raise
+
+            self._store_answer(prepared, response)
+        return {
+            "answer": response,
+            "source_documents": prepared["source_documents"],
+            "mode": prepared["mode"],
+            "timings": timings
+        }
+
+    def chat_stream(
+        self,
+        query: str,
+        api_key: str,
+        base_url: str,
+        model_name: str = "glm-4-flash",
+        search_type: str = "Vector",
+        k: int = 3,
+        fetch_k: Optional[int] = None,
+        hybrid_weights: Sequence[float] = (0.5, 0.5),
+        use_cache: bool = True,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        chat 的流式版本，参数与 chat 相同。生成器依次产出事件:
+
+        - {"type": "sources", "source_documents": [...], "mode": ...}  检索完成后立即产出
+        - {"type": "token", "content": "..."}                            每个回答片段
+        - {"type": "done", "answer": "...", "mode": ..., "timings": {...}} 回答结束
+        - {"type": "error", "error": "..."}                              参数错误 (如缺少 API Key)
+
+        调用方提前停止迭代或调用 close() 时，会关闭底层的 LLM 流式请求。
+        命中答案缓存时整段回答作为一个 token 事件产出；完整输出的回答才会写入缓存。
+
+        检索阶段记为 span "chat_stream"；生成器会跨越调用方的代码挂起，LLM 阶段不开 span，
+        直接把首 token 延迟和总耗时记入 rag_stage_seconds{stage="llm_first_token" / "llm_stream"}。
+        """
+        with self.metrics.span("chat_stream", search_type=search_type, k=k, model=model_name) as root:
+            prepared = self._prepare_chat(
+                query, api_key, base_url, model_name, search_type, k, fetch_k, hybrid_weights, use_cache,
+                search_filter=self.resolve_filters(filters)
+            )
+            root.set(mode=prepared.get("mode"))
+        if "error" in prepared:
+            yield {"type": "error", "error": prepared["error"]}
+            return
+
+        yield {
+            "type": "sources",
+            "source_documents": prepared["source_documents"],
+            "mode": prepared["mode"]
+        }
+
+        if "cached" in prepared:
+            answer = prepared["cached"]["answer"]
+            yield {"type": "token", "content": answer}
+            yield {"type": "done", "answer": answer, "mode": prepared["mode"], "timings": prepared["timings"]}
+            return
+
+        parts = []
+        timings = prepared["timings"]
+        with self.llm_pool.slot():
+            llm_start = time.perf_counter()
+            stream = prepared["chain"].stream(prepared["inputs"])
+            try:
+                for token in stream:
+                    if not parts:
+                        timings["first_token_seconds"] = time.perf_counter() - llm_start
+                    parts.append(token)
+                    yield {"type": "token", "content": token}
+            finally:
+                # 正常结束、异常或调用方取消 (GeneratorExit) 时都关闭底层流
+                stream.close()
+            timings["llm_seconds"] = time.perf_counter() - llm_start
+        if "first_token_seconds" in timings:
+            self.metrics.observe("rag_stage_seconds", timings["first_token_seconds"], stage="llm_first_token")
+        self.metrics.observe("rag_stage_seconds", timings["llm_seconds"], stage="llm_stream")
+
+        answer = "".join(parts)
+        self._store_answer(prepared, answer)
+        yield {"type": "done", "answer": answer, "mode": prepared["mode"], "timings": timings}
+
+    def chat_batch(
+        self,
+        queries: Sequence[str],
+        api_key: str,
+        base_url: str,
+        model_name: str = "glm-4-flash",
+        search_type: str = "Vector",
+        k: int = 3,
+        fetch_k: Optional[int] = None,
+        hybrid_weights: Sequence[float] = (0.5, 0.5),
+        use_cache: bool = True,
+        max_concurrency: int = 4,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        批量对话 (离线评估、定时报告): 参数与 chat 相同，queries 为问题列表，filters 对整批问题生效。
+
+        - 查询 embedding 一次批量计算，答案缓存查找复用这些向量
+        - 未命中缓存的问题一起做 retrieve_batch (一次向量查询 + 批量 BM25)
+        - LLM 调用在线程池中并发，最多 max_concurrency 个 (同时受客户端池并发上限约束)
+
+        返回 {"results": [...], "stats": {...}}。results 与 queries 一一对应，每项与 chat 的返回格式相同，
+        单个问题的 LLM 调用失败时该项为 {"error": ...}，不影响其他问题。
+        timings 中 retrieval_seconds 为整批检索耗时按问题数均摊，seconds 为从批次开始到该问题完成的时间。
+        stats 含 queries / seconds / qps / embed_seconds / retrieval_seconds / llm_seconds / cache_hits / errors。
+        """
+        queries = list(queries)
+        batch_start = time.perf_counter()
+        stats: Dict[str, Any] = {
+            "queries": len(queries), "embed_seconds": 0.0, "retrieval_seconds": 0.0,
+            "llm_seconds": 0.0, "cache_hits": 0, "errors": 0
+        }
+        if not queries:
+            stats.update(seconds=0.0, qps=0.0)
+            return {"results": [], "stats": stats}
+        if not (api_key or os.environ.get("ZHIPU_API_KEY")):
+            error = "请提供 API Key (或设置 ZHIPU_API_KEY 环境变量)"
+            stats.update(errors=len(queries), seconds=0.0, qps=0.0)
+            return {"results": [{"error": error} for _ in queries], "stats": stats}
+
+        search_filter = self.resolve_filters(filters)
+        with self.metrics.span("chat_batch", queries=len(queries), search_type=search_type, k=k) as root:
+            has_documents = self.catalog.total_chunks > 0
+            use_cache = use_cache and bool(self.answer_cache.max_entries)
+            vectors: List[Optional[List[float]]] = [None] * len(queries)
+            if use_cache or (has_documents and search_type != "BM25"):
+                t0 = time.perf_counter()
+                vectors = self._embed_queries(queries)
+                stats["embed_seconds"] = time.perf_counter() - t0
+
+            # 1. 答案缓存
+            prepared: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+            scope = self._answer_scope(search_type, k, fetch_k, hybrid_weights, base_url, model_name, search_filter)
+            if use_cache:
+                for i, vector in enumerate(vectors):
+                    prepared[i] = self._lookup_answer(scope, vector)
+            misses = [i for i, p in enumerate(prepared) if p is None]
+            stats["cache_hits"] = len(queries) - len(misses)
+
+            # 2. 未命中的问题一起检索
+            retrieved: Dict[int, List[Document]] = {}
+            if misses and has_documents:
+                t0 = time.perf_counter()
+                docs_lists = self.retrieve_batch(
+                    [queries[i] for i in misses], search_type=search_type, k=k, fetch_k=fetch_k,
+                    weights=hybrid_weights,
+                    query_vectors=None if search_type == "BM25" else [vectors[i] for i in misses],
+                    filters=search_filter
+                )
+                stats["retrieval_seconds"] = time.perf_counter() - t0
+                retrieved = dict(zip(misses, docs_lists))
+            for i in misses:
+                prepared[i] = self._prepare_chat(
+                    queries[i], api_key, base_url, model_name, search_type, k, fetch_k, hybrid_weights,
+                    use_cache=False, retrieved_docs=retrieved.get(i), search_filter=search_filter
+                )
+                prepared[i]["timings"]["retrieval_seconds"] = stats["retrieval_seconds"] / len(misses)
+                if use_cache:
+                    prepared[i]["cache_key"] = (scope, vectors[i])
+
+            # 3. 并发调用 LLM
+            results: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+            for i, p in enumerate(prepared):
+                if "cached" in p:
+                    results[i] = {
+                        "answer": p["cached"]["answer"],
+                        "source_documents": p["source_documents"],
+                        "mode": p["mode"],
+                        "timings": {**p["timings"], "seconds": time.perf_counter() - batch_start}
+                    }
+            ctx = self.metrics.context()
+
+            def answer(i: int) -> Dict[str, Any]:
+                p = prepared[i]
+                timings = p["timings"]
+                try:
+                    with self.metrics.attach(ctx), self.llm_pool.slot():
+                        with self.metrics.span("llm", model=model_name) as span:
+                            response = p["chain"].invoke(p["inputs"])
+                            span.set(answer_chars=len(response))
+                    timings["llm_seconds"] = span.seconds
+                except Exception as e:
+                    logger.exception("batch query %d failed", i)
+                    return {"error": repr(e)}
+                self._store_answer(p, response)
+                timings["seconds"] = time.perf_counter() - batch_start
+                return {"answer": response, "source_documents": p["source_documents"], "mode": p["mode"], "timings": timings}
+
+            if misses:
+                with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(misses)))) as executor:
+                    for i, result in zip(misses, executor.map(answer, misses)):
+                        results[i] = result
+
+            stats["llm_seconds"] = sum(r["timings"].get("llm_seconds", 0.0) for r in results if "timings" in r)
+            stats["errors"] = sum(1 for r in results if "error" in r)
+            stats["seconds"] = time.perf_counter() - batch_start
+            stats["qps"] = len(queries) / stats["seconds"] if stats["seconds"] else 0.0
+            root.set(cache_hits=stats["cache_hits"], errors=stats["errors"])
+        return {"results": results, "stats": stats}
+
+    def _store_answer(self, prepared: Dict[str, Any], answer: str):
+        """
+        把新生成的回答写入答案缓存，节省的延迟按本次检索 + LLM 耗时计
+        """
+        if prepared.get("cache_key") is None:
+            return
+        scope, query_vector = prepared["cache_key"]
+        timings = prepared["timings"]
+        self.answer_cache.put(
+            scope, query_vector, answer, prepared["source_documents"], prepared["mode"],
+            cost_seconds=timings.get("retrieval_seconds", 0.0) + timings.get("llm_seconds", 0.0)
+        )
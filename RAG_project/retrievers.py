@@ -0,0 +1,140 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from metrics import maybe_span
+
+
+class KeywordIndexRetriever(BaseRetriever):
+    """
+    基于持久化倒排索引 (KeywordIndex) 的 BM25 检索器
+    """
+
+    index: Any
+    k: int = 3
+    metrics: Any = None
+    # search_filters.SearchFilter，在倒排索引中前置过滤
+    filter: Any = None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        with maybe_span(self.metrics, "bm25_search", k=self.k, filtered=self.filter is not None) as span:
+            docs = [
+                Document(id=chunk_id, page_content=text, metadata=metadata)
+                for chunk_id, _score, text, metadata in self.index.search(query, k=self.k, filter=self.filter)
+            ]
+            span.set(docs=len(docs))
+        return docs
+
+
+class VectorSearchRetriever(BaseRetriever):
+    """
+    向量检索。与 vectorstore.as_retriever() 结果相同，但把查询 embedding 和
+    向量库搜索拆成两步，分别计时
+    """
+
+    vectorstore: Any
+    embeddings: Any
+    k: int = 3
+    metrics: Any = None
+    # search_filters.SearchFilter，转换为 where 交给向量库前置过滤
+    filter: Any = None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        if self.filter is not None and self.filter.matches_nothing:
+            return []
+        with maybe_span(self.metrics, "embed_query", query_chars=len(query)):
+            vector = self.embeddings.embed_query(query)
+        where = self.filter.where() if self.filter is not None else None
+        with maybe_span(self.metrics, "vector_search", k=self.k, filtered=where is not None) as span:
+            docs = self.vectorstore.similarity_search_by_vector(vector, k=self.k, filter=where)
+            span.set(docs=len(docs))
+        return docs
+
+
+# Hybrid 两路检索共用的线程池 (进程级，懒创建)
+_hybrid_executor: Optional[ThreadPoolExecutor] = None
+_hybrid_executor_lock = threading.Lock()
+
+
+def get_hybrid_executor() -> ThreadPoolExecutor:
+    global _hybrid_executor
+    with _hybrid_executor_lock:
+        if _hybrid_executor is None:
+            _hybrid_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hybrid")
+        return _hybrid_executor
+
+
+def _doc_key(doc: Document):
+    # Chroma 返回的 Document 不带 id，统一按 (source, 内容) 去重
+    return doc.metadata.get("source"), doc.page_content
+
+
+def reciprocal_rank_fusion(
+    result_lists: Sequence[List[Document]],
+    weights: Sequence[float],
+    k: int,
+    c: int = 60
+) -> List[Document]:
+    """
+    加权倒数排名融合 (RRF): score(d) = sum_i w_i / (c + rank_i(d))，rank 从 1 开始。
+    返回得分最高的 k 个文档，融合得分写入 metadata["rrf_score"]。
+    """
+    scores: Dict[Any, float] = {}
+    first_seen: Dict[Any, Document] = {}
+    for docs, weight in zip(result_lists, weights):
+        for rank, doc in enumerate(docs, start=1):
+            key = _doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + weight / (c + rank)
+            first_seen.setdefault(key, doc)
+    ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
+    return [
+        Document(
+            id=first_seen[key].id,
+            page_content=first_seen[key].page_content,
+            metadata={**first_seen[key].metadata, "rrf_score": score}
+        )
+        for key, score in ranked
+    ]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    混合检索: 各路检索器在线程池中并发执行，再用 RRF 融合。
+    延迟约等于最慢一路，而不是各路之和。
+    """
+
+    retrievers: List[BaseRetriever]
+    weights: List[float]
+    k: int = 3
+    c: int = 60
+    metrics: Any = None
+
+    def _run_leg(self, retriever: BaseRetriever, query: str, config: Dict, ctx) -> List[Document]:
+        if self.metrics is None:
+            return retriever.invoke(query, config)
+        # 在检索线程中延续调用方的 trace
+        with self.metrics.attach(ctx):
+            return retriever.invoke(query, config)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        executor = get_hybrid_executor()
+        ctx = self.metrics.context() if self.metrics is not None else None
+        futures = [
+            executor.submit(
+                self._run_leg, r, query, {"callbacks": run_manager.get_child(tag=f"retriever_{i + 1}")}, ctx
+            )
+            for i, r in enumerate(self.retrievers)
+        ]
+        result_lists = [f.result() for f in futures]
+        with maybe_span(self.metrics, "fusion", k=self.k, candidates=sum(len(r) for r in result_lists)):
+            return reciprocal_rank_fusion(result_lists, self.weights, k=self.k, c=self.c)
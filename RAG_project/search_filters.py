@@ -0,0 +1,108 @@
+"""
+检索过滤条件。chat() / get_retriever() / retrieve() 接受的 filters 字典:
+
+    {
+        "sources": [...],            # 只检索这些文件 (source 路径)
+        "file_types": ["pdf", ...],  # 按扩展名，大小写不敏感，可带或不带 "."
+        "pages": [min, max],         # chunk metadata 中的 page (PyPDFLoader 从 0 开始)，任一端可为 None
+        "ingested_after": ts,        # 入库时间 (unix 时间戳) 范围，闭区间
+        "ingested_before": ts,
+    }
+
+source / 文件类型 / 入库时间都是文件级属性，先对照 catalog 解析成一个 source 集合；
+page 是 chunk 级属性，保留为范围。解析结果 SearchFilter 同时提供:
+
+- where(): Chroma 风格的 where，向量库 (Chroma / NumpyVectorStore) 在打分前按它筛选
+- KeywordIndex.search_many 的 filter 参数: 在 SQLite 中先圈出候选 chunk，只对它们的倒排项打分
+
+两路都是前置过滤 (pre-filter): 返回的 k 个结果全部满足条件，不会因为先取 top-k 再过滤而变少。
+"""
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from vector_store import Where
+
+FILTER_KEYS = ("sources", "file_types", "pages", "ingested_after", "ingested_before")
+
+
+@dataclass(frozen=True)
+class SearchFilter:
+    # None 表示不限 source；空元组表示没有文件满足条件
+    sources: Optional[Tuple[str, ...]] = None
+    page_min: Optional[int] = None
+    page_max: Optional[int] = None
+
+    @property
+    def matches_nothing(self) -> bool:
+        return self.sources == ()
+
+    def where(self) -> Optional[Where]:
+        conditions: List[Where] = []
+        if self.sources is not None:
+            conditions.append({"source": {"$in": list(self.sources)}})
+        if self.page_min is not None:
+            conditions.append({"page": {"$gte": self.page_min}})
+        if self.page_max is not None:
+            conditions.append({"page": {"$lte": self.page_max}})
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def cache_key(self) -> Tuple:
+        # 答案缓存的 scope 中使用
+        return (self.sources, self.page_min, self.page_max)
+
+
+def file_type(source: str) -> str:
+    return os.path.splitext(source)[1].lstrip(".").lower()
+
+
+def resolve_filters(filters: Optional[Dict[str, Any]], entries: Iterable[Dict]) -> Optional[SearchFilter]:
+    """
+    按 catalog 条目把 filters 解析为 SearchFilter；filters 为空时返回 None (不过滤)。
+    未知的键或格式错误抛 ValueError
+    """
+    if not filters:
+        return None
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"unknown filter keys: {sorted(unknown)} (expected {FILTER_KEYS})")
+
+    sources = filters.get("sources")
+    file_types = filters.get("file_types")
+    after, before = filters.get("ingested_after"), filters.get("ingested_before")
+    entries = list(entries)
+    selected: Optional[Tuple[str, ...]] = None
+    if sources is not None or file_types is not None or after is not None or before is not None:
+        wanted_sources = set(sources) if sources is not None else None
+        wanted_types = {t.lstrip(".").lower() for t in file_types} if file_types is not None else None
+        matched = []
+        for entry in entries:
+            source = entry["source"]
+            if wanted_sources is not None and source not in wanted_sources:
+                continue
+            if wanted_types is not None and file_type(source) not in wanted_types:
+                continue
+            ingested_at = entry.get("ingested_at")
+            if (after is not None or before is not None) and ingested_at is None:
+                # 迁移得到的条目没有入库时间，按时间过滤时排除
+                continue
+            if after is not None and ingested_at < after:
+                continue
+            if before is not None and ingested_at > before:
+                continue
+            matched.append(source)
+        # 选中全部文件时等同于不过滤，省去过滤开销
+        selected = tuple(sorted(matched)) if len(matched) < len(entries) else None
+
+    page_min = page_max = None
+    pages = filters.get("pages")
+    if pages is not None:
+        if len(pages) != 2:
+            raise ValueError(f"pages must be [min, max], got {pages!r}")
+        page_min, page_max = (None if p is None else int(p) for p in pages)
+
+    if selected is None and page_min is None and page_max is None:
+        return None
+    return SearchFilter(sources=selected, page_min=page_min, page_max=page_max)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 项目模块是平铺的 (from utils import ...)，测试时把 RAG_project 加入 sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
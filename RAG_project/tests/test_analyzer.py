@@ -0,0 +1,30 @@
+import pytest
+
+from analyzer import CJKBigramAnalyzer, WhitespaceAnalyzer, get_analyzer
+from keyword_index import KeywordIndex
+
+
+def test_cjk_bigram_tokens():
+    tokens = CJKBigramAnalyzer().tokenize("知识库检索。The Index 的 BM25!")
+    assert tokens == ["知识", "识库", "库检", "检索", "index", "bm25"]
+
+
+def test_whitespace_keeps_sentence_as_one_token():
+    assert WhitespaceAnalyzer().tokenize("知识库检索。 hello") == ["知识库检索。", "hello"]
+
+
+def test_get_analyzer_unknown():
+    with pytest.raises(ValueError):
+        get_analyzer("nope")
+
+
+def test_chinese_recall_with_bigrams(tmp_path):
+    index = KeywordIndex(str(tmp_path), analyzer=CJKBigramAnalyzer())
+    index.add(
+        ["1", "2"],
+        ["员工每年享有十天带薪年假。", "报销需要在三十天内提交发票。"],
+        [{"source": "hr.txt"}, {"source": "finance.txt"}],
+    )
+    assert index.stored_analyzer() == "cjk_bigram"
+    assert index.search("年假有几天", k=1)[0][0] == "1"
+    assert index.search("发票报销", k=1)[0][0] == "2"
@@ -0,0 +1,45 @@
+import time
+
+from answer_cache import SemanticAnswerCache
+
+
+def test_hit_on_similar_question_within_scope():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.put("scope", [1.0, 0.0, 0.0], "答案", ["doc"], "rag", cost_seconds=2.0)
+
+    hit = cache.lookup("scope", [0.99, 0.05, 0.0])
+    assert hit["answer"] == "答案" and hit["source_documents"] == ["doc"]
+    assert hit["similarity"] > 0.95
+    # 不同 scope (如知识库版本变化) 不命中；不相似的问题不命中
+    assert cache.lookup("other", [1.0, 0.0, 0.0]) is None
+    assert cache.lookup("scope", [0.0, 1.0, 0.0]) is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+    assert stats["seconds_saved"] == 2.0
+
+
+def test_ttl_expiry():
+    cache = SemanticAnswerCache(ttl_seconds=0.05)
+    cache.put("s", [1.0, 0.0], "a", [], "rag", 1.0)
+    time.sleep(0.1)
+    assert cache.lookup("s", [1.0, 0.0]) is None
+    assert len(cache) == 0
+
+
+def test_lru_eviction_keeps_recently_used():
+    cache = SemanticAnswerCache(max_entries=2)
+    cache.put("s", [1.0, 0.0, 0.0], "a", [], "rag", 1.0)
+    cache.put("s", [0.0, 1.0, 0.0], "b", [], "rag", 1.0)
+    assert cache.lookup("s", [1.0, 0.0, 0.0])["answer"] == "a"
+    cache.put("s", [0.0, 0.0, 1.0], "c", [], "rag", 1.0)
+
+    assert len(cache) == 2
+    assert cache.lookup("s", [0.0, 1.0, 0.0]) is None
+    assert cache.lookup("s", [1.0, 0.0, 0.0])["answer"] == "a"
+
+
+def test_disabled_cache_never_stores():
+    cache = SemanticAnswerCache(max_entries=0)
+    cache.put("s", [1.0], "a", [], "rag", 1.0)
+    assert cache.lookup("s", [1.0]) is None and len(cache) == 0
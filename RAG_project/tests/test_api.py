@@ -0,0 +1,129 @@
+import json
+import threading
+
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+
+from api import create_app
+from metrics import MetricsRegistry
+
+
+class FakeRAG:
+    def __init__(self):
+        self.metrics = MetricsRegistry()
+        self.release = threading.Event()
+        self.release.set()
+        self.in_flight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        self.release.wait(5)
+        with self._lock:
+            self.in_flight -= 1
+
+    def retrieve(self, query, search_type="Vector", k=3, fetch_k=None, weights=(0.5, 0.5), filters=None):
+        self._enter()
+        self.filters = filters
+        return [Document(page_content=f"{query}-{i}", metadata={"source": "a.txt"}) for i in range(k)]
+
+    def chat(self, query, **kwargs):
+        self._enter()
+        if not kwargs["api_key"]:
+            return {"error": "missing api key"}
+        docs = self.retrieve(query, k=kwargs["k"], filters=kwargs.get("filters"))
+        return {"answer": "ok", "source_documents": docs, "mode": "rag", "timings": {"llm_seconds": 0.0}}
+
+    def chat_stream(self, query, **kwargs):
+        yield {"type": "sources", "source_documents": [Document(page_content="c", metadata={})], "mode": "rag"}
+        for token in ["你", "好"]:
+            yield {"type": "token", "content": token}
+        yield {"type": "done", "answer": "你好", "mode": "rag", "timings": {}}
+
+    def chat_batch(self, queries, **kwargs):
+        results = [self.chat(q, **{k: v for k, v in kwargs.items() if k != "max_concurrency"}) for q in queries]
+        return {"results": results, "stats": {"queries": len(queries)}}
+
+    def get_all_documents_metadata(self):
+        return [{"source": "a.txt", "chunks": 2}]
+
+    def delete_document(self, source):
+        self.deleted = source
+
+
+def test_retrieve_and_chat_serialize_documents():
+    with TestClient(create_app(FakeRAG())) as client:
+        response = client.post("/retrieve", json={"query": "q", "k": 2})
+        assert response.status_code == 200
+        assert [d["content"] for d in response.json()["documents"]] == ["q-0", "q-1"]
+
+        response = client.post("/chat", json={"query": "q", "api_key": "x", "k": 1})
+        body = response.json()
+        assert body["answer"] == "ok" and body["source_documents"][0]["metadata"] == {"source": "a.txt"}
+
+        assert client.post("/chat", json={"query": "q"}).status_code == 400
+
+        response = client.post("/chat/batch", json={"queries": ["a", "b"], "api_key": "x", "k": 1})
+        results = response.json()["results"]
+        assert [r["source_documents"][0]["content"] for r in results] == ["a-0", "b-0"]
+        assert client.post("/retrieve", json={"query": "q", "search_type": "Nope"}).status_code == 422
+
+
+def test_chat_stream_emits_sse_events():
+    with TestClient(create_app(FakeRAG())) as client:
+        with client.stream("POST", "/chat", json={"query": "q", "api_key": "x", "stream": True}) as response:
+            assert response.headers["content-type"].startswith("text/event-stream")
+            text = "".join(response.iter_text())
+    events = [block.split("\n") for block in text.strip().split("\n\n")]
+    assert [e[0] for e in events] == ["event: sources", "event: token", "event: token", "event: done"]
+    assert json.loads(events[-1][1][len("data: "):])["answer"] == "你好"
+
+
+def test_concurrency_limit_queues_then_rejects():
+    rag = FakeRAG()
+    rag.release.clear()
+    app = create_app(rag, max_concurrency=2, queue_timeout=0.2)
+    with TestClient(app) as client:
+        results = []
+
+        def call():
+            results.append(client.post("/retrieve", json={"query": "q"}).status_code)
+
+        threads = [threading.Thread(target=call) for _ in range(4)]
+        for t in threads:
+            t.start()
+        threading.Event().wait(0.5)
+        rag.release.set()
+        for t in threads:
+            t.join()
+
+    assert rag.peak == 2
+    assert sorted(results) == [200, 200, 503, 503]
+
+
+def test_documents_and_ingest_validation():
+    rag = FakeRAG()
+    with TestClient(create_app(rag)) as client:
+        assert client.get("/documents").json() == [{"source": "a.txt", "chunks": 2}]
+        assert client.delete("/documents", params={"source": "a.txt"}).status_code == 200
+        assert rag.deleted == "a.txt"
+        assert client.post("/ingest", json={"paths": ["/no/such/file.txt"]}).status_code == 400
+        assert client.get("/jobs/job-404").status_code == 404
+
+
+def test_filters_are_validated_and_forwarded():
+    rag = FakeRAG()
+    with TestClient(create_app(rag)) as client:
+        body = {"query": "q", "filters": {"sources": ["a.txt"], "pages": [0, None]}}
+        assert client.post("/retrieve", json=body).status_code == 200
+        assert rag.filters == {"sources": ["a.txt"], "pages": (0, None)}
+        assert client.post("/retrieve", json={"query": "q", "filters": {}}).status_code == 200
+        assert rag.filters is None
+
+        body = {"query": "q", "api_key": "x", "filters": {"file_types": ["pdf"]}}
+        assert client.post("/chat", json=body).status_code == 200
+        assert rag.filters == {"file_types": ["pdf"]}
+        assert client.post("/retrieve", json={"query": "q", "filters": {"author": "x"}}).status_code == 422
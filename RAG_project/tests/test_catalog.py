@@ -0,0 +1,105 @@
+import json
+import os
+
+from catalog import DocumentCatalog, file_content_hash, make_chunk_id
+
+
+def test_record_and_totals(tmp_path):
+    catalog = DocumentCatalog(str(tmp_path))
+    assert catalog.needs_rebuild
+    catalog.record_ingest("a.txt", chunk_count=3, total_chars=30, content_hash="h1")
+    catalog.record_ingest("b.txt", chunk_count=2, total_chars=20, content_hash="h2")
+    # 重新入库覆盖该 source 的记录，而不是累加
+    catalog.record_ingest("a.txt", chunk_count=4, total_chars=35, content_hash="h3",
+                          split_params={"chunk_size": 100})
+
+    assert catalog.total_chunks == 6
+    entry = catalog.get("a.txt")
+    assert entry["count"] == 4
+    assert entry["total_chars"] == 35
+    assert entry["content_hash"] == "h3"
+    assert entry["split_params"] == {"chunk_size": 100}
+    assert entry["ingested_at"] is not None
+    assert not catalog.needs_rebuild
+
+    # 重新打开后内容一致
+    reopened = DocumentCatalog(str(tmp_path))
+    assert reopened.total_chunks == 6
+    assert sorted(e["source"] for e in reopened.list()) == ["a.txt", "b.txt"]
+
+
+def test_remove_and_clear(tmp_path):
+    catalog = DocumentCatalog(str(tmp_path))
+    catalog.record_ingest("a.txt", 3, 30)
+    catalog.record_ingest("b.txt", 2, 20)
+    catalog.remove("a.txt")
+    catalog.remove("missing.txt")
+    assert catalog.total_chunks == 2
+    assert catalog.get("a.txt") is None
+
+    catalog.clear()
+    assert catalog.is_empty()
+    assert catalog.list() == []
+    # clear 后文件仍在，不会被当作旧数据库触发迁移
+    assert catalog.exists
+    assert not catalog.needs_rebuild
+
+
+def test_rebuild_from_metadatas(tmp_path):
+    catalog = DocumentCatalog(str(tmp_path))
+    catalog.rebuild(
+        [{"source": "a.txt"}, {"source": "a.txt"}, None, {"source": "b.txt"}],
+        ["xx", "yyy", None, "z"],
+    )
+    assert catalog.total_chunks == 3
+    entry = catalog.get("a.txt")
+    assert entry["count"] == 2
+    assert entry["total_chars"] == 5
+    # 迁移得到的条目没有真实入库时间
+    assert entry["ingested_at"] is None
+    assert entry["content_hash"] is None
+
+
+def test_corrupt_file_requests_rebuild(tmp_path):
+    with open(os.path.join(str(tmp_path), DocumentCatalog.FILE_NAME), "w") as f:
+        f.write("{not json")
+    catalog = DocumentCatalog(str(tmp_path))
+    assert catalog.corrupted
+    assert catalog.needs_rebuild
+
+    catalog.rebuild([{"source": "a.txt"}])
+    assert not catalog.needs_rebuild
+    assert catalog.total_chunks == 1
+
+
+def test_entry_without_count_is_corrupt(tmp_path):
+    with open(os.path.join(str(tmp_path), DocumentCatalog.FILE_NAME), "w") as f:
+        json.dump({"a.txt": {"source": "a.txt"}}, f)
+    catalog = DocumentCatalog(str(tmp_path))
+    assert catalog.needs_rebuild
+    assert catalog.is_empty()
+
+
+def test_two_instances_do_not_overwrite_each_other(tmp_path):
+    a = DocumentCatalog(str(tmp_path))
+    b = DocumentCatalog(str(tmp_path))
+    a.record_ingest("x.txt", 2, 10)
+    b.record_ingest("y.txt", 3, 10)
+
+    assert sorted(e["source"] for e in DocumentCatalog(str(tmp_path)).list()) == ["x.txt", "y.txt"]
+    # a 读取时能看到 b 的写入
+    assert a.total_chunks == 5
+    a.remove("y.txt")
+    assert b.total_chunks == 2
+
+
+def test_file_content_hash(tmp_path):
+    p = tmp_path / "f.txt"
+    p.write_bytes(b"hello")
+    assert file_content_hash(str(p)) == file_content_hash(str(p), block_size=2)
+
+
+def test_make_chunk_id_is_deterministic():
+    assert make_chunk_id("a.txt", "hello") == make_chunk_id("a.txt", "hello")
+    assert make_chunk_id("a.txt", "hello") != make_chunk_id("b.txt", "hello")
+    assert make_chunk_id("a.txt", "hello") != make_chunk_id("a.txt", "hello!")
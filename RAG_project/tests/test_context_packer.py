@@ -0,0 +1,47 @@
+from langchain_core.documents import Document
+
+from context_packer import DOC_SEPARATOR, EMPTY_CONTEXT, ContextPacker
+from utils import estimate_tokens
+
+
+def _doc(text, **meta):
+    return Document(page_content=text, metadata={"source": "a.txt", **meta})
+
+
+def test_orders_by_fused_score_and_drops_near_duplicates():
+    docs = [
+        _doc("向量数据库支持近似最近邻检索。", rrf_score=0.01),
+        _doc("倒排索引用于关键字检索。", rrf_score=0.03),
+        _doc("倒排索引用于关键字检索。", rrf_score=0.02),
+    ]
+    packed = ContextPacker(max_tokens=500).pack("倒排索引", docs)
+    assert [d.page_content for d in packed["documents"]] == ["倒排索引用于关键字检索。", "向量数据库支持近似最近邻检索。"]
+    assert packed["report"]["duplicates"] == 1
+    assert packed["context"] == DOC_SEPARATOR.join(d.page_content for d in packed["documents"])
+
+
+def test_trims_long_chunks_to_sentences_around_query_terms():
+    filler = "".join(f"第{i}句讲的是无关的内容。" for i in range(40))
+    text = filler + "重排序模型可以提升召回质量。" + filler.replace("第", "后")
+    packed = ContextPacker(max_tokens=1000, sentence_window=1).pack("重排序", [_doc(text)])
+    context = packed["context"]
+    assert "重排序模型可以提升召回质量。" in context
+    assert context == "第39句讲的是无关的内容。重排序模型可以提升召回质量。后0句讲的是无关的内容。"
+    assert packed["report"]["trimmed"] == 1
+    assert packed["report"]["tokens_saved"] > 0
+
+
+def test_budget_bounds_context_regardless_of_k():
+    docs = [_doc(f"文档{i}：" + "检索增强生成的切分与召回。" * 20) for i in range(30)]
+    packer = ContextPacker(max_tokens=300, dedup_threshold=1.01)
+    packed = packer.pack("与查询无关", docs)
+    report = packed["report"]
+    assert estimate_tokens(packed["context"]) <= 300
+    assert report["context_tokens"] <= 300 < report["original_tokens"]
+    assert report["docs_out"] + report["dropped"] == 30
+    assert report["tokens_saved"] == report["original_tokens"] - report["context_tokens"]
+
+
+def test_empty_input():
+    packed = ContextPacker().pack("q", [])
+    assert packed["context"] == EMPTY_CONTEXT and packed["report"]["tokens_saved"] == 0
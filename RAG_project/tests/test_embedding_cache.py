@@ -0,0 +1,73 @@
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.calls: List[List[str]] = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0, 2.0] for t in texts]
+
+    def embed_query(self, text):
+        self.calls.append([text])
+        return [float(len(text)), 0.0, 0.0]
+
+
+def test_hits_and_misses(tmp_path):
+    underlying = CountingEmbeddings()
+    cached = CachedEmbeddings(underlying, EmbeddingCache(str(tmp_path), "m"))
+    assert cached.embed_documents(["a", "bb", "a"]) == [[1.0, 1.0, 2.0], [2.0, 1.0, 2.0], [1.0, 1.0, 2.0]]
+    # 重复文本在同一批内只计算一次
+    assert underlying.calls == [["a", "bb"]]
+
+    assert cached.embed_documents(["bb", "ccc"]) == [[2.0, 1.0, 2.0], [3.0, 1.0, 2.0]]
+    assert underlying.calls[-1] == ["ccc"]
+    stats = cached.cache.stats()
+    assert stats["hits"] == 1 and stats["entries"] == 3
+
+
+def test_query_cache_is_separate_and_persistent(tmp_path):
+    underlying = CountingEmbeddings()
+    cached = CachedEmbeddings(underlying, EmbeddingCache(str(tmp_path), "m"))
+    cached.embed_documents(["q"])
+    assert cached.embed_query("q") == [1.0, 0.0, 0.0]
+    cached.cache.close()
+
+    reopened = CachedEmbeddings(underlying, EmbeddingCache(str(tmp_path), "m"))
+    calls = len(underlying.calls)
+    assert reopened.embed_query("q") == [1.0, 0.0, 0.0]
+    assert reopened.embed_documents(["q"]) == [[1.0, 1.0, 2.0]]
+    assert len(underlying.calls) == calls
+
+
+def test_embed_queries_batches_misses_and_shares_query_cache(tmp_path):
+    underlying = CountingEmbeddings()
+    cached = CachedEmbeddings(underlying, EmbeddingCache(str(tmp_path), "m"))
+    cached.embed_query("q")
+    underlying.calls.clear()
+    vectors = cached.embed_queries(["q", "rr", "sss", "rr"])
+    assert vectors[0] == [1.0, 0.0, 0.0] and vectors[1] == vectors[3]
+    # 命中的查询不再计算，未命中的合并成一批
+    assert underlying.calls == [["rr", "sss"]]
+
+
+def test_model_name_isolates_entries(tmp_path):
+    underlying = CountingEmbeddings()
+    CachedEmbeddings(underlying, EmbeddingCache(str(tmp_path), "m1")).embed_documents(["x"])
+    CachedEmbeddings(underlying, EmbeddingCache(str(tmp_path), "m2")).embed_documents(["x"])
+    assert len(underlying.calls) == 2
+
+
+def test_lru_eviction_bounds_size(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "m", max_entries=2)
+    cache.put_many({"a": [1.0, 1.0], "b": [2.0, 2.0]})
+    cache.get_many(["a"])  # a 变为最近使用
+    cache.put_many({"c": [3.0, 3.0]})
+    assert len(cache) == 2
+    assert cache.get_many(["a", "b", "c"]) == {"a": [1.0, 1.0], "c": [3.0, 3.0]}
+    assert (tmp_path / "m" / "vectors.f32").stat().st_size == 2 * 2 * 4
@@ -0,0 +1,103 @@
+import functools
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from tokenizers import Tokenizer, models, pre_tokenizers
+
+from embedding_models import (
+    OnnxEmbeddings, ProcessPoolEmbeddings, embedding_factory, length_buckets, mean_pool, padding_overhead
+)
+from rag_engine import RAGManager
+
+WORDS = ["[PAD]", "[UNK]", "苹果", "香蕉", "是", "一种", "水果", "汽车", "需要", "保养"]
+
+
+class FakeInput:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeSession:
+    """
+    每个 token 的隐向量只取决于 token id，与 padding 长度无关 (与真实模型的 attention mask 效果一致)
+    """
+
+    def __init__(self, dim=8):
+        self.table = np.random.default_rng(0).normal(size=(len(WORDS), dim)).astype(np.float32)
+        self.batch_shapes = []
+
+    def get_inputs(self):
+        return [FakeInput("input_ids"), FakeInput("attention_mask")]
+
+    def run(self, outputs, feed):
+        assert set(feed) == {"input_ids", "attention_mask"}
+        self.batch_shapes.append(feed["input_ids"].shape)
+        return [self.table[feed["input_ids"]]]
+
+
+class FakeOnnxEmbeddings(OnnxEmbeddings):
+    def _load(self):
+        tokenizer = Tokenizer(models.WordLevel({w: i for i, w in enumerate(WORDS)}, unk_token="[UNK]"))
+        tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+        tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+        self.session = FakeSession()
+        return tokenizer, self.session
+
+
+TEXTS = ["苹果 是 一种 水果", "汽车", "香蕉 是 水果", "汽车 需要 保养 汽车 需要 保养", "苹果"]
+
+
+def test_length_buckets_group_similar_lengths():
+    lengths = [5, 1, 3, 6, 1]
+    batches = length_buckets(lengths, 2)
+    assert batches == [[3, 0], [2, 1], [4]]
+    assert sorted(i for batch in batches for i in batch) == list(range(5))
+    sequential = [[0, 1], [2, 3], [4]]
+    assert padding_overhead(lengths, batches) < padding_overhead(lengths, sequential)
+
+
+def test_onnx_embeddings_bucketing_keeps_order_and_values():
+    bucketed = FakeOnnxEmbeddings("fake", batch_size=2)
+    plain = FakeOnnxEmbeddings("fake", batch_size=2, bucket_by_length=False)
+    a, b = np.array(bucketed.embed_documents(TEXTS)), np.array(plain.embed_documents(TEXTS))
+    np.testing.assert_allclose(a, b, atol=1e-6)
+    np.testing.assert_allclose(np.linalg.norm(a, axis=1), 1.0, atol=1e-6)
+    np.testing.assert_allclose(bucketed.embed_query(TEXTS[2]), a[2], atol=1e-6)
+    # 分桶后每批 padding 到的长度不超过顺序组批
+    assert sum(s[0] * s[1] for s in bucketed.session.batch_shapes[:3]) < sum(
+        s[0] * s[1] for s in plain.session.batch_shapes
+    )
+    assert bucketed.embed_documents([]) == []
+
+
+def test_mean_pool_ignores_padding():
+    hidden = np.array([[[1.0, 0.0], [3.0, 0.0], [100.0, 100.0]]], dtype=np.float32)
+    mask = np.array([[1, 1, 0]])
+    np.testing.assert_allclose(mean_pool(hidden, mask, normalize=False), [[2.0, 0.0]])
+    np.testing.assert_allclose(mean_pool(hidden, mask), [[1.0, 0.0]])
+
+
+def test_process_pool_matches_single_process():
+    factory = functools.partial(DeterministicFakeEmbedding, size=8)
+    pool = ProcessPoolEmbeddings(factory, processes=2, chunk_size=2)
+    try:
+        assert pool.embed_documents(TEXTS) == factory().embed_documents(TEXTS)
+        assert pool.embed_query("苹果") == factory().embed_query("苹果")
+    finally:
+        pool.close()
+
+
+def test_embedding_options_are_validated_and_int8_uses_its_own_cache(tmp_path):
+    with pytest.raises(ValueError):
+        embedding_factory(backend="tensorrt")
+    with pytest.raises(ValueError):
+        embedding_factory(batch_size=0)
+
+    # 构造时不加载模型
+    rag = RAGManager(str(tmp_path / "db"), embedding_cache_dir=str(tmp_path / "cache"),
+                     embedding_options={"backend": "onnx-int8", "threads": 2})
+    assert rag.embedding_model_name.endswith("@onnx-int8")
+    assert not rag._embedding_model.loaded
+    rag = RAGManager(str(tmp_path / "db"), embedding_cache_dir=None, embedding_options={"backend": "onnx"})
+    assert rag.embedding_model_name == "sentence-transformers/all-MiniLM-L6-v2"
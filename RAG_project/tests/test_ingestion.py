@@ -0,0 +1,158 @@
+import threading
+
+import pytest
+
+from catalog import DocumentCatalog
+from ingestion import BulkIngestionPipeline, collect_paths, parse_file
+from utils import ReadWriteLock
+
+
+class FakeManager:
+    """
+    只实现流水线用到的 RAGManager 接口，向量和 chunk 存在内存里
+    """
+
+    def __init__(self, directory):
+        self.catalog = DocumentCatalog(str(directory))
+        self._lock = ReadWriteLock()
+        self._embed_seconds_per_chunk = 0.0
+        self.store = {}
+        self.embed_batches = []
+        self.writer_threads = set()
+
+    def _existing_ids(self, source):
+        return {cid for cid, (meta, _) in self.store.items() if meta.get("source") == source}
+
+    def _check_near_duplicate(self, source, chunk):
+        return chunk, None
+
+    def _embed_texts(self, texts):
+        self.embed_batches.append(len(texts))
+        return [[float(len(t))] for t in texts], 0.0
+
+    def _write_chunks(self, ids, texts, metadatas, embeddings):
+        self.writer_threads.add(threading.get_ident())
+        for cid, meta, vec in zip(ids, metadatas, embeddings):
+            self.store[cid] = (meta, vec)
+
+    def _delete_chunks(self, ids):
+        for cid in ids:
+            self.store.pop(cid, None)
+
+    def _finalize_source(self, source, keep_ids, total_chars, content_hash, split_params, skipped_ids=frozenset()):
+        stale = self._existing_ids(source) - keep_ids
+        for cid in stale:
+            del self.store[cid]
+        self.catalog.record_ingest(source, len(keep_ids), total_chars, content_hash, split_params)
+        return len(stale)
+
+
+def write_files(directory, n, lines=30):
+    paths = []
+    for i in range(n):
+        path = directory / f"doc{i}.txt"
+        path.write_text("".join(f"文档{i} 第{j}段 内容。\n" for j in range(lines)), encoding="utf-8")
+        paths.append(str(path))
+    return paths
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_pipeline_ingests_all_files_in_batches(tmp_path, workers):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    write_files(docs, 5)
+    manager = FakeManager(tmp_path / "db")
+    progress = []
+    stats = BulkIngestionPipeline(
+        manager, 80, 0, workers=workers, embed_batch_size=16, progress_callback=progress.append
+    ).run([str(docs)])
+
+    assert stats["files_done"] == 5 and not stats["errors"]
+    assert stats["new"] == stats["chunks_written"] == len(manager.store) == manager.catalog.total_chunks
+    # 跨文件拼批: 除最后一批外每批都是满的
+    assert all(size == 16 for size in manager.embed_batches[:-1])
+    # 写入和进度回调都在调用方线程
+    assert manager.writer_threads == {threading.get_ident()}
+    assert progress[-1]["stage"] == "done"
+
+
+def test_pipeline_skips_unchanged_and_replaces_modified(tmp_path):
+    paths = write_files(tmp_path, 3)
+    manager = FakeManager(tmp_path / "db")
+    first = BulkIngestionPipeline(manager, 80, 0, workers=0).run(paths)
+
+    with open(paths[0], "a", encoding="utf-8") as f:
+        f.write("新增的一段内容。\n")
+    second = BulkIngestionPipeline(manager, 80, 0, workers=0).run(paths)
+
+    assert second["skipped_files"] == 2
+    assert 0 < second["new"] < first["new"]
+    assert len(manager.store) == manager.catalog.total_chunks
+
+
+def test_pipeline_reports_unreadable_file(tmp_path):
+    paths = write_files(tmp_path, 1) + [str(tmp_path / "missing.txt")]
+    manager = FakeManager(tmp_path / "db")
+    stats = BulkIngestionPipeline(manager, 80, 0, workers=0).run(paths)
+    assert stats["files_done"] == 2
+    assert len(stats["errors"]) == 1 and "missing.txt" in stats["errors"][0]
+
+
+def test_collect_paths_filters_extensions(tmp_path):
+    (tmp_path / "a.txt").write_text("a")
+    (tmp_path / "b.png").write_bytes(b"")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "c.md").write_text("c")
+    assert sorted(map(str, collect_paths(str(tmp_path)))) == sorted([
+        str(tmp_path / "a.txt"), str(tmp_path / "sub" / "c.md")
+    ])
+
+
+def test_streaming_windows_match_whole_file_parse(tmp_path):
+    (path,) = write_files(tmp_path, 1, lines=400)
+    manager = FakeManager(tmp_path / "db")
+    embedded = []
+    manager._embed_texts = lambda texts: (embedded.append(len(texts)) or [[0.0]] * len(texts), 0.0)
+    # 小窗口 + workers=0: 文件被拆成多个窗口流式处理
+    stats = BulkIngestionPipeline(manager, 80, 0, workers=0, embed_batch_size=8, window_chars=2000).run([path])
+
+    whole = parse_file(path, 80, 0, "recursive", window_chars=2000)
+    assert stats["new"] == len(manager.store) == len({c[0] for c in whole["chunks"]})
+    assert max(embedded) <= 8
+
+
+def test_failed_finalize_rolls_back_written_chunks(tmp_path):
+    paths = write_files(tmp_path, 2)
+    manager = FakeManager(tmp_path / "db")
+    finalize = manager._finalize_source
+
+    def failing_finalize(source, *args):
+        if source == paths[0]:
+            raise RuntimeError("catalog write failed")
+        return finalize(source, *args)
+
+    manager._finalize_source = failing_finalize
+    pipeline = BulkIngestionPipeline(manager, 80, 0, workers=0)
+    stats = pipeline.run(paths)
+
+    assert len(stats["errors"]) == 1 and isinstance(pipeline.exceptions[0], RuntimeError)
+    assert {meta["source"] for meta, _ in manager.store.values()} == {paths[1]}
+    assert manager.catalog.get(paths[0]) is None
+
+
+def test_atomic_mode_commits_everything_at_once(tmp_path):
+    paths = write_files(tmp_path, 3)
+    manager = FakeManager(tmp_path / "db")
+    seen_during_staging = []
+
+    def on_progress(stats):
+        if stats["stage"] == "running":
+            seen_during_staging.append(len(manager.store))
+
+    stats = BulkIngestionPipeline(
+        manager, 80, 0, workers=0, embed_batch_size=4, atomic=True, progress_callback=on_progress
+    ).run(paths)
+
+    # 暂存期间检索方看不到任何新 chunk，提交后全部可见
+    assert seen_during_staging and set(seen_during_staging) == {0}
+    assert stats["chunks_staged"] == stats["chunks_written"] == len(manager.store) == manager.catalog.total_chunks
@@ -0,0 +1,61 @@
+import threading
+
+from jobs import DONE, FAILED, RUNNING, IngestionJobManager
+
+
+class FakeRAG:
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = []
+
+    def ingest_paths(self, paths, progress_callback=None, **params):
+        self.calls.append((paths, params))
+        stats = {"files_total": len(paths), "files_done": 0, "errors": []}
+        progress_callback(dict(stats))
+        self.release.wait(5)
+        if paths == ["boom"]:
+            raise RuntimeError("boom")
+        stats["files_done"] = len(paths)
+        return stats
+
+
+def test_job_runs_in_background_and_reports_progress():
+    rag = FakeRAG()
+    manager = IngestionJobManager(rag)
+    job_id = manager.submit(["a.txt", "b.txt"], 500, 50)
+
+    # submit 立即返回，任务在后台线程执行
+    for _ in range(100):
+        if manager.get(job_id)["state"] == RUNNING:
+            break
+        threading.Event().wait(0.01)
+    assert manager.get(job_id)["state"] == RUNNING
+    assert manager.active()
+
+    rag.release.set()
+    job = manager.wait(job_id, timeout=5)
+    assert job["state"] == DONE and job["progress"] == 1.0
+    assert rag.calls[0][1]["atomic"] is True and rag.calls[0][1]["chunk_size"] == 500
+    manager.shutdown()
+
+
+def test_failed_job_records_error():
+    rag = FakeRAG()
+    rag.release.set()
+    manager = IngestionJobManager(rag)
+    job = manager.wait(manager.submit(["boom"], 500, 50), timeout=5)
+    assert job["state"] == FAILED and "boom" in job["error"]
+    assert not manager.active()
+    manager.shutdown()
+
+
+def test_finished_jobs_are_pruned():
+    rag = FakeRAG()
+    rag.release.set()
+    manager = IngestionJobManager(rag, keep_finished=2)
+    ids = [manager.submit([f"{i}.txt"], 500, 50) for i in range(4)]
+    manager.wait(ids[-1], timeout=5)
+    manager.submit(["last.txt"], 500, 50)
+    assert manager.get(ids[0]) is None
+    assert len(manager.list()) <= 3
+    manager.shutdown()
@@ -0,0 +1,78 @@
+from keyword_index import KeywordIndex
+
+
+def _build(tmp_path):
+    index = KeywordIndex(str(tmp_path))
+    index.add(
+        ["1", "2", "3"],
+        ["apple banana", "banana cherry cherry", "durian"],
+        [{"source": "a.txt"}, {"source": "a.txt"}, {"source": "b.txt"}],
+    )
+    return index
+
+
+def test_search_ranks_by_bm25(tmp_path):
+    index = _build(tmp_path)
+    hits = index.search("cherry", k=3)
+    assert [h[0] for h in hits] == ["2"]
+    assert hits[0][2] == "banana cherry cherry"
+    assert hits[0][3] == {"source": "a.txt"}
+
+    hits = index.search("banana apple", k=3)
+    assert [h[0] for h in hits] == ["1", "2"]
+    assert index.search("unknown", k=3) == []
+
+
+def test_search_many_matches_search(tmp_path):
+    index = _build(tmp_path)
+    queries = ["cherry", "banana apple", "unknown", "", "durian banana"]
+    assert index.search_many(queries, k=2) == [index.search(q, k=2) for q in queries]
+    assert index.search_many([], k=2) == []
+
+
+def test_persistent_and_incremental(tmp_path):
+    index = _build(tmp_path)
+    index.close()
+
+    reopened = KeywordIndex(str(tmp_path))
+    assert reopened.count() == 3
+    reopened.add(["4"], ["cherry pie"], [{"source": "c.txt"}])
+    assert reopened.count() == 4
+    assert {h[0] for h in reopened.search("cherry", k=5)} == {"2", "4"}
+
+
+def test_delete_source_and_ids(tmp_path):
+    index = _build(tmp_path)
+    assert index.delete_source("a.txt") == 2
+    assert index.count() == 1
+    assert index.search("banana", k=3) == []
+    assert index.delete_ids(["3", "missing"]) == 1
+    assert index.count() == 0
+
+
+def test_readd_same_id_replaces(tmp_path):
+    index = _build(tmp_path)
+    index.add(["1"], ["fig"], [{"source": "a.txt"}])
+    assert index.count() == 3
+    assert index.search("apple", k=3) == []
+    assert index.search("fig", k=3)[0][0] == "1"
+
+
+def test_clear(tmp_path):
+    index = _build(tmp_path)
+    index.clear()
+    assert index.count() == 0
+    assert index.search("banana", k=3) == []
+
+
+def test_paged_preview_by_sources(tmp_path):
+    index = _build(tmp_path)
+    sources = ["b.txt", "a.txt", "missing.txt"]
+    assert index.count_by_sources(sources) == 3
+    # 按 sources 的顺序，同一 source 内按写入顺序
+    assert index.page_by_sources(sources, 0, 2, preview_chars=6) == [("3", "b.txt", 6, "durian"), ("1", "a.txt", 12, "apple ")]
+    assert [r[0] for r in index.page_by_sources(sources, 2, 2)] == ["2"]
+    assert index.count_by_sources([]) == 0 and index.page_by_sources([], 0, 10) == []
+
+    assert [r[0] for r in index.get_many(["2", "nope", "1"])] == ["2", "1"]
+    assert index.get_many(["3"])[0][2] == {"source": "b.txt"}
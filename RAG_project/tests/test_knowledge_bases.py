@@ -0,0 +1,127 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from api import create_app
+from embedding_models import LazyEmbeddings
+from knowledge_bases import KnowledgeBaseManager
+from rag_engine import RAGManager
+
+
+def write(directory, name, text):
+    path = directory / name
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def make_kbs(tmp_path, **kwargs):
+    loads = []
+
+    def factory():
+        loads.append(1)
+        return DeterministicFakeEmbedding(size=16)
+
+    kbs = KnowledgeBaseManager(
+        str(tmp_path / "kbs"), embeddings=LazyEmbeddings(factory, "fake"),
+        embedding_cache_dir=str(tmp_path / "cache"), vector_backend="numpy", **kwargs
+    )
+    return kbs, loads
+
+
+def test_knowledge_bases_are_isolated_and_share_one_model(tmp_path):
+    kbs, loads = make_kbs(tmp_path)
+    apple = write(tmp_path, "apple.txt", "苹果是一种水果。")
+    car = write(tmp_path, "car.txt", "汽车需要定期保养。")
+    kbs.create("fruit").ingest_paths([apple], 100, 0, workers=0)
+    kbs.create("cars").ingest_paths([car], 100, 0, workers=0)
+
+    for search_type in ("Vector", "BM25"):
+        assert [d.metadata["source"] for d in kbs.get("fruit").retrieve("苹果", search_type=search_type)] == [apple]
+        assert [d.metadata["source"] for d in kbs.get("cars").retrieve("苹果", search_type=search_type)] in ([car], [])
+    assert kbs.get("fruit").embeddings is kbs.get("cars").embeddings
+    assert loads == [1]
+    assert [(kb["name"], kb["documents"]) for kb in kbs.list()] == [("cars", 1), ("fruit", 1)]
+
+    with pytest.raises(KeyError):
+        kbs.get("missing")
+    with pytest.raises(ValueError):
+        kbs.create("../escape")
+
+
+def test_least_recently_used_knowledge_base_is_closed(tmp_path):
+    kbs, _ = make_kbs(tmp_path, max_open=2)
+    docs = {name: write(tmp_path, f"{name}.txt", f"{name} 的资料。") for name in ("a", "b", "c")}
+    for name, path in docs.items():
+        kbs.create(name).ingest_paths([path], 100, 0, workers=0)
+    assert kbs.open_count() == 2
+    assert open_names(kbs) == ["b", "c"]
+
+    first = kbs.get("a")
+    assert not first.is_open and open_names(kbs) == ["c"]
+    assert [d.metadata["source"] for d in first.retrieve("a 的资料")] == [docs["a"]]
+    assert open_names(kbs) == ["a", "c"]
+    kbs.get("b").retrieve("b")
+    assert open_names(kbs) == ["a", "b"]
+
+    # 被关闭的知识库仍是同一个对象，再次使用时重新打开
+    assert kbs.get("a") is first and first.is_open
+
+
+def open_names(kbs):
+    return [kb["name"] for kb in kbs.list() if kb["open"]]
+
+
+@pytest.mark.parametrize("backend", ["numpy", "chroma"])
+def test_clear_database_empties_in_place(tmp_path, backend):
+    path = write(tmp_path, "a.txt", "苹果是一种水果。")
+    db = tmp_path / "db"
+    rag = RAGManager(
+        str(db), embedding_cache_dir=None, embeddings=DeterministicFakeEmbedding(size=16), vector_backend=backend
+    )
+    rag.ingest_paths([path], 100, 0, workers=0)
+    rag.clear_database()
+    assert os.path.isdir(db)
+    assert rag.vectorstore.count() == 0 and rag.catalog.total_chunks == 0
+    assert rag.retrieve("苹果", search_type="Hybrid") == []
+
+    rag.ingest_paths([path], 100, 0, workers=0)
+    assert rag.vectorstore.count() == 1
+    assert [d.page_content for d in rag.retrieve("苹果", search_type="BM25")] == ["苹果是一种水果。"]
+
+
+def test_delete_removes_directory(tmp_path):
+    kbs, _ = make_kbs(tmp_path)
+    path = write(tmp_path, "a.txt", "苹果是一种水果。")
+    kbs.create("tmp").ingest_paths([path], 100, 0, workers=0)
+    kbs.delete("tmp")
+    assert not kbs.exists("tmp") and kbs.names() == []
+    with pytest.raises(KeyError):
+        kbs.delete("tmp")
+
+
+def test_api_routes_requests_by_knowledge_base(tmp_path):
+    kbs, _ = make_kbs(tmp_path)
+    path = write(tmp_path, "a.txt", "苹果是一种水果。")
+    with TestClient(create_app(knowledge_bases=kbs)) as client:
+        assert client.post("/kbs", json={"name": "fruit"}).status_code == 201
+        assert client.post("/kbs", json={"name": "../x"}).status_code == 400
+        job = client.post("/ingest", json={"paths": [path], "kb": "fruit", "chunk_size": 100}).json()
+        assert app_jobs(client).wait(job["id"], timeout=30)["state"] == "done"
+
+        body = {"query": "苹果", "search_type": "BM25"}
+        assert len(client.post("/retrieve", json={**body, "kb": "fruit"}).json()["documents"]) == 1
+        assert client.post("/retrieve", json=body).json()["documents"] == []
+        assert client.post("/retrieve", json={**body, "kb": "nope"}).status_code == 404
+        assert [kb["name"] for kb in client.get("/kbs").json()] == ["default", "fruit"]
+        assert client.get("/documents", params={"kb": "fruit"}).json()[0]["source"] == path
+
+        assert client.post("/kbs/fruit/clear").status_code == 200
+        assert client.get("/documents", params={"kb": "fruit"}).json() == []
+        assert client.delete("/kbs/fruit").status_code == 200
+        assert client.get("/documents", params={"kb": "fruit"}).status_code == 404
+
+
+def app_jobs(client):
+    return client.app.state.jobs
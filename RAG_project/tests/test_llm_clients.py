@@ -0,0 +1,32 @@
+from benchmarks.stub_llm_server import StubLLMServer
+from llm_clients import LLMClientPool
+
+
+def test_clients_are_cached_per_key():
+    pool = LLMClientPool()
+    a = pool.get("key", "http://127.0.0.1:1/v1", "m")
+    assert pool.get("key", "http://127.0.0.1:1/v1", "m") is a
+    assert pool.get("other", "http://127.0.0.1:1/v1", "m") is not a
+    assert pool.get("key", "http://127.0.0.1:1/v1", "m2") is not a
+    pool.close()
+
+
+def test_connections_are_reused():
+    pool = LLMClientPool()
+    with StubLLMServer() as server:
+        llm = pool.get("key", server.base_url, "stub")
+        for _ in range(3):
+            assert llm.invoke("hi").content == server.answer
+        assert server.requests == 3
+        # keep-alive: 三次请求走同一个 TCP 连接
+        assert len(server.connections) == 1
+    pool.close()
+
+
+def test_retries_on_429():
+    pool = LLMClientPool(max_retries=2)
+    with StubLLMServer(fail_first=1) as server:
+        llm = pool.get("key", server.base_url, "stub")
+        assert llm.invoke("hi").content == server.answer
+        assert server.requests == 2
+    pool.close()
@@ -0,0 +1,84 @@
+import threading
+import urllib.request
+
+import pytest
+
+from metrics import MetricsRegistry, maybe_span, serve_metrics
+
+
+def test_nested_spans_form_one_trace():
+    metrics = MetricsRegistry()
+    with metrics.span("chat", k=3) as root:
+        with metrics.span("retrieval") as span:
+            span.set(docs=2)
+        with metrics.span("llm"):
+            pass
+        root.set(mode="rag")
+
+    (trace,) = metrics.recent_traces
+    assert [s["name"] for s in trace] == ["chat", "retrieval", "llm"]
+    assert [s["depth"] for s in trace] == [0, 1, 1]
+    assert trace[0]["mode"] == "rag" and trace[1]["docs"] == 2
+    stages = {row["stage"] for row in metrics.summary()}
+    assert stages == {"chat", "retrieval", "llm"}
+
+
+def test_span_records_errors_and_reraises():
+    metrics = MetricsRegistry()
+    with pytest.raises(ValueError):
+        with metrics.span("llm"):
+            raise ValueError("boom")
+    assert metrics.counters() == {'rag_stage_errors_total{stage="llm"}': 1.0}
+    assert metrics.recent_traces[0][0]["error"] == "ValueError"
+
+
+def test_attach_continues_trace_in_other_thread():
+    metrics = MetricsRegistry()
+    with metrics.span("retrieval"):
+        ctx = metrics.context()
+
+        def leg():
+            with metrics.attach(ctx):
+                with metrics.span("bm25_search"):
+                    pass
+
+        t = threading.Thread(target=leg)
+        t.start()
+        t.join()
+
+    (trace,) = metrics.recent_traces
+    assert [(s["name"], s["depth"]) for s in trace] == [("retrieval", 0), ("bm25_search", 1)]
+
+
+def test_quantiles_and_prometheus_text():
+    metrics = MetricsRegistry()
+    for i in range(1, 101):
+        metrics.observe("rag_stage_seconds", i / 100, stage="llm")
+    (row,) = metrics.summary()
+    assert row["count"] == 100
+    assert 0.49 <= row["p50"] <= 0.52 and 0.94 <= row["p95"] <= 0.97 and row["p99"] >= 0.98
+
+    text = metrics.prometheus_text()
+    assert "# TYPE rag_stage_seconds histogram" in text
+    assert 'rag_stage_seconds_bucket{stage="llm",le="0.5"} 50' in text
+    assert 'rag_stage_seconds_bucket{stage="llm",le="+Inf"} 100' in text
+    assert 'rag_stage_seconds_count{stage="llm"} 100' in text
+
+
+def test_maybe_span_without_registry():
+    with maybe_span(None, "noop", k=1) as span:
+        span.set(docs=0)
+    assert span.attrs == {"k": 1, "docs": 0}
+
+
+def test_metrics_endpoint():
+    metrics = MetricsRegistry()
+    metrics.inc("rag_answer_cache_hits_total")
+    server = serve_metrics(metrics, port=0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        body = urllib.request.urlopen(url, timeout=5).read().decode()
+        assert "rag_answer_cache_hits_total 1" in body
+    finally:
+        server.shutdown()
+        server.server_close()
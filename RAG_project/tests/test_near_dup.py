@@ -0,0 +1,94 @@
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from near_dup import GROUP_KEY, MinHasher, NearDuplicateIndex, collapse_near_duplicates, estimate_similarity
+from rag_engine import RAGManager
+
+POLICY = (
+    "第三条 员工每年享有带薪年假十五天，入职满一年后开始计算。年假须提前两周通过系统提交申请，"
+    "经部门负责人批准后方可休假，未休完的年假可顺延至次年第一季度，逾期作废。"
+    "因工作需要无法安排休假的，公司按日工资的百分之三百支付补偿。"
+)
+REVISED = POLICY.replace("逾期作废", "逾期自动作废")
+OTHER = "报销流程: 员工须在费用发生后三十日内提交发票原件和审批单，由财务部门审核后统一打款至工资卡。"
+
+
+def test_minhash_similarity_tracks_text_overlap():
+    hasher = MinHasher()
+    assert estimate_similarity(hasher.signature(POLICY), hasher.signature(POLICY.upper())) == 1.0
+    assert estimate_similarity(hasher.signature(POLICY), hasher.signature(REVISED)) > 0.85
+    assert estimate_similarity(hasher.signature(POLICY), hasher.signature(OTHER)) < 0.2
+    assert hasher.signature("  ") is None
+
+
+def test_index_links_across_sources_and_reports_orphans(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path), threshold=0.85)
+    assert index.add("a1", POLICY, "a.txt", store_duplicate=False) is None
+    # 同一 source 内不比较
+    assert index.add("a2", REVISED, "a.txt", store_duplicate=False) is None
+    assert index.add("b1", REVISED, "b.txt", store_duplicate=False)[0] in ("a1", "a2")
+    assert index.add("b2", OTHER, "b.txt", store_duplicate=False) is None
+    assert index.stats() == {"indexed": 4, "linked": 0, "skipped": 1, "skipped_chars": len(REVISED)}
+
+    # 删除规范 chunk 后，依赖它的 skip 别名一并删除，并报告其所在的 source
+    assert index.retain_source("a.txt", set()) == {"b.txt"}
+    assert index.stats()["indexed"] == 1
+
+
+def test_collapse_keeps_best_ranked_member_of_each_group():
+    docs = [
+        Document(id="1", page_content="x", metadata={GROUP_KEY: "g1"}),
+        Document(id="2", page_content="y", metadata={GROUP_KEY: "g1"}),
+        Document(id="3", page_content="z", metadata={}),
+        Document(id="4", page_content="w", metadata={GROUP_KEY: "g2"}),
+    ]
+    kept, collapsed = collapse_near_duplicates(docs, k=2)
+    assert [d.id for d in kept] == ["1", "3"] and collapsed == 1
+    assert kept[0].metadata["near_duplicates"] == 1
+    assert "near_duplicates" not in docs[0].metadata
+
+
+def make_manager(directory, action):
+    return RAGManager(
+        str(directory), embedding_cache_dir=None, embeddings=DeterministicFakeEmbedding(size=16),
+        vector_backend="numpy", near_dup_threshold=0.85, near_dup_action=action
+    )
+
+
+def write(directory, name, text):
+    path = directory / name
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_skip_mode_does_not_store_duplicates_and_restores_them_when_canonical_is_deleted(tmp_path):
+    v1 = write(tmp_path, "v1.txt", POLICY)
+    v3 = write(tmp_path, "v3.txt", REVISED)
+    rag = make_manager(tmp_path / "db", "skip")
+    rag.ingest_paths([v1], 400, 0, workers=0)
+    stats = rag.ingest_paths([v3], 400, 0, workers=0)
+    assert stats["near_duplicates_skipped"] == 1 and stats["new"] == 0
+    assert stats["near_duplicate_chars_saved"] == len(REVISED)
+    assert rag.vectorstore.count() == 1
+    assert rag.near_duplicate_stats()["skipped"] == 1
+
+    rag.delete_document(v1)
+    assert rag.catalog.get(v3) is None
+    stats = rag.ingest_paths([v3], 400, 0, workers=0)
+    assert stats["new"] == 1 and rag.vectorstore.count() == 1
+
+
+def test_link_mode_collapses_linked_chunks_at_retrieval(tmp_path):
+    v1 = write(tmp_path, "v1.txt", POLICY)
+    v2 = write(tmp_path, "v2.txt", REVISED)
+    v3 = write(tmp_path, "v3.txt", OTHER)
+    rag = make_manager(tmp_path / "db", "link")
+    stats = rag.ingest_paths([v1, v2, v3], 400, 0, workers=0)
+    assert stats["near_duplicates"] == 1 and rag.vectorstore.count() == 3
+    assert rag.near_duplicate_stats()["linked"] == 1
+
+    for search_type in ("Vector", "BM25", "Hybrid"):
+        docs = rag.retrieve("员工", search_type=search_type, k=3)
+        assert len(docs) == 2, search_type
+        assert len({d.metadata[GROUP_KEY] for d in docs}) == 2
+    assert [len(r) for r in rag.retrieve_batch(["员工", "员工报销"], search_type="Hybrid", k=3)] == [2, 2]
@@ -0,0 +1,49 @@
+import time
+from typing import List
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from keyword_index import KeywordIndex
+from retrievers import HybridRetriever, KeywordIndexRetriever, reciprocal_rank_fusion
+
+
+class SleepyRetriever(BaseRetriever):
+    docs: List[Document]
+    delay: float = 0.0
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        time.sleep(self.delay)
+        return list(self.docs)
+
+
+def _doc(text, source="a.txt"):
+    return Document(page_content=text, metadata={"source": source})
+
+
+def test_rrf_orders_by_weighted_reciprocal_rank():
+    a, b, c = _doc("a"), _doc("b"), _doc("c")
+    fused = reciprocal_rank_fusion([[a, b], [b, c]], weights=[0.5, 0.5], k=3, c=60)
+    assert [d.page_content for d in fused] == ["b", "a", "c"]
+    assert fused[0].metadata["rrf_score"] == 0.5 / 62 + 0.5 / 61
+
+    # 权重偏向第二路时 c 排在 a 前面
+    fused = reciprocal_rank_fusion([[a, b], [b, c]], weights=[0.1, 0.9], k=2, c=60)
+    assert [d.page_content for d in fused] == ["b", "c"]
+
+
+def test_hybrid_runs_legs_concurrently():
+    legs = [SleepyRetriever(docs=[_doc("x")], delay=0.2), SleepyRetriever(docs=[_doc("y")], delay=0.2)]
+    retriever = HybridRetriever(retrievers=legs, weights=[0.5, 0.5], k=2)
+    start = time.perf_counter()
+    docs = retriever.invoke("q")
+    elapsed = time.perf_counter() - start
+    assert {d.page_content for d in docs} == {"x", "y"}
+    assert elapsed < 0.35
+
+
+def test_keyword_index_retriever(tmp_path):
+    index = KeywordIndex(str(tmp_path))
+    index.add(["1", "2"], ["alpha beta", "gamma"], [{"source": "a.txt"}, {"source": "b.txt"}])
+    docs = KeywordIndexRetriever(index=index, k=2).invoke("gamma")
+    assert [(d.id, d.page_content, d.metadata["source"]) for d in docs] == [("2", "gamma", "b.txt")]
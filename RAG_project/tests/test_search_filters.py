@@ -0,0 +1,70 @@
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from keyword_index import KeywordIndex
+from rag_engine import RAGManager
+from search_filters import SearchFilter, resolve_filters
+
+ENTRIES = [
+    {"source": "/kb/a.txt", "ingested_at": 100.0},
+    {"source": "/kb/b.PDF", "ingested_at": 200.0},
+    {"source": "/kb/c.md", "ingested_at": None},
+]
+
+
+def test_resolve_filters_maps_file_level_conditions_to_sources():
+    assert resolve_filters(None, ENTRIES) is None
+    assert resolve_filters({"file_types": [".pdf", "md"]}, ENTRIES).sources == ("/kb/b.PDF", "/kb/c.md")
+    assert resolve_filters({"ingested_after": 150}, ENTRIES).sources == ("/kb/b.PDF",)
+    assert resolve_filters({"file_types": ["txt", "pdf", "md"]}, ENTRIES) is None
+    assert resolve_filters({"sources": ["/kb/a.txt"], "file_types": ["pdf"]}, ENTRIES).matches_nothing
+
+    search_filter = resolve_filters({"sources": ["/kb/a.txt"], "pages": [2, None]}, ENTRIES)
+    assert search_filter.where() == {"$and": [{"source": {"$in": ["/kb/a.txt"]}}, {"page": {"$gte": 2}}]}
+    assert resolve_filters({"pages": [None, 3]}, ENTRIES) == SearchFilter(page_max=3)
+    with pytest.raises(ValueError):
+        resolve_filters({"author": "x"}, ENTRIES)
+
+
+def test_keyword_filter_is_applied_before_top_k(tmp_path):
+    index = KeywordIndex(str(tmp_path))
+    ids = [f"c{i}" for i in range(40)]
+    # 前 30 个 chunk 的 "苹果" 出现次数更多，不过滤时占满 top-k
+    texts = ["苹果 苹果 苹果 水果" if i < 30 else "苹果 香蕉" for i in range(40)]
+    metadatas = [{"source": "hot.pdf" if i < 30 else "cold.pdf", "page": i % 5} for i in range(40)]
+    index.add(ids, texts, metadatas)
+
+    everything = index.search("苹果", k=40)
+    search_filter = SearchFilter(sources=("cold.pdf",), page_min=1, page_max=3)
+    expected = [h for h in everything if h[3]["source"] == "cold.pdf" and 1 <= h[3]["page"] <= 3][:4]
+    hits = index.search("苹果", k=4, filter=search_filter)
+    assert hits == expected and len(hits) == 4
+    assert index.search_many(["苹果", "香蕉"], k=4, filter=search_filter)[0] == hits
+    assert index.search("苹果", k=4, filter=SearchFilter(sources=())) == []
+    assert index.search("苹果", k=4, filter=SearchFilter(sources=("missing.pdf",))) == []
+
+
+def test_manager_filters_every_search_type(tmp_path):
+    paths = []
+    for name, text in (("a.txt", "苹果是一种水果。"), ("b.md", "苹果公司发布了新手机。"), ("c.txt", "香蕉和苹果都是水果。")):
+        path = tmp_path / name
+        path.write_text(text, encoding="utf-8")
+        paths.append(str(path))
+    rag = RAGManager(
+        str(tmp_path / "db"), embedding_cache_dir=None, embeddings=DeterministicFakeEmbedding(size=16),
+        vector_backend="numpy"
+    )
+    rag.ingest_paths(paths, 100, 0, workers=0)
+
+    for search_type in ("Vector", "BM25", "Hybrid"):
+        docs = rag.retrieve("苹果", search_type=search_type, k=3, filters={"file_types": ["md"]})
+        assert [d.metadata["source"] for d in docs] == [paths[1]], search_type
+        docs = rag.retrieve("苹果", search_type=search_type, k=3, filters={"sources": [paths[0], paths[2]]})
+        assert {d.metadata["source"] for d in docs} == {paths[0], paths[2]}, search_type
+        assert rag.retrieve("苹果", search_type=search_type, k=3, filters={"file_types": ["pdf"]}) == []
+
+    batch = rag.retrieve_batch(["苹果", "水果"], search_type="Hybrid", k=3, filters={"sources": [paths[2]]})
+    assert [[d.metadata["source"] for d in docs] for docs in batch] == [[paths[2]], [paths[2]]]
+    assert rag.get_retriever("Vector", k=3, filters={"sources": [paths[0]]}).invoke("苹果")[0].metadata == {
+        "source": paths[0]
+    }
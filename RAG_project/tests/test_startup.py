@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from embedding_models import LazyEmbeddings
+from rag_engine import RAGManager
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_does_not_load_heavy_dependencies():
+    code = (
+        "import sys; import rag_engine; "
+        "print(','.join(m for m in ('chromadb', 'langchain_openai', 'langchain_community', "
+        "'langchain_huggingface', 'sentence_transformers') if m in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=PROJECT_DIR, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
+
+
+def test_lazy_embeddings_load_once_on_first_use():
+    calls = []
+
+    def factory():
+        calls.append(1)
+        return DeterministicFakeEmbedding(size=8)
+
+    embeddings = LazyEmbeddings(factory, "fake")
+    assert not embeddings.loaded and calls == []
+    assert len(embeddings.embed_query("a")) == 8
+    embeddings.embed_documents(["a", "b"])
+    assert embeddings.loaded and calls == [1]
+
+
+def test_vectorstore_opens_on_first_use(tmp_path):
+    doc = tmp_path / "a.txt"
+    doc.write_text("苹果是一种水果。", encoding="utf-8")
+    kwargs = dict(embedding_cache_dir=None, embeddings=DeterministicFakeEmbedding(size=8), vector_backend="numpy")
+    rag = RAGManager(str(tmp_path / "db"), **kwargs)
+    assert rag._vectorstore is None
+    rag.ingest_paths([str(doc)], 100, 10)
+    rag.vectorstore.close()
+
+    rag = RAGManager(str(tmp_path / "db"), **kwargs)
+    assert [d["source"] for d in rag.get_all_documents_metadata()] == [str(doc)]
+    assert rag._vectorstore is None
+    rag.warm_up(background=False)
+    assert rag._vectorstore is not None
+    assert rag.retrieve("苹果", k=1)[0].page_content == "苹果是一种水果。"
@@ -0,0 +1,89 @@
+import io
+import threading
+import time
+
+from utils import ReadWriteLock, estimate_tokens, iter_doc, iter_split_windows, save_uploaded_file
+
+
+def test_readers_run_concurrently():
+    lock = ReadWriteLock()
+    inside = []
+    barrier = threading.Barrier(3, timeout=2)
+
+    def reader():
+        with lock.read_lock():
+            inside.append(1)
+            # 三个读者必须同时持有读锁才能通过 barrier
+            barrier.wait()
+
+    threads = [threading.Thread(target=reader) for _ in range(3)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    assert len(inside) == 3
+
+
+def test_writer_excludes_readers():
+    lock = ReadWriteLock()
+    events = []
+
+    def writer():
+        with lock.write_lock():
+            events.append("w-start")
+            time.sleep(0.05)
+            events.append("w-end")
+
+    def reader():
+        with lock.read_lock():
+            events.append("r")
+
+    w = threading.Thread(target=writer)
+    w.start()
+    time.sleep(0.01)
+    r = threading.Thread(target=reader)
+    r.start()
+    w.join()
+    r.join()
+    assert events == ["w-start", "w-end", "r"]
+
+
+def test_iter_doc_streams_text_in_blocks(tmp_path):
+    path = tmp_path / "big.txt"
+    paragraphs = [f"第{i}段" + "内容" * 20 + "\n\n" for i in range(200)]
+    path.write_text("".join(paragraphs), encoding="utf-8")
+
+    blocks = list(iter_doc(str(path), block_chars=1000))
+    assert len(blocks) > 1
+    assert "".join(b.page_content for b in blocks) == path.read_text(encoding="utf-8")
+    # 在空行处断开，最多累积到 2 * block_chars
+    assert all(len(b.page_content) < 2000 for b in blocks)
+    assert all(b.metadata == {"source": str(path)} for b in blocks)
+
+
+def test_iter_split_windows_bounds_window_size(tmp_path):
+    path = tmp_path / "big.txt"
+    path.write_text("".join(f"第{i}行内容。\n" for i in range(2000)), encoding="utf-8")
+    windows = list(iter_split_windows(iter_doc(str(path), block_chars=500), 100, 0, window_chars=500))
+    assert len(windows) > 10
+    assert all(sum(len(c.page_content) for c in w) < 1100 for w in windows)
+
+
+class FakeUpload(io.BytesIO):
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+
+
+def test_save_uploaded_file_writes_in_chunks(tmp_path):
+    data = bytes(range(256)) * 1000
+    upload = FakeUpload("a.pdf", data)
+    upload.read(10)
+    path = save_uploaded_file(upload, str(tmp_path / "uploads"), chunk_bytes=4096)
+    with open(path, "rb") as f:
+        assert f.read() == data
+    assert not (tmp_path / "uploads" / "a.pdf.part").exists()
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("检索增强生成") == 6
+    assert estimate_tokens("retrieval augmented") == 5
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from vector_store import NumpyVectorStore, match_where
+
+
+def _vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+def _fill(store, n=200, dim=16):
+    vectors = _vectors(n, dim)
+    ids = [f"c{i}" for i in range(n)]
+    store.upsert(
+        ids, vectors.tolist(), [f"text {i}" for i in range(n)],
+        [{"source": f"s{i % 4}.txt", "page": i % 10} for i in range(n)]
+    )
+    return vectors
+
+
+def _exact_top(vectors, query, k, rows=None):
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normed @ (query / np.linalg.norm(query))
+    order = [int(i) for i in np.argsort(-scores) if rows is None or int(i) in rows]
+    return [f"c{i}" for i in order[:k]]
+
+
+def test_exact_top_k_matches_brute_force(tmp_path):
+    store = NumpyVectorStore(str(tmp_path))
+    vectors = _fill(store)
+    queries = _vectors(5, seed=1)
+    results = store.query_batch(queries.tolist(), k=5)
+    for query, docs in zip(queries, results):
+        assert [d.id for d in docs] == _exact_top(vectors, query, 5)
+    assert docs[0].page_content.startswith("text ") and "source" in docs[0].metadata
+    assert store.similarity_search_by_vector(queries[0].tolist(), k=5) == results[0]
+
+
+def test_int8_quantization_keeps_recall(tmp_path):
+    store = NumpyVectorStore(str(tmp_path), quantization="int8")
+    vectors = _fill(store, n=500)
+    queries = _vectors(20, seed=2)
+    hits = 0
+    for query, docs in zip(queries, store.query_batch(queries.tolist(), k=10)):
+        hits += len({d.id for d in docs} & set(_exact_top(vectors, query, 10)))
+    assert hits / 200 >= 0.9
+
+
+def test_metadata_filters_and_delete_by_source(tmp_path):
+    store = NumpyVectorStore(str(tmp_path))
+    vectors = _fill(store)
+    query = _vectors(1, seed=3)[0]
+    where = {"$and": [{"source": {"$in": ["s1.txt", "s2.txt"]}}, {"page": {"$gte": 5}}]}
+    allowed = {i for i in range(200) if i % 4 in (1, 2) and i % 10 >= 5}
+    docs = store.similarity_search_by_vector(query.tolist(), k=4, filter=where)
+    assert [d.id for d in docs] == _exact_top(vectors, query, 4, rows=allowed)
+
+    store.delete(where={"source": "s1.txt"})
+    assert store.count() == 150
+    assert not store.get(where={"source": "s1.txt"})["ids"]
+    docs = store.similarity_search_by_vector(query.tolist(), k=50)
+    assert all(d.metadata["source"] != "s1.txt" for d in docs)
+
+
+def test_persistence_upsert_replace_and_compact(tmp_path):
+    store = NumpyVectorStore(str(tmp_path), compact_ratio=0.5)
+    vectors = _fill(store, n=40)
+    # 相同 id 再次写入替换旧版本
+    store.upsert(["c0"], [vectors[1].tolist()], ["new text"], [{"source": "s0.txt"}])
+    assert store.count() == 40
+    assert store.get(ids=["c0"])["documents"] == ["new text"]
+    store.close()
+
+    reopened = NumpyVectorStore(str(tmp_path), compact_ratio=0.5)
+    assert reopened.count() == 40
+    top = reopened.similarity_search_by_vector(vectors[1].tolist(), k=2)
+    assert {d.id for d in top} == {"c0", "c1"}
+
+    reopened.delete(ids=[f"c{i}" for i in range(1, 30)])
+    # 失效行超过一半，触发 compact
+    assert reopened._rows == 11 and reopened.count() == 11
+    got = reopened.get(ids=["c0", "c35"])
+    assert dict(zip(got["ids"], got["documents"])) == {"c0": "new text", "c35": "text 35"}
+    reopened.close()
+    assert NumpyVectorStore(str(tmp_path)).count() == 11
+
+
+def test_dimension_mismatch_and_unknown_operator(tmp_path):
+    store = NumpyVectorStore(str(tmp_path))
+    _fill(store, n=4)
+    with pytest.raises(ValueError):
+        store.upsert(["x"], [[1.0, 2.0]], ["x"], [{}])
+    with pytest.raises(ValueError):
+        match_where({"page": 1}, {"page": {"$regex": "1"}})
+
+
+@pytest.mark.parametrize("quantization", ["float32", "int8"])
+def test_selective_filter_scores_only_selected_rows(tmp_path, quantization):
+    store = NumpyVectorStore(str(tmp_path), quantization=quantization)
+    vectors = _fill(store, n=400)
+    queries = _vectors(3, seed=4)
+    where = {"$and": [{"source": "s3.txt"}, {"page": {"$lte": 2}}]}
+    allowed = {i for i in range(400) if i % 4 == 3 and i % 10 <= 2}
+    assert len(allowed) < 400 * store.GATHER_FRACTION
+    for query, docs in zip(queries, store.query_batch(queries.tolist(), k=50, filter=where)):
+        assert {d.id for d in docs} == {f"c{i}" for i in allowed}
+        if quantization == "float32":
+            assert [d.id for d in docs] == _exact_top(vectors, query, 50, rows=allowed)
@@ -1,18 +1,35 @@
 import os
-from typing import List
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, UnstructuredMarkdownLoader
+import re
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Optional
 from langchain_core.documents import Document
 
-def save_uploaded_file(uploaded_file, save_dir: str) -> str:
+# 流式加载时每个窗口的最大字符数 (约等于同时驻留内存的原文大小)
+DEFAULT_WINDOW_CHARS = 200_000
+# 上传文件分块写盘的块大小
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+def save_uploaded_file(uploaded_file, save_dir: str, chunk_bytes: int = UPLOAD_CHUNK_BYTES) -> str:
     """
     保存 Streamlit 上传的文件到指定目录。
+    分块写入临时文件后再原子替换，不会一次性复制整个文件内容，也不会留下写了一半的文件。
     """
     if not os.path.exists(save_dir):
         os.makedirs(save_dir)
     
     file_path = os.path.join(save_dir, uploaded_file.name)
-    with open(file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+    tmp_path = file_path + ".part"
+    uploaded_file.seek(0)
+    try:
+        with open(tmp_path, "wb") as f:
+            shutil.copyfileobj(uploaded_file, f, length=chunk_bytes)
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
     return file_path
 
 def load_doc(file_path: str) -> List[Document]:
@@ -20,6 +37,9 @@ def load_doc(file_path: str) -> List[Document]:
     根据文件扩展名加载文档。
     支持: .pdf, .txt, .md
     """
+    # 文档加载器所在的 langchain_community 导入较慢，用到时才导入
+    from langchain_community.document_loaders import PyPDFLoader, TextLoader, UnstructuredMarkdownLoader
+
     ext = os.path.splitext(file_path)[1].lower()
     
     if ext == ".pdf":
@@ -35,3 +55,131 @@ def load_doc(file_path: str) -> List[Document]:
         return []
         
     return loader.load()
+
+
+def split_documents(
+    docs: List[Document],
+    chunk_size: int,
+    chunk_overlap: int,
+    split_method: str = "recursive"
+) -> List[Document]:
+    """
+    按切分方式切分文档。
+    split_method: "recursive" (递归字符切分) 或 "fixed" (固定大小切分)
+    """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter, CharacterTextSplitter
+
+    if split_method == "fixed":
+        text_splitter = CharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separator="\n"
+        )
+    else:  # 默认 recursive
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=["\n\n", "\n", "。", "！", "？", " ", ""]
+        )
+    return text_splitter.split_documents(docs)
+
+
+def iter_doc(file_path: str, block_chars: Optional[int] = DEFAULT_WINDOW_CHARS) -> Iterator[Document]:
+    """
+    流式加载文档，逐个产出 Document，不把整个文件读入内存。
+    - .pdf: 逐页产出 (PyPDFLoader.lazy_load)，metadata 与 load_doc 相同
+    - .txt / .md: 按行读取，累计约 block_chars 个字符后在空行处断开产出一块，
+      没有空行时最多累积到 2 * block_chars；block_chars 为 None 时整个文件为一块
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".pdf":
+        from langchain_community.document_loaders import PyPDFLoader
+        yield from PyPDFLoader(file_path).lazy_load()
+    elif ext in (".txt", ".md"):
+        lines: List[str] = []
+        size = 0
+        with open(file_path, encoding="utf-8") as f:
+            for line in f:
+                lines.append(line)
+                size += len(line)
+                if block_chars and size >= block_chars and (not line.strip() or size >= 2 * block_chars):
+                    yield Document(page_content="".join(lines), metadata={"source": file_path})
+                    lines, size = [], 0
+        if lines:
+            yield Document(page_content="".join(lines), metadata={"source": file_path})
+
+
+def iter_split_windows(
+    docs: Iterable[Document],
+    chunk_size: int,
+    chunk_overlap: int,
+    split_method: str = "recursive",
+    window_chars: int = DEFAULT_WINDOW_CHARS
+) -> Iterator[List[Document]]:
+    """
+    把流式产出的 Document 攒成不超过约 window_chars 字符的窗口，逐窗口切分并产出 chunks。
+    切分以 Document 为单位进行，所以 PDF 的切分结果与整体加载完全一致。
+    """
+    window: List[Document] = []
+    size = 0
+    for doc in docs:
+        window.append(doc)
+        size += len(doc.page_content)
+        if size >= window_chars:
+            yield split_documents(window, chunk_size, chunk_overlap, split_method)
+            window, size = [], 0
+    if window:
+        yield split_documents(window, chunk_size, chunk_overlap, split_method)
+
+_CJK_CHAR = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    不依赖 tokenizer 的 token 数估算: 中文字符 / 全角标点按 1 个 token，其余按 4 个字符 1 个 token
+    """
+    cjk = len(_CJK_CHAR.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+class ReadWriteLock:
+    """
+    读写锁 (写优先): 多个读者可并发，写者独占。
+    有写者等待时新读者会被挡住，避免持续的查询把入库饿死。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read_lock(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write_lock(self):
+        with self._cond:
+            self._writers_waiting += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
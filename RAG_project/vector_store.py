@@ -0,0 +1,444 @@
+"""
+可插拔的向量库后端。RAGManager 通过 create_vector_store(backend, ...) 选择:
+
+- "chroma": chroma_store.ChromaVectorStore，Chroma (SQLite + HNSW)，近似最近邻，适合大规模知识库
+- "numpy" / "numpy-int8": NumpyVectorStore，进程内精确检索。归一化后的 embedding 存成连续的
+  float32 (或按行量化的 int8) 矩阵，内存映射自磁盘，top-k 用一次矩阵乘法求出；
+  启动时不需要加载 HNSW 图，适合中小规模知识库
+
+两者提供相同的接口: upsert / count / get / delete / similarity_search_by_vector / query_batch / close，
+get / delete / 检索都支持 Chroma 风格的 metadata 过滤 (where)。
+chromadb 导入较慢 (约数百毫秒)，只在选用 "chroma" 后端时才导入。
+"""
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+BACKENDS = ("chroma", "numpy", "numpy-int8")
+
+Where = Dict[str, Any]
+
+
+def match_where(metadata: Dict[str, Any], where: Optional[Where]) -> bool:
+    """
+    Chroma where 语法的子集: 字段相等、$eq / $ne / $gt / $gte / $lt / $lte / $in / $nin，以及 $and / $or
+    """
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(match_where(metadata, c) for c in condition):
+                return False
+        elif key == "$or":
+            if not any(match_where(metadata, c) for c in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, operand in condition.items():
+                if not _compare(value, op, operand):
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def _compare(value, op: str, operand) -> bool:
+    if op == "$eq":
+        return value == operand
+    if op == "$ne":
+        return value != operand
+    if op == "$in":
+        return value in operand
+    if op == "$nin":
+        return value not in operand
+    if value is None:
+        return False
+    if op == "$gt":
+        return value > operand
+    if op == "$gte":
+        return value >= operand
+    if op == "$lt":
+        return value < operand
+    if op == "$lte":
+        return value <= operand
+    raise ValueError(f"unsupported where operator: {op}")
+
+
+class NumpyVectorStore:
+    """
+    进程内精确向量检索 (余弦相似度)。
+
+    - 向量按行追加到 vectors.<quantization> 文件，查询时以 np.memmap 映射，不整体读入内存
+    - int8 量化: 每行按 max(|v|) / 127 缩放，scales.f32 存每行的缩放系数，内存约为 float32 的 1/4
+    - id / 原文 / metadata 存在 records.sqlite3 中，id 与 metadata 常驻内存用于过滤
+    - 删除只打标记，失效行超过 compact_ratio 时重写矩阵文件
+    - 写操作由调用方 (RAGManager 的写锁) 串行化，这里另有一把锁保护内部状态
+    """
+
+    DIR_NAME = "numpy_store"
+    BLOCK_ROWS = 65536
+    # 过滤后剩余行数占比低于该值时只取出这些行计算，不再扫描整个矩阵
+    GATHER_FRACTION = 0.125
+    MASK_CACHE_SIZE = 64
+
+    def __init__(
+        self,
+        persist_directory: str,
+        embedding_function=None,
+        quantization: str = "float32",
+        compact_ratio: float = 0.5
+    ):
+        if quantization not in ("float32", "int8"):
+            raise ValueError(f"unsupported quantization: {quantization}")
+        self.embedding_function = embedding_function
+        self.quantization = quantization
+        self.compact_ratio = compact_ratio
+        self.path = os.path.join(persist_directory, self.DIR_NAME)
+        os.makedirs(self.path, exist_ok=True)
+        self._dtype = np.int8 if quantization == "int8" else np.float32
+        self._matrix_path = os.path.join(self.path, f"vectors.{quantization}")
+        self._scales_path = os.path.join(self.path, "scales.f32")
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(self.path, "records.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS records (
+                row INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                document TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+        self._load()
+
+    # ---------- 持久化 ----------
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value):
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, str(value))
+        )
+
+    def _load(self):
+        dim = self._meta("dim")
+        self.dim: Optional[int] = int(dim) if dim else None
+        rows = int(self._meta("rows") or 0)
+        if self.dim and os.path.exists(self._matrix_path):
+            # 上次写入中途失败时矩阵文件可能比记录短，以实际写完的行为准
+            rows = min(rows, os.path.getsize(self._matrix_path) // (self.dim * np.dtype(self._dtype).itemsize))
+        else:
+            rows = 0
+        self._rows = rows
+        self._ids: List[Optional[str]] = [None] * rows
+        self._metadatas: List[Optional[Dict]] = [None] * rows
+        self._alive = np.zeros(rows, dtype=bool)
+        self._row_of: Dict[str, int] = {}
+        with self._conn:
+            self._conn.execute("DELETE FROM records WHERE row >= ?", (rows,))
+        for row, chunk_id, metadata in self._conn.execute("SELECT row, id, metadata FROM records"):
+            self._ids[row] = chunk_id
+            self._metadatas[row] = json.loads(metadata)
+            self._alive[row] = True
+            self._row_of[chunk_id] = row
+        self._mask_cache: Dict[str, np.ndarray] = {}
+        self._map()
+
+    def _map(self):
+        self._matrix = None
+        self._scales = None
+        if not self._rows:
+            return
+        self._matrix = np.memmap(self._matrix_path, dtype=self._dtype, mode="r", shape=(self._rows, self.dim))
+        if self.quantization == "int8":
+            self._scales = np.memmap(self._scales_path, dtype=np.float32, mode="r", shape=(self._rows,))
+
+    def _unmap(self):
+        # Windows 上被映射的文件不能替换或删除，写文件前先释放映射
+        self._matrix = None
+        self._scales = None
+
+    def close(self):
+        with self._lock:
+            self._unmap()
+            self._conn.close()
+
+    def _encode(self, embeddings) -> tuple:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2:
+            vectors = vectors.reshape(len(vectors), -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1.0, norms)
+        if self.quantization != "int8":
+            return vectors, None
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    # ---------- 写入 ----------
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str], metadatas: List[Dict]):
+        if not ids:
+            return
+        # 同一批内重复的 id 以最后一次为准
+        last = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        order = sorted(last.values())
+        ids = [ids[i] for i in order]
+        documents = [documents[i] for i in order]
+        metadatas = [metadatas[i] or {} for i in order]
+        vectors, scales = self._encode([embeddings[i] for i in order])
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with self._conn:
+                    self._set_meta("dim", self.dim)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"embedding dimension {vectors.shape[1]} != store dimension {self.dim}")
+
+            self._unmap()
+            start = self._rows
+            # 截掉上次中途失败时多写的部分，再追加
+            with open(self._matrix_path, "ab") as f:
+                f.truncate(start * self.dim * np.dtype(self._dtype).itemsize)
+                f.write(vectors.tobytes())
+            if scales is not None:
+                with open(self._scales_path, "ab") as f:
+                    f.truncate(start * 4)
+                    f.write(scales.tobytes())
+            replaced = [self._row_of[i] for i in ids if i in self._row_of]
+            with self._conn:
+                self._delete_rows_sql(replaced)
+                self._conn.executemany(
+                    "INSERT INTO records (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                    [
+                        (start + n, chunk_id, text, json.dumps(meta, ensure_ascii=False))
+                        for n, (chunk_id, text, meta) in enumerate(zip(ids, documents, metadatas))
+                    ]
+                )
+                self._set_meta("rows", start + len(ids))
+
+            self._alive[replaced] = False
+            self._rows = start + len(ids)
+            self._ids.extend(ids)
+            self._metadatas.extend(metadatas)
+            self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+            for n, chunk_id in enumerate(ids):
+                self._row_of[chunk_id] = start + n
+            self._mask_cache.clear()
+            self._map()
+
+    def _delete_rows_sql(self, rows: List[int]):
+        for start in range(0, len(rows), 500):
+            batch = rows[start:start + 500]
+            self._conn.execute(f"DELETE FROM records WHERE row IN ({','.join('?' * len(batch))})", batch)
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Where] = None):
+        if ids is None and not where:
+            return
+        with self._lock:
+            if ids is not None:
+                rows = [self._row_of[i] for i in ids if i in self._row_of]
+            else:
+                rows = [int(r) for r in np.flatnonzero(self._mask(where))]
+            if not rows:
+                return
+            with self._conn:
+                self._delete_rows_sql(rows)
+            self._alive[rows] = False
+            for row in rows:
+                del self._row_of[self._ids[row]]
+                self._ids[row] = None
+                self._metadatas[row] = None
+            self._mask_cache.clear()
+            if self._rows - len(self._row_of) > self.compact_ratio * self._rows:
+                self.compact()
+
+    def compact(self):
+        """
+        重写矩阵文件，去掉已删除的行
+        """
+        with self._lock:
+            keep = np.flatnonzero(self._alive)
+            matrix = np.array(self._matrix[keep]) if self._rows else np.zeros((0, self.dim or 0), self._dtype)
+            scales = np.array(self._scales[keep]) if self._scales is not None else None
+            self._unmap()
+            tmp = self._matrix_path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(matrix.tobytes())
+            if scales is not None:
+                with open(self._scales_path + ".tmp", "wb") as f:
+                    f.write(scales.tobytes())
+            with self._conn:
+                # 先把行号移到负数区间再改成新行号，避免与未移动的行冲突
+                self._conn.execute("UPDATE records SET row = -row - 1")
+                self._conn.executemany(
+                    "UPDATE records SET row = ? WHERE row = ?", [(new, -int(old) - 1) for new, old in enumerate(keep)]
+                )
+                self._set_meta("rows", len(keep))
+                os.replace(tmp, self._matrix_path)
+                if scales is not None:
+                    os.replace(self._scales_path + ".tmp", self._scales_path)
+            self._load()
+
+    def clear(self):
+        with self._lock:
+            self._unmap()
+            with self._conn:
+                self._conn.execute("DELETE FROM records")
+                self._conn.execute("DELETE FROM meta")
+            for path in (self._matrix_path, self._scales_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._load()
+
+    # ---------- 读取 ----------
+
+    def count(self) -> int:
+        return len(self._row_of)
+
+    def _mask(self, where: Optional[Where]) -> np.ndarray:
+        if not where:
+            return self._alive
+        key = json.dumps(where, sort_keys=True, ensure_ascii=False)
+        mask = self._mask_cache.get(key)
+        if mask is None:
+            mask = self._alive.copy()
+            for row in np.flatnonzero(mask):
+                if not match_where(self._metadatas[row], where):
+                    mask[row] = False
+            if len(self._mask_cache) >= self.MASK_CACHE_SIZE:
+                # 过滤条件很多时丢弃最早的
+                self._mask_cache.pop(next(iter(self._mask_cache)))
+            self._mask_cache[key] = mask
+        return mask
+
+    def _documents(self, rows: Sequence[int]) -> Dict[int, str]:
+        texts: Dict[int, str] = {}
+        rows = [int(r) for r in rows]
+        for start in range(0, len(rows), 500):
+            batch = rows[start:start + 500]
+            marks = ",".join("?" * len(batch))
+            for row, text in self._conn.execute(f"SELECT row, document FROM records WHERE row IN ({marks})", batch):
+                texts[row] = text
+        return texts
+
+    def get(
+        self,
+        ids: Optional[Sequence[str]] = None,
+        where: Optional[Where] = None,
+        include: Sequence[str] = ("metadatas", "documents")
+    ) -> Dict[str, List]:
+        """
+        与 Chroma.get 相同的返回格式 {"ids", "metadatas", "documents"}，按写入顺序
+        """
+        with self._lock:
+            if ids is not None:
+                rows = sorted(self._row_of[i] for i in ids if i in self._row_of)
+                if where:
+                    rows = [r for r in rows if match_where(self._metadatas[r], where)]
+            else:
+                rows = [int(r) for r in np.flatnonzero(self._mask(where))]
+            result: Dict[str, List] = {"ids": [self._ids[r] for r in rows]}
+            if "metadatas" in include:
+                result["metadatas"] = [self._metadatas[r] for r in rows]
+            if "documents" in include:
+                texts = self._documents(rows)
+                result["documents"] = [texts[r] for r in rows]
+            return result
+
+    def query_batch(
+        self, query_embeddings: List[List[float]], k: int, filter: Optional[Where] = None
+    ) -> List[List[Document]]:
+        """
+        多个查询向量的精确 top-k (余弦相似度)。按 BLOCK_ROWS 行分块计算矩阵乘法，
+        每块只保留各查询的前 k 个候选，内存占用与知识库规模无关。
+        filter 在打分前生效；选择性高 (剩余行少于 GATHER_FRACTION) 时只取出满足条件的行计算。
+        """
+        if not query_embeddings:
+            return []
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1.0, norms)
+        with self._lock:
+            matrix, scales, mask = self._matrix, self._scales, self._mask(filter)
+            metadatas, ids = self._metadatas, self._ids
+            if matrix is None or k <= 0 or not mask.any():
+                return [[] for _ in query_embeddings]
+            rows = len(mask)
+            if filter and mask.sum() < rows * self.GATHER_FRACTION:
+                selected = np.flatnonzero(mask)
+                best_rows, best_scores = self._score_rows(matrix, scales, selected, queries, k)
+            else:
+                best_rows = np.empty((len(queries), 0), dtype=np.int64)
+                best_scores = np.empty((len(queries), 0), dtype=np.float32)
+                for start in range(0, rows, self.BLOCK_ROWS):
+                    end = min(start + self.BLOCK_ROWS, rows)
+                    block_mask = mask[start:end]
+                    if not block_mask.any():
+                        continue
+                    block = matrix[start:end]
+                    if scales is not None:
+                        scores = (block.astype(np.float32) @ queries.T) * scales[start:end, None]
+                    else:
+                        scores = block @ queries.T
+                    scores = scores.T  # (queries, block_rows)
+                    scores[:, ~block_mask] = -np.inf
+                    take = min(k, end - start)
+                    top = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+                    best_rows = np.concatenate([best_rows, top + start], axis=1)
+                    best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+
+            results: List[List[int]] = []
+            for q in range(len(queries)):
+                order = np.argsort(-best_scores[q], kind="stable")[:k]
+                results.append([int(best_rows[q, i]) for i in order if np.isfinite(best_scores[q, i])])
+            texts = self._documents({r for rs in results for r in rs})
+            return [
+                [Document(id=ids[r], page_content=texts[r], metadata=metadatas[r]) for r in rs]
+                for rs in results
+            ]
+
+    @staticmethod
+    def _score_rows(matrix, scales, selected: np.ndarray, queries: np.ndarray, k: int):
+        """
+        只对 selected 中的行打分，返回 (行号, 得分)，形状均为 (queries, min(k, len(selected)))
+        """
+        block = matrix[selected]
+        if scales is not None:
+            scores = (block.astype(np.float32) @ queries.T) * scales[selected, None]
+        else:
+            scores = block @ queries.T
+        scores = scores.T
+        take = min(k, len(selected))
+        top = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+        return selected[top], np.take_along_axis(scores, top, axis=1)
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[Where] = None, **kwargs
+    ) -> List[Document]:
+        return self.query_batch([embedding], k, filter)[0]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Where] = None, **kwargs) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k, filter)
+
+
+def create_vector_store(backend: str, persist_directory: str, embedding_function):
+    if backend == "chroma":
+        from chroma_store import ChromaVectorStore
+        return ChromaVectorStore(persist_directory=persist_directory, embedding_function=embedding_function)
+    if backend in ("numpy", "numpy-int8"):
+        quantization = "int8" if backend == "numpy-int8" else "float32"
+        return NumpyVectorStore(persist_directory, embedding_function, quantization=quantization)
+    raise ValueError(f"unknown vector backend: {backend} (expected one of {BACKENDS})")